@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import sys
 from pathlib import Path
 
 import sentry_sdk
@@ -42,6 +43,7 @@ class Base(Configuration):
     MIDDLEWARE = [
         "django.middleware.security.SecurityMiddleware",
         "whitenoise.middleware.WhiteNoiseMiddleware",
+        "tournament.timing.RequestTimingMiddleware",
         "django.contrib.sessions.middleware.SessionMiddleware",
         "django.middleware.common.CommonMiddleware",
         "django.middleware.csrf.CsrfViewMiddleware",
@@ -130,6 +132,8 @@ class Base(Configuration):
 
     AWS_STORAGE_BUCKET_NAME = "halite-tournament-storage"
     AWS_S3_REGION_NAME = "us-east-1"
+    # spool S3 reads (queued uploads) to disk past 1MB instead of memory
+    AWS_S3_MAX_MEMORY_SIZE = 1024 * 1024
 
     STORAGES = {
         "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
@@ -138,12 +142,71 @@ class Base(Configuration):
         },
     }
 
+    # "binary" stores replays in the frame-delta format (see tournament.replays)
+    REPLAY_FORMAT = "binary"
+    LEADERBOARD_CACHE_TIMEOUT = 300
+    # seconds clients may cache rating charts for
+    RATING_HISTORY_MAX_AGE = 60
+    # seconds clients may cache head-to-head records for
+    HEAD_TO_HEAD_MAX_AGE = 60
+    # seconds image digests are cached for, and image tags found missing
+    DOCKER_DIGEST_CACHE_TIMEOUT = 10 * 60
+    DOCKER_DIGEST_MISSING_TIMEOUT = 60
+
+    # local directory Match.replay_arrays caches decoded replays in, or None.
+    # The cache has no size limit (cachereplays --clear empties it), so it is
+    # only enabled where DJANGO_REPLAY_CACHE_DIR points at a persistent volume
+    REPLAY_CACHE_DIR = values.Value(None, environ_prefix="DJANGO")
+    # codec Match.replay is stored with (see tournament.codecs)
+    REPLAY_CODEC = "gzip"
+    # extra precompressed copies of each replay, served by content encoding
+    REPLAY_VARIANTS = ["br"]
+    REPLAY_CODEC_LEVELS = {"gzip": 9, "br": 9, "zstd": 19}
+    # id of the trained dictionary the zstd codec compresses with, if any
+    REPLAY_ZSTD_DICTIONARY = None
+
     CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap3"
 
     CRISPY_TEMPLATE_PACK = "bootstrap3"
 
     LOGIN_URL = "/login/"
 
+    # largest difference in mu or sigma allowed between tournament.rating and
+    # the mpmath trueskill backend
+    RATING_ENGINE_TOLERANCE = 1e-6
+
+    # matches the schedulematches command keeps running at once
+    MATCH_CONCURRENCY = 4
+    # seconds after which a match that never reported results stops counting
+    # as running
+    MATCH_TIMEOUT = 60 * 60
+    # queued workflow runs at which the scheduler waits for runners to free up
+    MATCH_MAX_QUEUED_RUNS = 2
+    # where matches run, see tournament.runner.BACKENDS
+    MATCH_RUNNER_BACKEND = "github"
+    # the local backend's Halite environment (from the halite-matches
+    # releases), the docker run options of its bots, and how many matches it
+    # runs at once. LOCAL_RUNNER_COMMAND replaces the environment, see
+    # tournament.runner.LocalBackend
+    LOCAL_RUNNER_HALITE = "halite"
+    LOCAL_RUNNER_DOCKER_ARGS = ["--network", "none", "--memory", "512m", "--cpus", "1"]
+    LOCAL_RUNNER_COMMAND = None
+    LOCAL_RUNNER_WORKERS = 4
+    # GitHub requests per rate limit window kept back from match dispatches
+    GITHUB_RATE_LIMIT_RESERVE = 500
+    # seconds a started match waits for its workflow_run webhook before the
+    # scheduler looks its run up instead
+    MATCH_RUN_WEBHOOK_GRACE = 2 * 60
+    # seconds before the matchmaking index reloads bots changed by other processes
+    MATCHMAKING_INDEX_TTL = 60
+    # seconds a request takes before it is logged as slow, and how many of its
+    # most repeated statements are logged with it (see tournament.timing)
+    SLOW_REQUEST_THRESHOLD = 1.0
+    SLOW_REQUEST_STATEMENTS = 5
+    # seconds between each process saving its metrics (see tournament.metrics),
+    # or None to only save them when they are served, as in the tests
+    METRICS_FLUSH_INTERVAL = None if sys.argv[1:2] == ["test"] else 60
+
     MARKDOWN_DEUX_STYLES = {
         "default": {
             "extras": {
@@ -172,6 +235,10 @@ class Secrets(Base):
 
     GITHUB_WORKFLOW_TOKEN = values.SecretValue()
     GITHUB_READ_PACKAGES_TOKEN = values.SecretValue()
+    # the workflow_run webhook refuses every request while this is unset
+    GITHUB_WEBHOOK_SECRET = values.Value(None, environ_prefix="DJANGO")
+    # the metrics endpoint refuses every request while this is unset
+    METRICS_TOKEN = values.Value(None, environ_prefix="DJANGO")
 
     DOCKER_PUBLIC_READ_USERNAME = values.SecretValue()
     DOCKER_PUBLIC_READ_TOKEN = values.SecretValue()
@@ -1,16 +1,32 @@
+import os
+
 from django import forms
 from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.forms import UsernameField
 from django.core.exceptions import ValidationError
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 
 from .exceptions import HaliteError
-from .models import Bot, Match, MatchResult, User
+from .forms import BotForm
+from .models import (
+    Bot,
+    BotActivity,
+    HeadToHead,
+    Match,
+    MatchResult,
+    MatchStats,
+    MatchUpload,
+    RatingCheckpoint,
+    User,
+)
 from .runner import get_players_for_seed, start_match
 
 
 class BotAdmin(admin.ModelAdmin):
+    form = BotForm
+    fields = ["user", "mu", "sigma", "enabled", "docker_image", "refresh_digest"]
     list_display = ["__str__", "docker_image", "enabled"]
 
     actions = ["run_match", "run_match_with_seed_player"]
@@ -28,7 +44,7 @@ class BotAdmin(admin.ModelAdmin):
         self.message_user(
             request,
             mark_safe(
-                f"""Match started <a href="https://github.com/nmalaguti/halite-matches/actions/runs/{match.run_id}">{match.uuid}</a>"""
+                f"""Match started <a href="https://github.com/nmalaguti/halite-matches/actions/workflows/match.yml">{match.uuid}</a>"""
             ),
             level=messages.SUCCESS,
         )
@@ -53,7 +69,7 @@ class BotAdmin(admin.ModelAdmin):
         self.message_user(
             request,
             mark_safe(
-                f"""Match started <a href="https://github.com/nmalaguti/halite-matches/actions/runs/{match.run_id}">{match.uuid}</a>"""
+                f"""Match started <a href="https://github.com/nmalaguti/halite-matches/actions/workflows/match.yml">{match.uuid}</a>"""
             ),
             level=messages.SUCCESS,
         )
@@ -153,11 +169,14 @@ class MatchUploadForm(forms.ModelForm):
     def clean(self):
         super().clean()
 
-        if not self.cleaned_data["match_file"].name.endswith(".tar.xz"):
+        match_file = self.cleaned_data["match_file"]
+        if not match_file.name.endswith(".tar.xz"):
             self.add_error("match_file", "Match file must be a .tar.xz file")
         else:
             try:
-                self.instance = Match.create_from_tar(self.cleaned_data["match_file"])
+                self.instance = Match.create_from_tar(
+                    match_file, os.path.basename(match_file.name)[:-7]
+                )
             except Exception as e:
                 self.add_error("match_file", e)
 
@@ -192,7 +211,85 @@ class MatchResultAdmin(admin.ModelAdmin):
         return False
 
 
+class MatchUploadAdmin(admin.ModelAdmin):
+    list_display = ["uuid", "status", "attempts", "available_at", "match"]
+    list_filter = ["status"]
+    readonly_fields = ["match"]
+
+    actions = ["retry"]
+
+    @admin.action(description="Retry selected uploads")
+    def retry(self, request, queryset):
+        count = queryset.filter(status=MatchUpload.Status.FAILED).update(
+            status=MatchUpload.Status.PENDING,
+            attempts=0,
+            available_at=timezone.now(),
+            locked_at=None,
+        )
+        self.message_user(request, f"Queued {count} uploads.", level=messages.SUCCESS)
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class RatingCheckpointAdmin(admin.ModelAdmin):
+    list_display = ["date", "match", "match_count", "created_at"]
+    exclude = ["ratings"]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class MatchStatsAdmin(admin.ModelAdmin):
+    list_display = [
+        "match",
+        "bot",
+        "peak_territory",
+        "production_captured",
+        "first_contact_frame",
+        "overkill_damage",
+    ]
+    list_select_related = ["match", "bot__user"]
+    exclude = ["territory_curve", "strength_curve"]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class BotActivityAdmin(admin.ModelAdmin):
+    list_display = ["bot", "docker_image", "match_count", "last_match_date"]
+    list_select_related = ["bot__user"]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class HeadToHeadAdmin(admin.ModelAdmin):
+    list_display = ["bot", "opponent", "games", "wins", "docker_image"]
+    list_select_related = ["bot__user", "opponent__user"]
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 admin.site.register(User, UserAdmin)
 admin.site.register(Bot, BotAdmin)
 admin.site.register(Match, MatchAdmin)
 admin.site.register(MatchResult, MatchResultAdmin)
+admin.site.register(MatchStats, MatchStatsAdmin)
+admin.site.register(BotActivity, BotActivityAdmin)
+admin.site.register(HeadToHead, HeadToHeadAdmin)
+admin.site.register(MatchUpload, MatchUploadAdmin)
+admin.site.register(RatingCheckpoint, RatingCheckpointAdmin)
@@ -14,6 +14,8 @@ from tenacity import (
     wait_exponential,
 )
 
+from tournament import metrics
+
 # https://janzert.com/halite/rating-report/
 # https://web.archive.org/web/20210126111322/http://2016.forums.halite.io/t/the-unofficial-better-final-rankings/1000.html
 # https://github.com/Janzert/halite_ranking/tree/master
@@ -26,11 +28,17 @@ logger = logging.getLogger(__name__)
 
 @cache
 def monkey_patch():
+    log_retry = before_sleep_log(logger, logging.INFO)
+
+    def before_sleep(retry_state):
+        metrics.DB_CONNECTION_RETRIES.inc()
+        log_retry(retry_state)
+
     BaseDatabaseWrapper.ensure_connection = retry(
         retry=retry_if_exception_type(OperationalError),
         stop=stop_after_attempt(6),
         wait=wait_exponential(min=1, max=10),
-        before_sleep=before_sleep_log(logger, logging.INFO),
+        before_sleep=before_sleep,
         reraise=True,
     )(BaseDatabaseWrapper.ensure_connection)
 
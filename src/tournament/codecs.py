@@ -0,0 +1,224 @@
+"""
+Replay codecs.
+
+A codec turns a stream of replay JSON into a stored file and back. The codec
+of a stored replay is picked by its file extension, so matches recorded with
+different ``REPLAY_CODEC`` settings can live side by side. Codecs with a
+``content_encoding`` can be handed to browsers as-is.
+"""
+import gzip
+import io
+import os
+from functools import cache
+from typing import BinaryIO, Optional
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+import brotli
+import zstandard
+
+ZSTD_DICTIONARY_DIR = "replay-dictionaries"
+ZSTD_MAX_FRAME_HEADER_SIZE = 18
+
+
+class _StreamWriter(io.RawIOBase):
+    """File-like writer around an incremental compressor."""
+
+    def __init__(self, destination: BinaryIO, process, finish):
+        self.destination = destination
+        self._process = process
+        self._finish = finish
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.destination.write(self._process(bytes(data)))
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.destination.write(self._finish())
+        super().close()
+
+
+class _StreamReader(io.RawIOBase):
+    """File-like reader around an incremental decompressor."""
+
+    def __init__(self, source: BinaryIO, process, chunk_size=64 * 1024):
+        self.source = source
+        self._process = process
+        self._chunk_size = chunk_size
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            chunk = self.source.read(self._chunk_size)
+            if not chunk:
+                return 0
+            self._buffer = self._process(chunk)
+
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+class ReplayCodec:
+    name: str
+    extension: str
+    # the HTTP Content-Encoding browsers can decode this codec with, if any
+    content_encoding: Optional[str] = None
+    default_level: int
+
+    def __init__(self, level: Optional[int] = None):
+        if level is None:
+            level = settings.REPLAY_CODEC_LEVELS.get(self.name, self.default_level)
+        self.level = level
+
+    def open_writer(self, destination: BinaryIO) -> BinaryIO:
+        """Returns a writer that compresses into ``destination``. Closing the
+        writer finishes the stream but leaves ``destination`` open."""
+        raise NotImplementedError
+
+    def open_reader(self, source: BinaryIO) -> BinaryIO:
+        raise NotImplementedError
+
+    def compress(self, data: bytes) -> bytes:
+        destination = io.BytesIO()
+        with self.open_writer(destination) as writer:
+            writer.write(data)
+        return destination.getvalue()
+
+    def decompress(self, data: bytes) -> bytes:
+        with self.open_reader(io.BytesIO(data)) as reader:
+            return reader.read()
+
+
+class GzipCodec(ReplayCodec):
+    name = "gzip"
+    extension = ".gz"
+    content_encoding = "gzip"
+    default_level = 9
+
+    def open_writer(self, destination):
+        return gzip.GzipFile(
+            filename="", mode="wb", fileobj=destination, compresslevel=self.level
+        )
+
+    def open_reader(self, source):
+        return gzip.GzipFile(mode="rb", fileobj=source)
+
+
+class BrotliCodec(ReplayCodec):
+    name = "br"
+    extension = ".br"
+    content_encoding = "br"
+    default_level = 9
+
+    def open_writer(self, destination):
+        compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=self.level)
+        return _StreamWriter(destination, compressor.process, compressor.finish)
+
+    def open_reader(self, source):
+        return io.BufferedReader(_StreamReader(source, brotli.Decompressor().process))
+
+
+class ZstdCodec(ReplayCodec):
+    """
+    Zstandard, optionally with a dictionary trained on past replays (see the
+    trainreplaydict command). Frames record the id of their dictionary, so
+    old replays stay readable after a new dictionary is trained.
+    """
+
+    name = "zstd"
+    extension = ".zst"
+    default_level = 19
+
+    def __init__(self, level: Optional[int] = None, dictionary_id=None):
+        super().__init__(level)
+        if dictionary_id is None:
+            dictionary_id = settings.REPLAY_ZSTD_DICTIONARY
+        self.dictionary_id = dictionary_id
+
+    def open_writer(self, destination):
+        kwargs = {}
+        if self.dictionary_id:
+            kwargs["dict_data"] = load_zstd_dictionary(self.dictionary_id)
+        return zstandard.ZstdCompressor(level=self.level, **kwargs).stream_writer(
+            destination, closefd=False
+        )
+
+    def open_reader(self, source):
+        header = source.read(ZSTD_MAX_FRAME_HEADER_SIZE)
+        dictionary_id = zstandard.get_frame_parameters(header).dict_id
+        source.seek(0)
+
+        kwargs = {}
+        if dictionary_id:
+            kwargs["dict_data"] = load_zstd_dictionary(dictionary_id)
+        return io.BufferedReader(
+            zstandard.ZstdDecompressor(**kwargs).stream_reader(source, closefd=False)
+        )
+
+
+CODECS = {codec.name: codec for codec in [GzipCodec, BrotliCodec, ZstdCodec]}
+
+# smallest first, for picking what to send a browser
+CONTENT_ENCODING_PREFERENCE = ["br", "gzip"]
+
+
+def get_codec(name: str, level: Optional[int] = None) -> ReplayCodec:
+    return CODECS[name](level)
+
+
+def codec_for_file(name: str) -> ReplayCodec:
+    _, extension = os.path.splitext(name)
+    for codec in CODECS.values():
+        if codec.extension == extension:
+            return codec()
+    raise ValueError(f"No replay codec for {name}")
+
+
+def zstd_dictionary_name(dictionary_id: int) -> str:
+    return os.path.join(ZSTD_DICTIONARY_DIR, f"{dictionary_id}.zdict")
+
+
+@cache
+def load_zstd_dictionary(dictionary_id: int) -> zstandard.ZstdCompressionDict:
+    with default_storage.open(zstd_dictionary_name(dictionary_id), "rb") as f:
+        return zstandard.ZstdCompressionDict(f.read())
+
+
+def parse_accept_encoding(header: str) -> dict[str, float]:
+    encodings = {}
+    for part in header.split(","):
+        encoding, _, params = part.strip().partition(";")
+        if not encoding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[encoding.strip().lower()] = quality
+    return encodings
+
+
+def best_encoding(accept_encoding: str, available) -> Optional[str]:
+    """
+    Picks the encoding to serve from ``available`` (content encodings in
+    order of preference) given a request's Accept-Encoding header.
+    """
+    accepted = parse_accept_encoding(accept_encoding)
+    for encoding in available:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
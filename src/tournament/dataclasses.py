@@ -1,5 +1,8 @@
-from dataclasses import dataclass
-from typing import List, Optional
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+
+from django.core.files import File
+from django.core.files.storage import default_storage
 
 from mashumaro import DataClassDictMixin
 
@@ -23,3 +26,47 @@ class MatchDataClass(DataClassDictMixin):
     height: int
     match_results: List[MatchResultDataClass]
     workflow_run_id: int
+
+
+@dataclass
+class ExtractedMatch:
+    match: MatchDataClass
+    # files, or their names in default storage once stored
+    replay: Union[File, str]
+    replay_variants: Dict[str, Union[File, str]]
+    error_logs: Dict[str, Union[File, str]]
+    # per-player statistics by bot name, see tournament.stats
+    stats: Dict[str, dict] = field(default_factory=dict)
+
+    def files(self) -> List[Union[File, str]]:
+        return [self.replay, *self.replay_variants.values(), *self.error_logs.values()]
+
+    def store(self):
+        """Saves the files to default storage ahead of recording the match."""
+
+        def save(f: Union[File, str]) -> str:
+            if isinstance(f, str):
+                return f
+            try:
+                return default_storage.save(f.name, f)
+            finally:
+                f.close()
+
+        self.replay = save(self.replay)
+        self.replay_variants = {
+            name: save(f) for name, f in self.replay_variants.items()
+        }
+        self.error_logs = {bot_name: save(f) for bot_name, f in self.error_logs.items()}
+
+    def close(self):
+        for f in self.files():
+            if not isinstance(f, str):
+                f.close()
+
+    def discard(self):
+        """Closes the files, deleting those already stored."""
+        for f in self.files():
+            if isinstance(f, str):
+                default_storage.delete(f)
+            else:
+                f.close()
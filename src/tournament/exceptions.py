@@ -10,9 +10,33 @@ class WorkflowRunNotFoundError(HaliteError):
     pass
 
 
+class GithubRateLimitError(HaliteError):
+    pass
+
+
 class TooManyPlayersError(HaliteError):
     pass
 
 
 class TooFewPlayersError(HaliteError):
     pass
+
+
+class RatingToleranceError(HaliteError):
+    pass
+
+
+class ReplayFormatError(HaliteError):
+    pass
+
+
+class ImageNotFoundError(HaliteError):
+    pass
+
+
+class RegistryAccessError(HaliteError):
+    pass
+
+
+class RegistryUnavailableError(HaliteError):
+    pass
@@ -0,0 +1,26 @@
+from django import forms
+
+from .models import Bot
+
+
+class BotForm(forms.ModelForm):
+    """A bot, with the choice of looking its image's tag up again."""
+
+    refresh_digest = forms.BooleanField(
+        required=False,
+        label="Look the tag up again",
+        help_text=(
+            "Tags are looked up in the registry at most every few minutes. "
+            "Check this if you just pushed a new image to the same tag."
+        ),
+    )
+
+    class Meta:
+        model = Bot
+        fields = ["docker_image"]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # read by Bot.clean, which runs after this
+        self.instance.refresh_digest = cleaned_data.get("refresh_digest", False)
+        return cleaned_data
@@ -0,0 +1,145 @@
+"""
+Process-wide access to the match workflow on GitHub.
+
+PyGithub clients hold one HTTP session each and can't be shared between
+threads, so each thread keeps a client and a handle on the workflow for as
+long as it lives. Run listings are conditional requests, which GitHub
+answers with 304 and doesn't count against the rate limit when nothing
+changed. Every response updates ``governor``, which decides how many
+matches can be dispatched without running out of requests.
+"""
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from django.conf import settings
+
+from github import Auth, Github, Workflow
+from github.Requester import Requester
+from github.WorkflowRun import WorkflowRun
+
+from tournament import metrics
+
+logger = logging.getLogger(__name__)
+
+MATCH_REPOSITORY = "nmalaguti/halite-matches"
+MATCH_WORKFLOW = "match.yml"
+RUNS_PER_PAGE = 100
+
+
+class RateLimitGovernor:
+    """
+    The token's remaining core rate limit, as last reported by GitHub.
+    Holds back ``reserve`` requests for everything other than dispatching
+    matches, such as looking up runs and serving the site.
+    """
+
+    def __init__(self, reserve: int):
+        self.reserve = reserve
+        self.remaining: Optional[int] = None
+        self.limit: Optional[int] = None
+        self.reset_at = 0
+        self._lock = threading.Lock()
+
+    def observe(self, requester: Requester):
+        """Records the rate limit reported in ``requester``'s last response."""
+        remaining, limit = requester.rate_limiting
+        reset_at = requester.rate_limiting_resettime
+        if limit < 0:
+            return
+
+        with self._lock:
+            # responses from other threads can arrive out of order
+            if reset_at != self.reset_at or self.remaining is None:
+                self.remaining = remaining
+            else:
+                self.remaining = min(self.remaining, remaining)
+            self.limit, self.reset_at = limit, reset_at
+            metrics.GITHUB_RATE_LIMIT_REMAINING.set(self.remaining)
+            metrics.GITHUB_RATE_LIMIT.set(limit)
+
+    def allowance(self, requests: int) -> int:
+        """How many of ``requests`` can be made now, keeping the reserve."""
+        with self._lock:
+            if self.remaining is None or time.time() >= self.reset_at:
+                return requests
+            return max(0, min(requests, self.remaining - self.reserve))
+
+
+governor = RateLimitGovernor(settings.GITHUB_RATE_LIMIT_RESERVE)
+
+_local = threading.local()
+
+
+def get_github() -> Github:
+    """This thread's client."""
+    if not hasattr(_local, "github"):
+        _local.github = Github(auth=Auth.Token(settings.GITHUB_WORKFLOW_TOKEN))
+    return _local.github
+
+
+def get_workflow() -> Workflow:
+    """This thread's handle on the match workflow, fetched once."""
+    if not hasattr(_local, "workflow"):
+        _local.workflow = (
+            get_github()
+            .get_repo(MATCH_REPOSITORY, lazy=True)
+            .get_workflow(MATCH_WORKFLOW)
+        )
+        governor.observe(_local.workflow._requester)
+    return _local.workflow
+
+
+@dataclass
+class RunsPage:
+    total_count: int
+    runs: list[WorkflowRun]
+
+
+_pages: dict[tuple, tuple[str, RunsPage]] = {}
+_pages_lock = threading.Lock()
+
+
+def list_runs(workflow: Workflow, page: int = 1, **parameters) -> RunsPage:
+    """
+    A page of the workflow's runs, newest first, filtered by ``parameters``
+    as ``Workflow.get_runs`` is. Pages that haven't changed since they were
+    last listed by this process come from memory.
+    """
+    requester = workflow._requester
+    url = f"{workflow.url}/runs"
+    parameters = {**parameters, "page": page, "per_page": RUNS_PER_PAGE}
+    key = (url, tuple(sorted(parameters.items())))
+    with _pages_lock:
+        cached = _pages.get(key)
+
+    headers = {"If-None-Match": cached[0]} if cached else None
+    response_headers, data = requester.requestJsonAndCheck(
+        "GET", url, parameters=parameters, headers=headers
+    )
+    governor.observe(requester)
+    if data is None and cached:
+        # 304 Not Modified
+        return cached[1]
+
+    runs_page = RunsPage(
+        data["total_count"],
+        [
+            WorkflowRun(requester, response_headers, run, completed=True)
+            for run in data["workflow_runs"]
+        ],
+    )
+    if "etag" in response_headers:
+        with _pages_lock:
+            _pages[key] = (response_headers["etag"], runs_page)
+    return runs_page
+
+
+def dispatch(workflow: Workflow, inputs: dict) -> bool:
+    """Dispatches a run of ``workflow`` on main, returning if it was created."""
+    try:
+        return workflow.create_dispatch("main", inputs)
+    finally:
+        governor.observe(workflow._requester)
@@ -0,0 +1,81 @@
+import random
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Abs
+
+from tournament.matchmaking import MatchmakingIndex
+from tournament.models import Bot, User
+from tournament.runner import SEED_NUM_PLAYERS, rank_limit
+
+
+def create_bots(count: int) -> list[Bot]:
+    """Bots with random ratings, every other one an NPC."""
+    users = User.objects.bulk_create(
+        User(username=f"benchmark-{uuid.uuid4().hex[:12]}", is_npc=n % 2 == 0)
+        for n in range(count)
+    )
+    return Bot.objects.bulk_create(
+        Bot(
+            user=user,
+            mu=random.uniform(0, 50),
+            sigma=random.uniform(1, 8),
+            docker_image=f"benchmark/bot{n}:latest",
+        )
+        for n, user in enumerate(users)
+    )
+
+
+def database_opponents(bot: Bot, count: int, limit: int) -> list[Bot]:
+    """Opponents picked with the queries the index replaced."""
+    nearby = (
+        Bot.objects.exclude(pk=bot)
+        .exclude(docker_image__exact="")
+        .order_by(Abs(F("mu") - bot.mu))[:limit]
+    )
+    return list(Bot.objects.filter(pk__in=nearby).order_by("?")[:count])
+
+
+class Command(BaseCommand):
+    help = "Compares picking opponents from the matchmaking index and the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bots", type=int, default=10000)
+        parser.add_argument("--picks", type=int, default=1000)
+        parser.add_argument(
+            "--database-picks",
+            type=int,
+            default=50,
+            help="Picks to time against the database, 0 to skip it.",
+        )
+
+    def time_picks(self, pick, bots, picks) -> float:
+        """Average seconds per pick."""
+        seeds = random.choices(bots, k=picks)
+        start = time.perf_counter()
+        for seed in seeds:
+            pick(seed, random.choice(SEED_NUM_PLAYERS) - 1, rank_limit())
+        return (time.perf_counter() - start) / picks
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            bots = create_bots(options["bots"])
+
+            start = time.perf_counter()
+            index = MatchmakingIndex.load()
+            load = time.perf_counter() - start
+            self.stdout.write(f"Loaded {len(index)} bots in {load * 1000:.1f}ms")
+
+            per_pick = self.time_picks(index.opponents, bots, options["picks"])
+            self.stdout.write(f"index:    {per_pick * 1e6:9.1f}us per pick")
+
+            if options["database_picks"]:
+                per_pick = self.time_picks(
+                    database_opponents, bots, options["database_picks"]
+                )
+                self.stdout.write(f"database: {per_pick * 1e6:9.1f}us per pick")
+
+            transaction.set_rollback(True)
@@ -0,0 +1,140 @@
+import glob
+import gzip
+import os
+import time
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+import zstandard
+
+from tournament.codecs import CODECS, get_codec
+from tournament.replays import from_json
+
+DEFAULT_LEVELS = {"gzip": [6, 9], "br": [5, 9, 11], "zstd": [3, 9, 19]}
+
+
+def default_replays():
+    return sorted(
+        glob.glob(
+            os.path.join(
+                apps.get_app_config("tournament").path,
+                "static",
+                "tournament",
+                "replays",
+                "*.hlt.gz",
+            )
+        )
+    )
+
+
+class Command(BaseCommand):
+    help = "Compares compression ratio and speed of the replay codecs."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths", nargs="*", help="Replays to compress, gzipped or plain JSON."
+        )
+        parser.add_argument(
+            "--codec",
+            action="append",
+            choices=sorted(CODECS),
+            help="Only benchmark this codec. Can be repeated.",
+        )
+        parser.add_argument(
+            "--level",
+            action="append",
+            type=int,
+            help="Compression level to try instead of the defaults. Can be repeated.",
+        )
+        parser.add_argument("--dictionary-size", type=int, default=112640)
+        parser.add_argument(
+            "--binary",
+            action="store_true",
+            help="Convert the replays to the binary format before compressing.",
+        )
+
+    def load(self, paths, binary):
+        replays = []
+        for path in paths:
+            with open(path, "rb") as f:
+                data = f.read()
+            if data[:2] == b"\x1f\x8b":
+                data = gzip.decompress(data)
+            if binary:
+                data = from_json(data)
+            replays.append(data)
+        return replays
+
+    def measure(self, replays, compress, decompress):
+        compressed_size = 0
+        compress_time = 0.0
+        decompress_time = 0.0
+
+        for data in replays:
+            start = time.perf_counter()
+            compressed = compress(data)
+            compress_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            restored = decompress(compressed)
+            decompress_time += time.perf_counter() - start
+
+            if restored != data:
+                raise CommandError("Replay did not survive a round trip.")
+            compressed_size += len(compressed)
+
+        return compressed_size, compress_time, decompress_time
+
+    def report(
+        self, label, original_size, compressed_size, compress_time, decompress_time
+    ):
+        self.stdout.write(
+            f"{label:<16} {compressed_size:>12} {original_size / compressed_size:>7.2f}"
+            f" {compress_time * 1000:>12.0f} {decompress_time * 1000:>12.0f}"
+        )
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or default_replays()
+        if not paths:
+            raise CommandError("No replays to benchmark.")
+
+        replays = self.load(paths, options["binary"])
+        original_size = sum(len(data) for data in replays)
+        self.stdout.write(
+            f"{len(replays)} replays, {original_size} bytes"
+            + (" in the binary format" if options["binary"] else "")
+        )
+        self.stdout.write(
+            f"{'codec':<16} {'bytes':>12} {'ratio':>7} {'compress ms':>12} {'decompress ms':>12}"
+        )
+
+        for name in options["codec"] or sorted(CODECS):
+            for level in options["level"] or DEFAULT_LEVELS[name]:
+                codec = get_codec(name, level)
+                if name == "zstd":
+                    # the trained dictionary is benchmarked separately below
+                    codec.dictionary_id = None
+                self.report(
+                    f"{name} {level}",
+                    original_size,
+                    *self.measure(replays, codec.compress, codec.decompress),
+                )
+
+        if options["codec"] and "zstd" not in options["codec"]:
+            return
+
+        if len(replays) < 8:
+            self.stdout.write("Too few replays to train a zstd dictionary.")
+            return
+
+        # trained and measured on the same replays, so this is an upper bound
+        dictionary = zstandard.train_dictionary(options["dictionary_size"], replays)
+        decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+        for level in options["level"] or DEFAULT_LEVELS["zstd"]:
+            compressor = zstandard.ZstdCompressor(level=level, dict_data=dictionary)
+            self.report(
+                f"zstd+dict {level}",
+                original_size,
+                *self.measure(replays, compressor.compress, decompressor.decompress),
+            )
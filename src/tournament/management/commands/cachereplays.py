@@ -0,0 +1,46 @@
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from tournament.models import Match
+
+
+class Command(BaseCommand):
+    help = "Decodes replays of recent matches into the replay array cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=1000)
+        parser.add_argument(
+            "--clear", action="store_true", help="Empty the cache instead."
+        )
+
+    def handle(self, *args, **options):
+        cache_dir = settings.REPLAY_CACHE_DIR
+        if cache_dir is None:
+            raise CommandError("REPLAY_CACHE_DIR is not set.")
+
+        if options["clear"]:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            self.stdout.write(f"Cleared {cache_dir}.")
+            return
+
+        matches = (
+            Match.objects.exclude(Q(replay__isnull=True) | Q(replay=""))
+            .order_by("-date")
+            .only("uuid", "replay")[: options["limit"]]
+        )
+
+        cached = 0
+        start = time.perf_counter()
+        for match in matches.iterator():
+            if not os.path.isdir(os.path.join(cache_dir, str(match.uuid))):
+                match.replay_arrays()
+                cached += 1
+
+        self.stdout.write(
+            f"Cached {cached} replays in {time.perf_counter() - start:.1f}s."
+        )
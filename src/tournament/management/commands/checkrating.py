@@ -0,0 +1,67 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+import trueskill
+
+from tournament import rating
+from tournament.exceptions import RatingToleranceError
+from tournament.runner import SEED_NUM_PLAYERS
+
+
+class Command(BaseCommand):
+    help = "Compares the float64 rating engine against the mpmath trueskill backend."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--matches", type=int, default=500)
+        parser.add_argument(
+            "--tolerance", type=float, default=settings.RATING_ENGINE_TOLERANCE
+        )
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+
+        matches = []
+        for _ in range(options["matches"]):
+            num_players = rng.choice(SEED_NUM_PLAYERS)
+            matches.append(
+                (
+                    [
+                        {
+                            n: trueskill.Rating(
+                                rng.uniform(0, 50), rng.uniform(0.5, trueskill.SIGMA)
+                            )
+                        }
+                        for n in range(num_players)
+                    ],
+                    rng.sample(range(num_players), num_players),
+                )
+            )
+
+        deviation = 0.0
+        for rating_groups, ranks in matches:
+            try:
+                deviation = max(
+                    deviation,
+                    rating.check_against_reference(
+                        rating_groups, ranks, tolerance=options["tolerance"]
+                    ),
+                )
+            except RatingToleranceError as e:
+                raise CommandError(str(e))
+
+        start = time.perf_counter()
+        for rating_groups, ranks in matches:
+            trueskill.rate(rating_groups, ranks)
+        reference_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rating.rate_many(matches)
+        batch_time = time.perf_counter() - start
+
+        self.stdout.write(f"max deviation: {deviation:g}")
+        self.stdout.write(f"mpmath: {reference_time * 1000:.1f}ms")
+        self.stdout.write(f"batch: {batch_time * 1000:.1f}ms")
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from tournament import stats
+from tournament.exceptions import ReplayFormatError
+from tournament.models import LeaderboardEntry, Match, MatchStats
+
+
+class Command(BaseCommand):
+    help = "Computes match statistics for recorded matches that have none."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None)
+        parser.add_argument(
+            "--recompute", action="store_true", help="Replace existing statistics."
+        )
+
+    def handle(self, *args, **options):
+        matches = (
+            Match.objects.exclude(Q(replay__isnull=True) | Q(replay=""))
+            .filter(results__isnull=False)
+            .distinct()
+            .order_by("-date")
+        )
+        if not options["recompute"]:
+            matches = matches.filter(stats__isnull=True)
+        if options["limit"] is not None:
+            matches = matches[: options["limit"]]
+
+        computed = failed = 0
+        bot_ids = set()
+        for match in matches.iterator():
+            results = list(match.results.select_related("bot__user").order_by("pk"))
+            try:
+                # a pass over every match, not worth caching replays for
+                by_bot = stats.stats_by_bot(
+                    [result.bot.name for result in results],
+                    match.replay_arrays(cache=False),
+                )
+            except (ReplayFormatError, KeyError, ValueError) as e:
+                self.stderr.write(f"{match}: {e}")
+                failed += 1
+                continue
+
+            MatchStats.objects.filter(match=match).delete()
+            MatchStats.objects.bulk_create(
+                MatchStats(
+                    result=result,
+                    bot=result.bot,
+                    match=match,
+                    **by_bot[result.bot.name],
+                )
+                for result in results
+            )
+            bot_ids.update(result.bot_id for result in results)
+            computed += 1
+
+        # the leaderboard's peak territory is kept up to date as matches are
+        # recorded, not as their statistics change
+        if bot_ids:
+            LeaderboardEntry.refresh(bot_ids)
+
+        self.stdout.write(
+            f"Computed statistics for {computed} matches, {failed} failed."
+        )
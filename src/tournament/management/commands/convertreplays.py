@@ -0,0 +1,83 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from tournament import replays
+from tournament.models import (
+    Match,
+    compress_stream,
+    convert_replay,
+    encode_replay,
+    replay_codecs,
+)
+
+
+class Command(BaseCommand):
+    help = "Converts stored JSON replays to the binary format."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def convert(self, match: Match, dry_run: bool) -> tuple[int, int]:
+        """Returns the stored size of the replay before and after, 0 if it
+        was left as JSON."""
+        json_name, _ = os.path.splitext(match.replay.name)
+        binary = encode_replay(match.open_replay, json_name)
+        if binary is None:
+            return match.replay.size, 0
+        with binary:
+            source, name = convert_replay(binary, match.open_replay, json_name)
+            with source:
+                if name == json_name:
+                    return match.replay.size, 0
+                codecs = replay_codecs()
+                replay, *variants = compress_stream(source, name, codecs)
+        sizes = match.replay.size, replay.size
+
+        try:
+            if dry_run:
+                return sizes
+
+            storage = match.replay.storage
+            old_names = [match.replay.name, *match.replay_variants.values()]
+            match.replay = storage.save(replay.name, replay)
+            match.replay_variants = {
+                codec.name: storage.save(f.name, f)
+                for codec, f in zip(codecs[1:], variants)
+            }
+            match.save(update_fields=["replay", "replay_variants"])
+
+            for old_name in old_names:
+                storage.delete(old_name)
+            return sizes
+        finally:
+            replay.close()
+            for f in variants:
+                f.close()
+
+    def handle(self, *args, **options):
+        matches = (
+            Match.objects.exclude(Q(replay__isnull=True) | Q(replay=""))
+            .exclude(replay__contains=replays.EXTENSION)
+            .order_by("-date")
+        )
+        if options["limit"] is not None:
+            matches = matches[: options["limit"]]
+
+        converted = skipped = before = after = 0
+        for match in matches.iterator():
+            old_size, new_size = self.convert(match, options["dry_run"])
+            if not new_size:
+                skipped += 1
+                continue
+            converted += 1
+            before += old_size
+            after += new_size
+
+        self.stdout.write(
+            f"Converted {converted} replays, {skipped} kept as JSON."
+            + (f" {before} -> {after} bytes." if converted else "")
+            + (" (dry run, nothing written)" if options["dry_run"] else "")
+        )
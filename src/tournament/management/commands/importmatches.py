@@ -0,0 +1,211 @@
+import glob
+import json
+import logging
+import os
+import tarfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+from django import db
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+
+from tournament import metrics
+from tournament.dataclasses import ExtractedMatch
+from tournament.models import Match
+
+logger = logging.getLogger(__name__)
+
+# match ids looked up per query, within SQLite's limit on query parameters
+LOOKUP_SIZE = 500
+
+
+def archive_paths(pattern: str) -> list[str]:
+    """The result tarballs in a directory, or matching a glob."""
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "**", "*.tar.xz")
+    return sorted(
+        path
+        for path in glob.glob(pattern, recursive=True)
+        if path.endswith(".tar.xz") and os.path.isfile(path)
+    )
+
+
+def archive_match_id(path: str) -> str:
+    """The id of the match in a tarball, which is named after it."""
+    return os.path.basename(path)[:-7]
+
+
+def read_date(path: str) -> Optional[tuple[datetime, str]]:
+    """The date of the match in a tarball and its id, if it can be read."""
+    match_id = archive_match_id(path)
+    try:
+        with tarfile.open(path, mode="r") as result:
+            match = json.load(result.extractfile(f"{match_id}.json"))
+        return datetime.fromisoformat(match["date"]), match_id
+    except (OSError, tarfile.TarError, KeyError, TypeError, ValueError) as e:
+        logger.error(f"Can't read {path}: {e}")
+        return None
+
+
+def extract(path: str) -> tuple[ExtractedMatch, float]:
+    """
+    Extracts a tarball in a worker process, with its files read into memory
+    so they can be sent back to the importing process, and the seconds it
+    took, which the importing process records as workers' metrics are lost.
+    """
+    start = time.perf_counter()
+    with open(path, "rb") as file:
+        extracted = Match.extract_tar(file, archive_match_id(path))
+
+    def in_memory(f):
+        with f:
+            return ContentFile(f.read(), name=f.name)
+
+    extracted.replay = in_memory(extracted.replay)
+    extracted.replay_variants = {
+        name: in_memory(f) for name, f in extracted.replay_variants.items()
+    }
+    extracted.error_logs = {
+        bot_name: in_memory(f) for bot_name, f in extracted.error_logs.items()
+    }
+    return extracted, time.perf_counter() - start
+
+
+def recorded_match_ids(match_ids: list[str]) -> set[str]:
+    """The ids of the matches that already have results."""
+    recorded = set()
+    for i in range(0, len(match_ids), LOOKUP_SIZE):
+        recorded.update(
+            str(uuid)
+            for uuid in Match.objects.filter(
+                uuid__in=match_ids[i : i + LOOKUP_SIZE], results__isnull=False
+            ).values_list("uuid", flat=True)
+        )
+    return recorded
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports archived match result tarballs, rating them in date order on "
+        "top of the current ratings. Run rerate afterwards if the imported "
+        "matches predate recorded ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="A directory of tarballs, or a glob.")
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=None,
+            help="Processes extracting tarballs, one per CPU by default.",
+        )
+        parser.add_argument(
+            "--upload-threads",
+            type=int,
+            default=8,
+            help="Threads saving replays and error logs to storage.",
+        )
+
+    def handle(self, *args, **options):
+        paths = archive_paths(options["path"])
+        if not paths:
+            raise CommandError(f"No tarballs found at {options['path']}.")
+
+        start = time.perf_counter()
+        # the workers are forked and must not share the database connection
+        db.connections.close_all()
+        with ProcessPoolExecutor(options["processes"]) as processes:
+            dated = sorted(
+                (dated, path)
+                for dated, path in zip(
+                    processes.map(read_date, paths, chunksize=16), paths
+                )
+                if dated is not None
+            )
+            failed = len(paths) - len(dated)
+            recorded = recorded_match_ids([match_id for (_, match_id), _ in dated])
+            paths = [path for (_, match_id), path in dated if match_id not in recorded]
+            self.stdout.write(
+                f"Importing {len(paths)} matches, {len(recorded)} already recorded."
+            )
+
+            batches = [
+                paths[i : i + options["batch_size"]]
+                for i in range(0, len(paths), options["batch_size"])
+            ]
+            imported = 0
+            with ThreadPoolExecutor(options["upload_threads"]) as uploads:
+                # the next batch is extracted while the current one is recorded
+                pending = self.submit(processes, batches[:1])
+                for i in range(len(batches)):
+                    batch = pending
+                    pending = self.submit(processes, batches[i + 1 : i + 2])
+
+                    extracted = []
+                    for path, future in zip(batches[i], batch):
+                        try:
+                            e, seconds = future.result()
+                        except Exception as error:
+                            failed += 1
+                            self.stderr.write(f"Failed to extract {path}: {error}")
+                        else:
+                            metrics.EXTRACT_SECONDS.observe(seconds)
+                            extracted.append(e)
+
+                    list(uploads.map(ExtractedMatch.store, extracted))
+                    ok = self.record(extracted)
+                    imported += ok
+                    failed += len(extracted) - ok
+                    self.stdout.write(
+                        f"{imported} imported, {failed} failed, "
+                        f"{imported / (time.perf_counter() - start):.1f} matches/sec"
+                    )
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f"Imported {imported} matches in {elapsed:.1f}s "
+            f"({imported / elapsed:.1f} matches/sec), {failed} failed."
+        )
+
+    @staticmethod
+    def submit(processes: ProcessPoolExecutor, batches: list[list[str]]):
+        return [processes.submit(extract, path) for batch in batches for path in batch]
+
+    @staticmethod
+    def keep(e: ExtractedMatch, match: Match):
+        if match.replay.name != e.replay:
+            # the match was already recorded from another tarball
+            e.discard()
+
+    def record(self, extracted: list[ExtractedMatch]) -> int:
+        """Records a batch in one transaction, returning how many were."""
+        if not extracted:
+            return 0
+
+        try:
+            matches = Match.record_matches(extracted)
+        except Exception as error:
+            self.stderr.write(
+                f"Failed to record batch of {len(extracted)} matches: {error}"
+            )
+        else:
+            for e, match in zip(extracted, matches):
+                self.keep(e, match)
+            return len(extracted)
+
+        # find the bad match(es) by recording one at a time
+        recorded = 0
+        for e in extracted:
+            try:
+                (match,) = Match.record_matches([e])
+            except Exception as error:
+                self.stderr.write(f"Failed to record match {e.match.id}: {error}")
+                e.discard()
+            else:
+                self.keep(e, match)
+                recorded += 1
+        return recorded
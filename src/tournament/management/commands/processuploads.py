@@ -0,0 +1,94 @@
+import logging
+import time
+from datetime import timedelta
+
+from django import db
+from django.core.management.base import BaseCommand
+
+from tournament.dataclasses import ExtractedMatch
+from tournament.models import Match, MatchUpload
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = "Records queued match result uploads."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--poll-interval", type=float, default=2.0)
+        parser.add_argument("--lock-timeout", type=int, default=600)
+        parser.add_argument(
+            "--once", action="store_true", help="Exit when the queue is empty."
+        )
+
+    def process(self, uploads: list[MatchUpload]):
+        extracted = []
+        for upload in uploads:
+            try:
+                with upload.archive.open("rb") as file:
+                    e = Match.extract_tar(file, str(upload.uuid))
+            except Exception as error:
+                logger.exception(f"Failed to extract upload {upload}")
+                upload.fail(error)
+                continue
+
+            # stored ahead of recording so that recording again one match at
+            # a time reuses them, and deleted unless a match ends up with them
+            try:
+                e.store()
+            except Exception as error:
+                logger.exception(f"Failed to store upload {upload}")
+                e.discard()
+                upload.fail(error)
+            else:
+                extracted.append((upload, e))
+
+        self.record(extracted)
+
+    @staticmethod
+    def succeed(upload: MatchUpload, e: ExtractedMatch, match: Match):
+        upload.succeed(match)
+        if match.replay.name != e.replay:
+            # the match was already recorded from another upload
+            e.discard()
+
+    def record(self, extracted: list[tuple[MatchUpload, ExtractedMatch]]):
+        if not extracted:
+            return
+
+        # any error is retried below, where it fails only the bad upload
+        try:
+            matches = Match.record_matches([e for _, e in extracted])
+        except Exception:
+            logger.exception(f"Failed to record batch of {len(extracted)} uploads")
+        else:
+            for (upload, e), match in zip(extracted, matches):
+                self.succeed(upload, e, match)
+            return
+
+        # find the bad upload(s) by recording one at a time
+        for upload, e in extracted:
+            try:
+                (match,) = Match.record_matches([e])
+            except Exception as error:
+                logger.exception(f"Failed to record upload {upload}")
+                e.discard()
+                upload.fail(error)
+            else:
+                self.succeed(upload, e, match)
+
+    def handle(self, *args, **options):
+        lock_timeout = timedelta(seconds=options["lock_timeout"])
+
+        while True:
+            # the connection lives across batches, drop it if it broke or aged out
+            db.close_old_connections()
+            uploads = MatchUpload.claim(options["batch_size"], lock_timeout)
+            if uploads:
+                self.process(uploads)
+                self.stdout.write(f"Processed {len(uploads)} uploads.")
+            elif options["once"]:
+                return
+            else:
+                time.sleep(options["poll_interval"])
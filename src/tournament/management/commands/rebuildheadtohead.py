@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tournament.models import Bot, HeadToHead
+
+
+class Command(BaseCommand):
+    help = (
+        "Recounts the head-to-head records of every pair of bots from the "
+        "match history, streaming it in chunks."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        with transaction.atomic():
+            # matches can't be recorded while the history is read
+            list(Bot._base_manager.select_for_update().values_list("pk"))
+            HeadToHead.rebuild(options["chunk_size"])
+            count = HeadToHead.objects.count()
+
+        self.stdout.write(
+            f"Rebuilt {count} head-to-head records in "
+            f"{time.perf_counter() - start:.1f}s."
+        )
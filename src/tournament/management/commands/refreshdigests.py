@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from docker_image.reference import InvalidReference, Reference
+
+from tournament import registry
+from tournament.exceptions import HaliteError
+from tournament.models import Bot
+
+
+class Command(BaseCommand):
+    help = (
+        "Resolves the tags of bots' images again, refreshing the digest cache "
+        "and reporting tags that have moved since the bots were saved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument(
+            "--update",
+            action="store_true",
+            help="Pin bots whose tag moved to the new image.",
+        )
+
+    def handle(self, *args, **options):
+        by_tag = {}
+        for bot in Bot.objects.exclude(docker_image="").select_related("user"):
+            try:
+                reference = Reference.parse_normalized_named(bot.docker_image)
+            except InvalidReference:
+                continue
+            if reference["tag"] is not None:
+                key = (reference["name"], reference["tag"])
+                by_tag.setdefault(key, (reference, []))[1].append(
+                    (bot, reference["digest"])
+                )
+
+        start = time.perf_counter()
+        references = [reference for reference, _ in by_tag.values()]
+        digests = registry.resolve_digests(
+            references, refresh=True, workers=options["workers"]
+        )
+        self.stdout.write(
+            f"Resolved {len(references)} tags in {time.perf_counter() - start:.1f}s."
+        )
+
+        moved = 0
+        for (reference, bots), digest in zip(by_tag.values(), digests):
+            if isinstance(digest, HaliteError):
+                self.stderr.write(f"{reference.string()}: {digest}")
+                continue
+
+            for bot, current in bots:
+                if current == digest:
+                    continue
+
+                moved += 1
+                pinned = Reference(
+                    name=reference["name"], tag=reference["tag"], digest=digest
+                ).string()
+                self.stdout.write(f"{bot}: {reference['tag']} moved to {digest}")
+                if options["update"]:
+                    bot.docker_image = pinned
+                    bot.save()
+
+        if options["update"]:
+            self.stdout.write(f"Pinned {moved} bots to the images their tags moved to.")
+        else:
+            self.stdout.write(f"{moved} bots' tags moved.")
@@ -0,0 +1,109 @@
+import json
+import math
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tournament.timing import SLOW_REQUEST
+
+
+def percentile(values: list[float], p: float) -> float:
+    """The nearest-rank ``p``th percentile of sorted ``values``."""
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def read_records(lines):
+    """The slow request records in log lines, wherever they are in a line."""
+    marker = f"{SLOW_REQUEST} {{"
+    for line in lines:
+        start = line.find(marker)
+        if start < 0:
+            continue
+        try:
+            yield json.loads(line[start + len(SLOW_REQUEST) + 1 :])
+        except ValueError:
+            continue
+
+
+class Command(BaseCommand):
+    help = (
+        "Aggregates slow request logs into percentiles per view, with the "
+        "statements each view repeated most. Set SLOW_REQUEST_THRESHOLD to 0 "
+        "to log, and so report on, every request."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "logs", nargs="*", help="Log files to read, standard input if none."
+        )
+        parser.add_argument(
+            "--percentiles", type=float, nargs="+", default=[50, 90, 99]
+        )
+        parser.add_argument(
+            "--statements",
+            type=int,
+            default=3,
+            help="Most repeated statements to show per view.",
+        )
+
+    def handle(self, *args, **options):
+        by_view = defaultdict(list)
+        for lines in self.open_logs(options["logs"]):
+            with lines:
+                for record in read_records(lines):
+                    by_view[record["view"] or "(unresolved)"].append(record)
+        if not by_view:
+            raise CommandError("No slow requests found.")
+
+        columns = [f"p{p:g}" for p in options["percentiles"]]
+        self.stdout.write(
+            f"{'view':<32} {'count':>6} "
+            + " ".join(f"{column:>8}" for column in columns)
+            + f" {'queries':>8} {'db':>8} {'template':>8} {'storage':>8}"
+        )
+        # slowest first, by the highest percentile asked for
+        for view, records in sorted(
+            by_view.items(),
+            key=lambda item: -percentile(
+                sorted(r["ms"] for r in item[1]), max(options["percentiles"])
+            ),
+        ):
+            medians = {
+                key: percentile(sorted(r[key] for r in records), 50)
+                for key in ["queries", "db_ms", "template_ms", "storage_ms"]
+            }
+            durations = sorted(r["ms"] for r in records)
+            self.stdout.write(
+                f"{view:<32} {len(records):>6} "
+                + " ".join(
+                    f"{percentile(durations, p):>8.1f}" for p in options["percentiles"]
+                )
+                + f" {medians['queries']:>8} {medians['db_ms']:>8.1f}"
+                f" {medians['template_ms']:>8.1f} {medians['storage_ms']:>8.1f}"
+            )
+
+            repeated = defaultdict(int)
+            for record in records:
+                for statement in record.get("duplicates", []):
+                    repeated[statement["sql"]] += statement["count"]
+            for sql, count in sorted(repeated.items(), key=lambda item: -item[1])[
+                : options["statements"]
+            ]:
+                self.stdout.write(f"    {count:>6}x {sql}")
+
+        self.stdout.write(
+            "Durations are in ms; queries and db, template and storage ms are "
+            "medians."
+        )
+
+    @staticmethod
+    def open_logs(paths: list[str]):
+        if not paths:
+            # not closed with the others
+            yield open(sys.stdin.fileno(), closefd=False)
+        for path in paths:
+            try:
+                yield open(path)
+            except OSError as e:
+                raise CommandError(f"Can't read {path}: {e}")
@@ -0,0 +1,274 @@
+import itertools
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+import trueskill
+
+from tournament import rating
+from tournament.models import (
+    Bot,
+    BotActivity,
+    LeaderboardEntry,
+    MatchResult,
+    RatingCheckpoint,
+    RatingPoint,
+)
+
+
+def rating_parameters() -> dict:
+    env = trueskill.global_env()
+    return dict(
+        mu=float(env.mu),
+        sigma=float(env.sigma),
+        beta=float(env.beta),
+        tau=float(env.tau),
+        draw_probability=float(env.draw_probability),
+    )
+
+
+class Replay:
+    """
+    In-memory rating state while replaying match history in date order.
+    Only the current rating and docker image of each bot are kept, so memory
+    is bounded by the number of bots, not the number of matches.
+    """
+
+    def __init__(self, checkpoint: RatingCheckpoint = None):
+        self.ratings = defaultdict(trueskill.Rating)
+        self.images = {}
+        self.match_count = 0
+        # last rated match and last added match, as (date, match_id)
+        self.position = None
+        self.cursor = None
+
+        if checkpoint is not None:
+            for bot_id, (mu, sigma, docker_image) in checkpoint.ratings.items():
+                self.ratings[int(bot_id)] = trueskill.Rating(mu, sigma)
+                self.images[int(bot_id)] = docker_image
+            self.match_count = checkpoint.match_count
+            self.position = (checkpoint.date, checkpoint.match_id)
+            self.cursor = self.position
+
+        self.pending = []
+        self.updates = []
+
+    def add(self, match_id, date, results):
+        for _, bot_id, docker_image, _ in results:
+            if self.images.get(bot_id, docker_image) != docker_image:
+                # a new docker image resets the bot's uncertainty (Bot.pre_save)
+                self.rate()
+                self.ratings[bot_id] = trueskill.Rating(
+                    self.ratings[bot_id].mu, trueskill.SIGMA
+                )
+            self.images[bot_id] = docker_image
+
+        self.pending.append((match_id, date, results))
+        self.cursor = (date, match_id)
+
+    def rate(self):
+        if not self.pending:
+            return
+
+        new_ratings = rating.rate_batch(
+            self.ratings,
+            [
+                {bot_id: rank for _, bot_id, _, rank in results}
+                for _, _, results in self.pending
+            ],
+        )
+
+        for (match_id, date, results), match_ratings in zip(self.pending, new_ratings):
+            for pk, bot_id, _, _ in results:
+                new_rating = match_ratings[bot_id]
+                self.updates.append(
+                    MatchResult(pk=pk, mu=new_rating.mu, sigma=new_rating.sigma)
+                )
+
+        _, date, _ = self.pending[-1]
+        self.position = (date, self.pending[-1][0])
+        self.match_count += len(self.pending)
+        self.pending = []
+
+    def checkpoint(self) -> RatingCheckpoint:
+        date, match_id = self.position
+        return RatingCheckpoint(
+            match_id=match_id,
+            date=date,
+            match_count=self.match_count,
+            parameters=rating_parameters(),
+            ratings={
+                bot_id: [r.mu, r.sigma, self.images[bot_id]]
+                for bot_id, r in self.ratings.items()
+            },
+        )
+
+
+class Command(BaseCommand):
+    help = "Recomputes all ratings by replaying match history."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--since",
+            type=datetime.fromisoformat,
+            help=(
+                "Restart from the newest checkpoint taken before this date, "
+                "which must have been taken with the current parameters."
+            ),
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue from the newest checkpoint taken with the current parameters.",
+        )
+        parser.add_argument("--checkpoint-every", type=int, default=10000)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def get_checkpoint(self, options):
+        checkpoints = RatingCheckpoint.objects.all()
+
+        if options["since"] is not None:
+            checkpoint = checkpoints.filter(date__lt=options["since"]).first()
+            if checkpoint is not None and checkpoint.parameters != rating_parameters():
+                raise CommandError(
+                    f"Checkpoint {checkpoint} was taken with different rating "
+                    f"parameters: {checkpoint.parameters}."
+                )
+            return checkpoint
+
+        if options["resume"]:
+            return checkpoints.filter(parameters=rating_parameters()).first()
+
+        return None
+
+    def history(self, position, chunk_size):
+        results = MatchResult.objects.filter(match__date__isnull=False)
+
+        if position is not None:
+            date, match_id = position
+            results = results.filter(
+                Q(match__date__gt=date) | Q(match__date=date, match_id__gt=match_id)
+            )
+
+        rows = (
+            results.order_by("match__date", "match_id")
+            .values_list(
+                "match_id", "match__date", "pk", "bot_id", "docker_image", "rank"
+            )
+            .iterator(chunk_size=chunk_size)
+        )
+
+        for (match_id, date), group in itertools.groupby(rows, key=lambda row: row[:2]):
+            yield match_id, date, [row[2:] for row in group]
+
+    def flush(self, replay: Replay, options, force_checkpoint=False):
+        replay.rate()
+
+        if options["dry_run"]:
+            replay.updates = []
+            return
+
+        with transaction.atomic():
+            MatchResult.objects.bulk_update(
+                replay.updates, ["mu", "sigma"], batch_size=options["batch_size"]
+            )
+            replay.updates = []
+
+            since_checkpoint = replay.match_count - self.last_checkpoint
+            if replay.position is not None and (
+                (force_checkpoint and since_checkpoint)
+                or since_checkpoint >= options["checkpoint_every"]
+            ):
+                replay.checkpoint().save()
+                self.last_checkpoint = replay.match_count
+
+    def handle(self, *args, **options):
+        if options["since"] is not None and options["resume"]:
+            raise CommandError("Use either --since or --resume, not both.")
+
+        checkpoint = self.get_checkpoint(options)
+        if checkpoint is None and (options["since"] or options["resume"]):
+            self.stdout.write("No usable checkpoint, replaying from the first match.")
+
+        replay = Replay(checkpoint)
+        self.last_checkpoint = replay.match_count
+        start_count = replay.match_count
+
+        if checkpoint is not None:
+            self.stdout.write(f"Starting from checkpoint {checkpoint}.")
+
+        # the checkpoints past the starting point are replaced by the ones
+        # taken during the replay, and only deleted once it has succeeded
+        stale = RatingCheckpoint.objects.all()
+        if checkpoint is not None:
+            stale = stale.exclude(pk=checkpoint.pk).filter(
+                Q(date__gt=checkpoint.date)
+                | Q(date=checkpoint.date, match_id__gte=checkpoint.match_id)
+            )
+        stale = list(stale.values_list("pk", flat=True))
+
+        start = time.perf_counter()
+        for match_id, date, results in self.history(
+            replay.cursor, options["chunk_size"]
+        ):
+            replay.add(match_id, date, results)
+            if len(replay.pending) >= options["batch_size"]:
+                self.flush(replay, options)
+
+        with transaction.atomic():
+            # hold the bots while catching up on matches that arrived during
+            # the replay, so ingestion cannot interleave with the final write
+            bots = {bot.pk: bot for bot in Bot._base_manager.select_for_update().all()}
+
+            for match_id, date, results in self.history(
+                replay.cursor, options["chunk_size"]
+            ):
+                replay.add(match_id, date, results)
+            self.flush(replay, options, force_checkpoint=True)
+
+            changed = []
+            for bot_id, new_rating in replay.ratings.items():
+                bot = bots.get(bot_id)
+                if bot is None:
+                    continue
+
+                sigma = new_rating.sigma
+                if bot.docker_image != replay.images[bot_id]:
+                    sigma = trueskill.SIGMA
+
+                if options["verbosity"] > 1:
+                    self.stdout.write(
+                        f"{bot.name}: {bot.mu:.3f}/{bot.sigma:.3f} -> {new_rating.mu:.3f}/{sigma:.3f}"
+                    )
+                bot.mu = new_rating.mu
+                bot.sigma = sigma
+                changed.append(bot)
+
+            if not options["dry_run"]:
+                RatingCheckpoint.objects.filter(pk__in=stale).delete()
+                now = timezone.now()
+                for bot in changed:
+                    bot.updated_at = now
+                Bot._base_manager.bulk_update(
+                    changed,
+                    ["mu", "sigma", "updated_at"],
+                    batch_size=options["batch_size"],
+                )
+                LeaderboardEntry.refresh()
+                RatingPoint.rebuild(options["chunk_size"])
+                BotActivity.refresh()
+
+        elapsed = time.perf_counter() - start
+        replayed = replay.match_count - start_count
+        self.stdout.write(
+            f"Replayed {replayed} matches in {elapsed:.1f}s"
+            + (f" ({replayed / elapsed:.0f} matches/s)" if elapsed > 0 else "")
+            + (" (dry run, nothing written)" if options["dry_run"] else "")
+        )
@@ -0,0 +1,60 @@
+import time
+
+from django import db
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tournament import github_client
+from tournament.runner import BACKENDS
+from tournament.scheduler import MatchScheduler, SeedPool
+
+
+class Command(BaseCommand):
+    help = "Keeps a number of halite matches running."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=settings.MATCH_CONCURRENCY
+        )
+        parser.add_argument(
+            "--max-queued-runs", type=int, default=settings.MATCH_MAX_QUEUED_RUNS
+        )
+        parser.add_argument(
+            "--backend",
+            choices=sorted(BACKENDS),
+            default=settings.MATCH_RUNNER_BACKEND,
+            help="Where to run matches.",
+        )
+        parser.add_argument("--poll-interval", type=float, default=15.0)
+        parser.add_argument(
+            "--refresh-interval",
+            type=float,
+            default=300.0,
+            help="Seconds between reloads of the seed player pool.",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="Exit after one round of starts."
+        )
+
+    def handle(self, *args, **options):
+        scheduler = MatchScheduler(
+            SeedPool(options["refresh_interval"]),
+            concurrency=options["concurrency"],
+            max_queued_runs=options["max_queued_runs"],
+            backend=BACKENDS[options["backend"]](),
+        )
+
+        while True:
+            # the connection lives across ticks, drop it if it broke or aged out
+            db.close_old_connections()
+            matches = scheduler.tick()
+            for match in matches:
+                self.stdout.write(f"Started match {match.uuid}.")
+            if options["verbosity"] > 1 and github_client.governor.limit:
+                self.stdout.write(
+                    f"GitHub rate limit: {github_client.governor.remaining} of "
+                    f"{github_client.governor.limit} requests left."
+                )
+            if options["once"]:
+                return
+            time.sleep(options["poll_interval"])
@@ -0,0 +1,59 @@
+import gzip
+import random
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+import zstandard
+
+from tournament.codecs import zstd_dictionary_name
+from tournament.management.commands.benchmarkreplays import default_replays
+from tournament.models import Match
+from tournament.replays import from_json
+
+
+class Command(BaseCommand):
+    help = "Trains a zstd dictionary for replays from recent matches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--matches", type=int, default=200)
+        parser.add_argument("--size", type=int, default=112640)
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        # train on replays the way they are stored
+        samples = []
+        for path in default_replays():
+            with open(path, "rb") as f:
+                data = gzip.decompress(f.read())
+            if settings.REPLAY_FORMAT == "binary":
+                data = from_json(data)
+            samples.append(data)
+
+        matches = (
+            Match.objects.exclude(replay__isnull=True)
+            .exclude(replay="")
+            .order_by("-date")[: options["matches"]]
+        )
+        for match in matches:
+            with match.open_stored_replay() as replay:
+                samples.append(replay.read())
+
+        if len(samples) < 8:
+            raise CommandError("Not enough replays to train a dictionary.")
+
+        random.Random(options["seed"]).shuffle(samples)
+        dictionary = zstandard.train_dictionary(options["size"], samples)
+        dictionary_id = dictionary.dict_id()
+
+        name = zstd_dictionary_name(dictionary_id)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, ContentFile(dictionary.as_bytes()))
+
+        self.stdout.write(
+            f"Trained on {len(samples)} replays. "
+            f"Set REPLAY_ZSTD_DICTIONARY = {dictionary_id} to use it."
+        )
@@ -0,0 +1,79 @@
+"""
+In-memory index of the bots that can play, sorted by mu, for picking a seed
+player's opponents without querying the database.
+
+The index is dropped whenever ratings are updated in this process (see
+``models.ratings_updated``) and reloaded at least every
+``MATCHMAKING_INDEX_TTL`` seconds to pick up updates made by others.
+"""
+import bisect
+import random
+import time
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import QuerySet
+
+from tournament.models import Bot, ratings_updated
+
+
+def index_queryset() -> QuerySet:
+    return Bot.objects.exclude(docker_image__exact="").select_related("user")
+
+
+class MatchmakingIndex:
+    def __init__(self, bots: list[Bot]):
+        self.bots = sorted(bots, key=lambda b: b.mu)
+        self.mus = [bot.mu for bot in self.bots]
+
+    @staticmethod
+    def load() -> "MatchmakingIndex":
+        return MatchmakingIndex(list(index_queryset()))
+
+    def __len__(self):
+        return len(self.bots)
+
+    def nearest(self, bot: Bot, k: int) -> list[Bot]:
+        """
+        The ``k`` bots other than ``bot`` closest to it in mu, found by
+        walking outwards from its position in both directions.
+        """
+        lo = bisect.bisect_left(self.mus, bot.mu) - 1
+        hi = lo + 1
+        nearest = []
+        while len(nearest) < k and (lo >= 0 or hi < len(self.bots)):
+            if hi >= len(self.bots) or (
+                lo >= 0 and bot.mu - self.mus[lo] <= self.mus[hi] - bot.mu
+            ):
+                candidate, lo = self.bots[lo], lo - 1
+            else:
+                candidate, hi = self.bots[hi], hi + 1
+            if candidate.pk != bot.pk:
+                nearest.append(candidate)
+        return nearest
+
+    def opponents(self, bot: Bot, count: int, rank_limit: int) -> list[Bot]:
+        """``count`` bots picked at random among the ``rank_limit`` nearest."""
+        nearest = self.nearest(bot, rank_limit)
+        return random.sample(nearest, min(count, len(nearest)))
+
+
+_index: Optional[MatchmakingIndex] = None
+_loaded_at = 0.0
+
+
+def get_index() -> MatchmakingIndex:
+    global _index, _loaded_at
+
+    if _index is None or time.monotonic() - _loaded_at > settings.MATCHMAKING_INDEX_TTL:
+        _index = MatchmakingIndex.load()
+        _loaded_at = time.monotonic()
+    return _index
+
+
+def invalidate(**kwargs):
+    global _index
+    _index = None
+
+
+ratings_updated.connect(invalidate, dispatch_uid="matchmaking_invalidate")
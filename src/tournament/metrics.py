@@ -0,0 +1,360 @@
+"""
+Counters, gauges and histograms of match ingestion, matchmaking and
+rating, served in the Prometheus text format by ``views.MetricsView``.
+
+The site, processuploads and schedulematches run as separate processes, so
+each keeps its series in memory and a thread saves the ones that changed
+to ``MetricSeries`` every ``METRICS_FLUSH_INTERVAL`` seconds. The view adds
+up the series of every process. Recording a value takes a lock and an
+addition. A process carries on from the values saved under its name, the
+host and the command it runs, so counters don't go back across restarts.
+
+Pool worker processes never save their series, which would clash with their
+parent's, so what they record is lost: importmatches times its workers'
+extraction itself. Without a flush interval, as in the tests, series are only
+saved when they are served.
+"""
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Sequence
+from contextlib import contextmanager
+from typing import Optional
+
+from django import db
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# seconds, and bytes from 1KiB to 256MiB
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = tuple(4**n for n in range(5, 15))
+
+
+def process_name() -> str:
+    """This process' name, the same across restarts."""
+    command = os.path.basename(sys.argv[0]) if sys.argv else "python"
+    if command == "manage.py" and len(sys.argv) > 1:
+        command = sys.argv[1]
+    return f"{socket.gethostname()}:{command}"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{escape(value)}"' for name, value in labels.items())
+    return f"{{{pairs}}}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        # values by their labels' values, and the ones changed since saved
+        self.values = {}
+        self.changed = set()
+        self.lock = threading.Lock()
+        registry.register(self)
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def merge(self, total, value):
+        """Adds a process' ``value`` of a series to the ``total`` so far."""
+        return value if total is None else total + value
+
+    def samples(self, labels: dict, value) -> list[str]:
+        return [f"{self.name}{format_labels(labels)} {value}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+            self.changed.add(key)
+        registry.start()
+
+
+class Gauge(Metric):
+    """A value that is set, whose latest value across processes is served."""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+            self.changed.add(key)
+        registry.start()
+
+    def merge(self, total, value):
+        return value
+
+
+class Histogram(Metric):
+    """
+    Counts of observations no greater than each bucket's bound. Values are
+    kept as the count in each bucket, +Inf last, followed by their sum.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = TIME_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self.key(labels)
+        bucket = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bucket] += 1
+            counts[-1] += value
+            self.changed.add(key)
+        registry.start()
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes how long the block takes, in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def merge(self, total, value):
+        if total is None or len(total) != len(value):
+            return list(value)
+        return [a + b for a, b in zip(total, value)]
+
+    def samples(self, labels: dict, value) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip([*self.buckets, "+Inf"], value[:-1]):
+            cumulative += count
+            bucket_labels = {**labels, "le": str(bound)}
+            lines.append(
+                f"{self.name}_bucket{format_labels(bucket_labels)} {cumulative}"
+            )
+        lines.append(f"{self.name}_sum{format_labels(labels)} {value[-1]}")
+        lines.append(f"{self.name}_count{format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+        self.process: Optional[str] = None
+        self.started = False
+        self.loaded = False
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def register(self, metric: Metric):
+        self.metrics[metric.name] = metric
+
+    def start(self):
+        """Starts saving this process' series, once anything is recorded."""
+        if self.started or not settings.METRICS_FLUSH_INTERVAL:
+            return
+        with self._start_lock:
+            if self.started:
+                return
+            self.started = True
+        if multiprocessing.parent_process() is not None:
+            # pool workers would save under their parent's name
+            return
+        threading.Thread(target=self.run, name="metrics", daemon=True).start()
+        atexit.register(self.save)
+
+    def run(self):
+        while True:
+            time.sleep(settings.METRICS_FLUSH_INTERVAL)
+            self.save()
+            db.connection.close()
+
+    def save(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Failed to save metrics")
+
+    def load(self):
+        """Adds the counts saved by this process' last run to its own."""
+        from tournament.models import MetricSeries
+
+        self.process = process_name()
+        for name, labels, value in MetricSeries.objects.filter(
+            process=self.process
+        ).values_list("name", "labels", "value"):
+            metric = self.metrics.get(name)
+            if metric is None or isinstance(metric, Gauge):
+                continue
+            key = tuple(json.loads(labels))
+            with metric.lock:
+                current = metric.values.get(key)
+                if current is None:
+                    metric.values[key] = value
+                else:
+                    metric.values[key] = metric.merge(current, value)
+
+    def flush(self):
+        """Saves the series that changed since they were last saved."""
+        from tournament.models import MetricSeries
+
+        with self._flush_lock:
+            if not self.loaded:
+                self.load()
+                self.loaded = True
+
+            changed = []
+            for metric in self.metrics.values():
+                with metric.lock:
+                    changed.extend(
+                        (metric, key, json.loads(json.dumps(metric.values[key])))
+                        for key in metric.changed
+                    )
+                    metric.changed = set()
+            if not changed:
+                return
+
+            now = timezone.now()
+            try:
+                MetricSeries.objects.bulk_create(
+                    [
+                        MetricSeries(
+                            process=self.process,
+                            name=metric.name,
+                            labels=json.dumps(key),
+                            value=value,
+                            updated_at=now,
+                        )
+                        for metric, key, value in changed
+                    ],
+                    update_conflicts=True,
+                    unique_fields=["process", "name", "labels"],
+                    update_fields=["value", "updated_at"],
+                )
+            except Exception:
+                # saved next time
+                for metric, key, _ in changed:
+                    with metric.lock:
+                        metric.changed.add(key)
+                raise
+
+    def exposition(self) -> str:
+        """Every process' series in the Prometheus text format."""
+        from tournament.models import MetricSeries
+
+        self.flush()
+        totals = {}
+        for name, labels, value in MetricSeries.objects.order_by(
+            "updated_at"
+        ).values_list("name", "labels", "value"):
+            metric = self.metrics.get(name)
+            if metric is not None:
+                key = (name, labels)
+                totals[key] = metric.merge(totals.get(key), value)
+
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for (series_name, labels), value in sorted(totals.items()):
+                if series_name == name:
+                    lines.extend(
+                        metric.samples(
+                            dict(zip(metric.labels, json.loads(labels))), value
+                        )
+                    )
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+UPLOAD_BYTES = Histogram(
+    "halite_match_upload_bytes",
+    "Size of match result tarballs uploaded to the match result API.",
+    buckets=SIZE_BUCKETS,
+)
+EXTRACT_SECONDS = Histogram(
+    "halite_match_extract_seconds",
+    "Time to extract, convert and compress a match result tarball.",
+)
+COMPRESS_SECONDS = Histogram(
+    "halite_replay_compress_seconds",
+    "Time to compress a replay with every configured codec.",
+)
+RECORD_SECONDS = Histogram(
+    "halite_match_record_seconds",
+    "Time to save and rate a batch of extracted matches.",
+)
+RATING_SECONDS = Histogram(
+    "halite_rating_seconds",
+    "Time to rate a batch of matches.",
+)
+MATCHES_RECORDED = Counter(
+    "halite_matches_recorded_total",
+    "Matches recorded with their results.",
+)
+MATCHES_DISPATCHED = Counter(
+    "halite_matches_dispatched_total",
+    "Matches dispatched to a runner.",
+    ["backend"],
+)
+MATCH_START_FAILURES = Counter(
+    "halite_match_start_failures_total",
+    "Matches that could not be started, by why.",
+    ["backend", "reason"],
+)
+RUN_LOOKUP_PAGES = Counter(
+    "halite_run_lookup_pages_total",
+    "Pages of workflow runs listed to find runs whose webhooks never arrived.",
+)
+RUNS_FOUND = Counter(
+    "halite_runs_found_total",
+    "Workflow runs found by listing runs instead of by webhook.",
+)
+WEBHOOKS = Counter(
+    "halite_workflow_run_webhooks_total",
+    "workflow_run webhooks received, by whether they recorded a run id.",
+    ["recorded"],
+)
+GITHUB_RATE_LIMIT_REMAINING = Gauge(
+    "halite_github_rate_limit_remaining",
+    "Requests left in the GitHub token's rate limit window.",
+)
+GITHUB_RATE_LIMIT = Gauge(
+    "halite_github_rate_limit",
+    "Requests allowed per GitHub rate limit window.",
+)
+DB_CONNECTION_RETRIES = Counter(
+    "halite_db_connection_retries_total",
+    "Database connection attempts retried after failing.",
+)
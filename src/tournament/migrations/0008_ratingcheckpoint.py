@@ -0,0 +1,50 @@
+# Generated by Django 4.2.2 on 2026-10-18 14:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0007_matchresult_unique_bot_match"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RatingCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateTimeField()),
+                ("match_count", models.PositiveIntegerField()),
+                ("parameters", models.JSONField()),
+                ("ratings", models.JSONField()),
+                (
+                    "created_at",
+                    django_extensions.db.fields.CreationDateTimeField(
+                        auto_now_add=True
+                    ),
+                ),
+                (
+                    "match",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="tournament.match",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-date", "-match"],
+            },
+        ),
+    ]
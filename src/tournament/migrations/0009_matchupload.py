@@ -0,0 +1,82 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:01
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0008_ratingcheckpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MatchUpload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("uuid", models.UUIDField(unique=True)),
+                ("archive", models.FileField(null=True, upload_to="uploads")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "Pending"),
+                            ("processing", "Processing"),
+                            ("done", "Done"),
+                            ("failed", "Failed"),
+                        ],
+                        default="pending",
+                        max_length=20,
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("error", models.TextField(blank=True, default="")),
+                (
+                    "available_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                ("locked_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "created_at",
+                    django_extensions.db.fields.CreationDateTimeField(
+                        auto_now_add=True
+                    ),
+                ),
+                (
+                    "updated_at",
+                    django_extensions.db.fields.ModificationDateTimeField(
+                        auto_now=True
+                    ),
+                ),
+                (
+                    "match",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="tournament.match",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "available_at"],
+                        name="upload_status_available",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0009_matchupload"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="match",
+            name="replay_variants",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+import django_extensions.db.fields
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0010_match_replay_variants"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MatchStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("player", models.PositiveSmallIntegerField()),
+                ("peak_territory", models.PositiveIntegerField()),
+                ("peak_territory_frame", models.PositiveIntegerField()),
+                ("peak_territory_share", models.FloatField()),
+                ("final_territory", models.PositiveIntegerField()),
+                ("peak_strength", models.PositiveIntegerField()),
+                ("production_captured", models.PositiveIntegerField()),
+                ("cap_losses", models.PositiveIntegerField()),
+                ("first_contact_frame", models.PositiveIntegerField(null=True)),
+                ("damage_dealt", models.PositiveIntegerField()),
+                ("damage_taken", models.PositiveIntegerField()),
+                ("environment_damage", models.PositiveIntegerField()),
+                ("overkill_damage", models.PositiveIntegerField()),
+                ("territory_curve", models.JSONField()),
+                ("strength_curve", models.JSONField()),
+                (
+                    "created_at",
+                    django_extensions.db.fields.CreationDateTimeField(
+                        auto_now_add=True
+                    ),
+                ),
+                (
+                    "bot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stats",
+                        to="tournament.bot",
+                    ),
+                ),
+                (
+                    "match",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stats",
+                        to="tournament.match",
+                    ),
+                ),
+                (
+                    "result",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stats",
+                        to="tournament.matchresult",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "match stats",
+                "indexes": [
+                    models.Index(fields=["bot", "match"], name="matchstats_bot_match")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Avg, Count, F
+from django.utils import timezone
+
+
+def populate_leaderboard(apps, schema_editor):
+    Bot = apps.get_model("tournament", "Bot")
+    LeaderboardEntry = apps.get_model("tournament", "LeaderboardEntry")
+    MatchResult = apps.get_model("tournament", "MatchResult")
+
+    now = timezone.now()
+    listed = Bot.objects.filter(enabled=True).exclude(docker_image__exact="")
+    totals = {
+        row["bot"]: row
+        for row in MatchResult.objects.filter(
+            bot__in=listed, docker_image=F("bot__docker_image")
+        )
+        .values("bot")
+        .annotate(
+            match_count=Count("pk"),
+            peak_territory_share=Avg("stats__peak_territory_share"),
+        )
+    }
+    entries = sorted(
+        (
+            LeaderboardEntry(
+                bot=bot,
+                name=bot.user.username,
+                rank=0,
+                score=bot.mu - bot.sigma * 3,
+                mu=bot.mu,
+                sigma=bot.sigma,
+                match_count=totals.get(bot.pk, {}).get("match_count", 0),
+                peak_territory_share=totals.get(bot.pk, {}).get("peak_territory_share"),
+                updated_at=now,
+            )
+            for bot in listed.select_related("user")
+        ),
+        key=lambda entry: -entry.score,
+    )
+    rank, previous_score = 0, None
+    for position, entry in enumerate(entries, start=1):
+        if entry.score != previous_score:
+            rank, previous_score = position, entry.score
+        entry.rank = rank
+    LeaderboardEntry.objects.bulk_create(entries)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0011_matchstats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LeaderboardEntry",
+            fields=[
+                (
+                    "bot",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="leaderboard_entry",
+                        serialize=False,
+                        to="tournament.bot",
+                    ),
+                ),
+                ("name", models.CharField(max_length=150)),
+                ("rank", models.PositiveIntegerField()),
+                ("score", models.FloatField()),
+                ("mu", models.FloatField()),
+                ("sigma", models.FloatField()),
+                ("match_count", models.PositiveIntegerField()),
+                ("peak_territory_share", models.FloatField(null=True)),
+                ("updated_at", models.DateTimeField()),
+            ],
+            options={
+                "verbose_name_plural": "leaderboard",
+                "ordering": ["rank", "-mu", "name"],
+                "indexes": [
+                    models.Index(
+                        fields=["rank", "-mu", "name"], name="leaderboard_order"
+                    ),
+                    models.Index(fields=["updated_at"], name="leaderboard_updated"),
+                ],
+            },
+        ),
+        migrations.RunPython(populate_leaderboard, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0012_leaderboardentry"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="match",
+            index=models.Index(fields=["-date", "-id"], name="match_date_id"),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+import tournament.models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0013_match_date_id"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="bot",
+            index=models.Index(
+                fields=["enabled", "docker_image"], name="bot_enabled_image"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="bot",
+            index=models.Index(tournament.models.Score(), name="bot_score"),
+        ),
+        migrations.AddIndex(
+            model_name="matchresult",
+            index=models.Index(
+                fields=["bot", "docker_image"], name="matchresult_bot_image"
+            ),
+        ),
+    ]
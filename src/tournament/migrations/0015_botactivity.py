@@ -0,0 +1,66 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def populate_activity(apps, schema_editor):
+    BotActivity = apps.get_model("tournament", "BotActivity")
+    MatchResult = apps.get_model("tournament", "MatchResult")
+
+    BotActivity.objects.bulk_create(
+        BotActivity(
+            bot_id=row["bot"],
+            docker_image=row["docker_image"],
+            match_count=row["match_count"],
+            last_match_date=row["last_match_date"],
+        )
+        for row in MatchResult.objects.values("bot", "docker_image")
+        .annotate(match_count=Count("pk"), last_match_date=Max("match__date"))
+        .order_by()
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0014_composite_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BotActivity",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("docker_image", models.CharField(max_length=2000)),
+                ("match_count", models.PositiveIntegerField(default=0)),
+                ("last_match_date", models.DateTimeField(null=True)),
+                (
+                    "bot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="activity",
+                        to="tournament.bot",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "bot activity",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="botactivity",
+            constraint=models.UniqueConstraint(
+                fields=("bot", "docker_image"), name="unique_bot_activity"
+            ),
+        ),
+        migrations.RunPython(populate_activity, migrations.RunPython.noop),
+    ]
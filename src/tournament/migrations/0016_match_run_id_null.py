@@ -0,0 +1,17 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0015_botactivity"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="match",
+            name="run_id",
+            field=models.BigIntegerField(null=True),
+        ),
+    ]
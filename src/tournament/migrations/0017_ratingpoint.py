@@ -0,0 +1,69 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_rating_points(apps, schema_editor):
+    RatingPoint = apps.get_model("tournament", "RatingPoint")
+    MatchResult = apps.get_model("tournament", "MatchResult")
+
+    # the last rating of each bot in each hour, as RatingPoint.rebuild keeps
+    latest = {}
+    for bot_id, date, mu, sigma in (
+        MatchResult.objects.filter(match__date__isnull=False)
+        .order_by("match__date", "match_id")
+        .values_list("bot_id", "match__date", "mu", "sigma")
+        .iterator(chunk_size=5000)
+    ):
+        time = date.replace(minute=0, second=0, microsecond=0)
+        latest[(bot_id, time)] = (mu, sigma)
+
+    RatingPoint.objects.bulk_create(
+        (
+            RatingPoint(bot_id=bot_id, time=time, mu=mu, sigma=sigma)
+            for (bot_id, time), (mu, sigma) in latest.items()
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0016_match_run_id_null"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RatingPoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("time", models.DateTimeField()),
+                ("mu", models.FloatField()),
+                ("sigma", models.FloatField()),
+                (
+                    "bot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="rating_points",
+                        to="tournament.bot",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="ratingpoint",
+            constraint=models.UniqueConstraint(
+                fields=("bot", "time"), name="unique_bot_time"
+            ),
+        ),
+        migrations.RunPython(populate_rating_points, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 4.2.2 on 2026-10-18 16:01
+
+import itertools
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def populate_head_to_head(apps, schema_editor):
+    HeadToHead = apps.get_model("tournament", "HeadToHead")
+    MatchResult = apps.get_model("tournament", "MatchResult")
+
+    # streamed a match at a time, as HeadToHead.rebuild does
+    counts = defaultdict(lambda: [0, 0])
+    results = (
+        MatchResult.objects.order_by("match_id")
+        .values_list("match_id", "bot_id", "docker_image", "rank")
+        .iterator(chunk_size=5000)
+    )
+    for _, players in itertools.groupby(results, key=lambda result: result[0]):
+        for (_, bot_id, docker_image, rank), (
+            _,
+            opponent_id,
+            opponent_docker_image,
+            opponent_rank,
+        ) in itertools.permutations(list(players), 2):
+            count = counts[(bot_id, docker_image, opponent_id, opponent_docker_image)]
+            count[0] += 1
+            count[1] += rank < opponent_rank
+
+    HeadToHead.objects.bulk_create(
+        (
+            HeadToHead(
+                bot_id=bot_id,
+                docker_image=docker_image,
+                opponent_id=opponent_id,
+                opponent_docker_image=opponent_docker_image,
+                games=games,
+                wins=wins,
+            )
+            for (bot_id, docker_image, opponent_id, opponent_docker_image), (
+                games,
+                wins,
+            ) in counts.items()
+        ),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0017_ratingpoint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HeadToHead",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("docker_image", models.CharField(max_length=2000)),
+                ("opponent_docker_image", models.CharField(max_length=2000)),
+                ("games", models.PositiveIntegerField(default=0)),
+                ("wins", models.PositiveIntegerField(default=0)),
+                (
+                    "bot",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="head_to_head",
+                        to="tournament.bot",
+                    ),
+                ),
+                (
+                    "opponent",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="tournament.bot",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name_plural": "head to head",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="headtohead",
+            constraint=models.UniqueConstraint(
+                fields=("bot", "docker_image", "opponent", "opponent_docker_image"),
+                name="unique_head_to_head",
+            ),
+        ),
+        migrations.RunPython(populate_head_to_head, migrations.RunPython.noop),
+    ]
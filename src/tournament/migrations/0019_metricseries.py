@@ -0,0 +1,40 @@
+# Generated by Django 4.2.2 on 2026-10-18 16:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0018_headtohead"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MetricSeries",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("process", models.CharField(max_length=255)),
+                ("name", models.CharField(max_length=200)),
+                ("labels", models.CharField(max_length=1000)),
+                ("value", models.JSONField()),
+                ("updated_at", models.DateTimeField()),
+            ],
+            options={
+                "verbose_name_plural": "metric series",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="metricseries",
+            constraint=models.UniqueConstraint(
+                fields=("process", "name", "labels"), name="unique_metric_series"
+            ),
+        ),
+    ]
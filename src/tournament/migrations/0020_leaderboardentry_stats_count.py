@@ -0,0 +1,35 @@
+# Generated by Django 4.2.2 on 2026-10-18 16:28
+
+from django.db import migrations, models
+from django.db.models import Count, F
+
+
+def count_stats(apps, schema_editor):
+    LeaderboardEntry = apps.get_model("tournament", "LeaderboardEntry")
+    MatchResult = apps.get_model("tournament", "MatchResult")
+
+    counts = dict(
+        MatchResult.objects.filter(docker_image=F("bot__docker_image"))
+        .values("bot")
+        .annotate(stats_count=Count("stats"))
+        .values_list("bot", "stats_count")
+    )
+    entries = list(LeaderboardEntry.objects.filter(pk__in=counts))
+    for entry in entries:
+        entry.stats_count = counts[entry.pk]
+    LeaderboardEntry.objects.bulk_update(entries, ["stats_count"], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0019_metricseries"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="leaderboardentry",
+            name="stats_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_stats, migrations.RunPython.noop),
+    ]
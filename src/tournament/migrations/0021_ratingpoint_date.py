@@ -0,0 +1,44 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:05
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def set_dates(apps, schema_editor):
+    RatingPoint = apps.get_model("tournament", "RatingPoint")
+    MatchResult = apps.get_model("tournament", "MatchResult")
+
+    # the bot's latest match in the point's hour
+    latest = (
+        MatchResult.objects.filter(
+            bot=OuterRef("bot"),
+            match__date__gte=OuterRef("time"),
+            match__date__lt=OuterRef("time") + timedelta(hours=1),
+        )
+        .order_by("-match__date")
+        .values("match__date")[:1]
+    )
+    RatingPoint.objects.update(date=Coalesce(Subquery(latest), "time"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0020_leaderboardentry_stats_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ratingpoint",
+            name="date",
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(set_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="ratingpoint",
+            name="date",
+            field=models.DateTimeField(),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.2 on 2026-10-18 17:19
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def set_match_dates(apps, schema_editor):
+    Match = apps.get_model("tournament", "Match")
+    MatchResult = apps.get_model("tournament", "MatchResult")
+    MatchResult.objects.update(
+        match_date=Subquery(Match.objects.filter(pk=OuterRef("match")).values("date"))
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("tournament", "0021_ratingpoint_date"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="matchresult",
+            name="match_date",
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(set_match_dates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name="matchresult",
+            index=models.Index(
+                fields=["bot", "-match_date", "-match"], name="matchresult_bot_date"
+            ),
+        ),
+    ]
@@ -1,34 +1,103 @@
-import gzip
+import functools
+import io
+import itertools
 import json
-import operator
+import logging
 import os
 import tarfile
-from datetime import datetime
-from functools import reduce
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+from operator import itemgetter
+from typing import BinaryIO, Callable, Collection, Iterable, Optional
+from uuid import UUID
 
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.core.files.base import ContentFile
+from django.core.files import File
+from django.core.files.storage import default_storage
 from django.db import models, transaction
-from django.db.models import F
-from django.db.models.signals import post_save, pre_save
+from django.db.models import (
+    Avg,
+    Count,
+    F,
+    Max,
+    OuterRef,
+    Prefetch,
+    Q,
+    QuerySet,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal
+from django.utils import timezone
 
-import requests
 import trueskill
 from django_extensions.db.fields import CreationDateTimeField, ModificationDateTimeField
 from docker_image.reference import InvalidReference, Reference
-from dxf import DXF
-from dxf.exceptions import DXFUnauthorizedError
 
-from tournament.dataclasses import MatchDataClass
+from tournament import metrics, rating, registry, replays, stats
+from tournament.codecs import (
+    CONTENT_ENCODING_PREFERENCE,
+    GzipCodec,
+    ReplayCodec,
+    best_encoding,
+    codec_for_file,
+    get_codec,
+)
+from tournament.dataclasses import ExtractedMatch, MatchDataClass
+from tournament.exceptions import HaliteError, ReplayFormatError
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 64 * 1024
 
 
 class User(AbstractUser):
     is_npc = models.BooleanField("NPC", default=False)
 
 
-class BotManager(models.Manager):
+class Score(models.Func):
+    """
+    ``mu - 3 * sigma`` in SQL. The 3 is part of the SQL rather than a query
+    parameter so the expression matches the ``bot_score`` index.
+    """
+
+    template = "(%(expressions)s)"
+    arg_joiner = " - 3 * "
+    output_field = models.FloatField()
+
+    def __init__(self, mu="mu", sigma="sigma"):
+        super().__init__(mu, sigma)
+
+
+class BotQuerySet(models.QuerySet):
+    def with_summary(self):
+        """
+        Annotates what ``Bot.rank`` and ``Bot.match_count`` would otherwise
+        each look up with a query of their own.
+        """
+        better = (
+            Bot.objects.annotate(score=Score())
+            .filter(score__gt=Score(OuterRef("mu"), OuterRef("sigma")))
+            .order_by()
+            .values("enabled")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        return self.annotate(
+            annotated_rank=Coalesce(Subquery(better), 0) + 1,
+            annotated_match_count=Count(
+                "matches", filter=Q(matches__docker_image=F("docker_image"))
+            ),
+        )
+
+
+class BotManager(models.Manager.from_queryset(BotQuerySet)):
     def get_queryset(self):
         return super().get_queryset().filter(enabled=True)
 
@@ -44,6 +113,16 @@ class Bot(models.Model):
 
     objects = BotManager()
 
+    # whether clean asks the registry for the tag's digest instead of using
+    # the one cached for DOCKER_DIGEST_CACHE_TIMEOUT seconds
+    refresh_digest = False
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["enabled", "docker_image"], name="bot_enabled_image"),
+            models.Index(Score(), name="bot_score"),
+        ]
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._initial_docker_image = self.docker_image
@@ -52,18 +131,30 @@ class Bot(models.Model):
         return self.mu - (self.sigma * 3)
 
     def rank(self) -> int:
+        if hasattr(self, "annotated_rank"):
+            return self.annotated_rank
         return (
-            Bot.objects.annotate(score=F("mu") - (F("sigma") * 3))
-            .filter(score__gt=self.score())
-            .count()
+            Bot.objects.annotate(score=Score()).filter(score__gt=self.score()).count()
             + 1
         )
 
     def match_count(self):
+        if hasattr(self, "annotated_match_count"):
+            return self.annotated_match_count
         return MatchResult.objects.filter(
             bot=self, docker_image=self.docker_image
         ).count()
 
+    def stats_summary(self) -> dict:
+        return MatchStats.objects.filter(
+            bot=self, result__docker_image=self.docker_image
+        ).aggregate(
+            peak_territory_share=Avg("peak_territory_share"),
+            production_captured=Avg("production_captured"),
+            first_contact_frame=Avg("first_contact_frame"),
+            overkill_damage=Avg("overkill_damage"),
+        )
+
     def __str__(self):
         return self.name
 
@@ -84,64 +175,10 @@ class Bot(models.Model):
                 )
 
             if r["digest"] is None:
-
-                def auth(dxf_, response):
-                    if r.domain() == "ghcr.io":
-                        dxf_.authenticate(
-                            "USERNAME",
-                            settings.GITHUB_READ_PACKAGES_TOKEN,
-                            response=response,
-                        )
-                    if r.domain() == "docker.io":
-                        dxf_.authenticate(
-                            settings.DOCKER_PUBLIC_READ_USERNAME,
-                            settings.DOCKER_PUBLIC_READ_TOKEN,
-                            response=response,
-                        )
-
-                registry_domain = r.domain()
-                if registry_domain == "docker.io":
-                    registry_domain = "registry-1.docker.io"
-
                 try:
-                    dxf = DXF(registry_domain, r.path(), auth)
-                    _, digest = dxf._get_alias(
-                        r["tag"],
-                        manifest=None,
-                        verify=True,
-                        sizes=False,
-                        get_digest=True,
-                        get_dcd=True,
-                        get_manifest=False,
-                        platform="linux/amd64",
-                        ml=True,
-                    )
-                except DXFUnauthorizedError:
-                    raise ValidationError(
-                        {
-                            "docker_image": "I don't have read access to that registry. Try hosting somewhere else."
-                        }
-                    )
-                except requests.RequestException as e:
-                    if e.response is not None:
-                        if e.response.status_code == 404:
-                            raise ValidationError(
-                                {
-                                    "docker_image": "Image not found. Check your image and tag."
-                                }
-                            )
-                        elif e.response.status_code == 403:
-                            raise ValidationError(
-                                {
-                                    "docker_image": "I don't have read access to that image. Make sure it is publicly readable."
-                                }
-                            )
-
-                    raise ValidationError(
-                        {
-                            "docker_image": "I wasn't able to reach the registry. Check your image."
-                        }
-                    )
+                    digest = registry.resolve_digest(r, refresh=self.refresh_digest)
+                except HaliteError as e:
+                    raise ValidationError({"docker_image": str(e)})
 
                 r = Reference(name=r["name"], tag=r["tag"], digest=digest)
 
@@ -158,120 +195,457 @@ class Bot(models.Model):
             instance._initial_docker_image = instance.docker_image
             instance.sigma = trueskill.SIGMA
 
+    @staticmethod
+    def refresh_leaderboard(sender, instance: "Bot", **kwargs):
+        LeaderboardEntry.refresh([instance.pk])
+
 
 pre_save.connect(Bot.pre_save, sender=Bot, dispatch_uid="bot_pre_save")
+post_save.connect(
+    Bot.refresh_leaderboard, sender=Bot, dispatch_uid="bot_refresh_leaderboard"
+)
+post_delete.connect(
+    Bot.refresh_leaderboard, sender=Bot, dispatch_uid="bot_delete_leaderboard"
+)
 post_save.connect(Bot.create_bot, sender=User, dispatch_uid="create_bot")
 
 
+def compress_stream(
+    source: BinaryIO, name: str, codecs: list[ReplayCodec]
+) -> list[File]:
+    """
+    Compresses a stream with each codec into a temporary file, one chunk at a
+    time, so neither the uncompressed nor the compressed data is ever held in
+    memory. The stream is only read once however many codecs there are.
+    """
+    files = [tempfile.TemporaryFile() for _ in codecs]
+    writers = [codec.open_writer(f) for codec, f in zip(codecs, files)]
+
+    while chunk := source.read(COPY_CHUNK_SIZE):
+        for writer in writers:
+            writer.write(chunk)
+
+    compressed = []
+    for codec, writer, f in zip(codecs, writers, files):
+        writer.close()
+        f.seek(0)
+        compressed.append(File(f, name=name + codec.extension))
+    return compressed
+
+
+def compress_member(
+    tar: tarfile.TarFile, member: str, name: str, codecs: list[ReplayCodec]
+) -> list[File]:
+    with tar.extractfile(member) as source:
+        return compress_stream(source, name, codecs)
+
+
+def extract_stats(match: MatchDataClass, binary: Optional[BinaryIO]) -> dict[str, dict]:
+    """
+    Per-bot statistics of a match from its replay in the binary format,
+    empty if the replay can't be analyzed.
+    """
+    if binary is None:
+        return {}
+    try:
+        with replays.map_file(binary) as data:
+            return stats.stats_by_bot(
+                [match_result.bot_name for match_result in match.match_results],
+                replays.ReplayArrays.parse(data),
+            )
+    except (ReplayFormatError, KeyError, ValueError) as e:
+        logger.warning(f"No statistics for match {match.id}: {e}")
+        return {}
+
+
+def replay_codecs() -> list[ReplayCodec]:
+    """The codec replays are stored with, followed by those of the variants."""
+    return [get_codec(settings.REPLAY_CODEC)] + [
+        get_codec(name)
+        for name in settings.REPLAY_VARIANTS
+        if name != settings.REPLAY_CODEC
+    ]
+
+
+def encode_replay(open_source: Callable[[], BinaryIO], name: str) -> Optional[BinaryIO]:
+    """
+    Converts replay JSON to the binary format (see tournament.replays) in a
+    temporary file, a frame at a time. None if it isn't a valid replay.
+    """
+    binary = tempfile.TemporaryFile()
+    try:
+        with open_source() as source:
+            replays.encode(source, binary)
+    except ReplayFormatError as e:
+        binary.close()
+        logger.warning(f"Can't convert {name} to the binary format: {e}")
+        return None
+    return binary
+
+
+def convert_replay(
+    binary: Optional[BinaryIO], open_source: Callable[[], BinaryIO], name: str
+) -> tuple[BinaryIO, str]:
+    """
+    The replay to store: ``binary`` if it converts back to the same bytes as
+    the JSON ``open_source`` opens, otherwise the JSON.
+    """
+    if binary is not None:
+        with open_source() as source, replays.map_file(binary) as data:
+            same = replays.matches_json(data, source)
+        if same:
+            binary.seek(0)
+            return binary, replays.binary_name(name)
+        logger.warning(f"Keeping {name} as JSON: it doesn't round trip")
+    return open_source(), name
+
+
 class Match(models.Model):
     created_at = CreationDateTimeField()
     updated_at = ModificationDateTimeField()
 
     uuid = models.UUIDField()
-    run_id = models.BigIntegerField()
+    # filled in by the workflow_run webhook once github has created the run
+    run_id = models.BigIntegerField(null=True)
 
     date = models.DateTimeField(null=True)
     seed = models.PositiveBigIntegerField(null=True)
     width = models.IntegerField(null=True)
     height = models.IntegerField(null=True)
     replay = models.FileField(default=None)
+    # extra encodings of the replay by codec name, see settings.REPLAY_VARIANTS
+    replay_variants = models.JSONField(default=dict, blank=True)
 
     class Meta:
         verbose_name_plural = "matches"
+        indexes = [models.Index(fields=["-date", "-id"], name="match_date_id")]
 
     def __str__(self):
         return str(self.uuid)
 
+    @staticmethod
+    def in_flight() -> QuerySet:
+        """Matches started within ``MATCH_TIMEOUT`` that have no results yet."""
+        started_after = timezone.now() - timedelta(seconds=settings.MATCH_TIMEOUT)
+        return Match.objects.filter(date__isnull=True, created_at__gte=started_after)
+
+    @staticmethod
+    def record_run(display_title: str, run_id: int) -> bool:
+        """
+        Sets the run id of the match a workflow run is titled after, unless it
+        is already known. Returns whether a match was updated.
+        """
+        try:
+            match_id = UUID(display_title)
+        except ValueError:
+            return False
+        return (
+            Match.objects.filter(uuid=match_id, run_id__isnull=True).update(
+                run_id=run_id
+            )
+            > 0
+        )
+
     def ordered_results(self):
+        if hasattr(self, "prefetched_results"):
+            return self.prefetched_results
         return self.results.order_by("rank")
 
+    def result_count(self) -> int:
+        if hasattr(self, "prefetched_results"):
+            return len(self.prefetched_results)
+        return self.results.count()
+
     @staticmethod
-    @transaction.atomic
-    def create_from_tar(file) -> "Match":
-        filename = file.name[:-7]
+    def prefetch_results(lookup: str = "results") -> Prefetch:
+        """
+        Prefetches the results of the matches at ``lookup`` in rank order,
+        with their bots, for ``ordered_results`` and ``result_count``.
+        """
+        return Prefetch(
+            lookup,
+            queryset=MatchResult.objects.select_related("bot__user").order_by("rank"),
+            to_attr="prefetched_results",
+        )
+
+    @property
+    def has_binary_replay(self) -> bool:
+        root, _ = os.path.splitext(self.replay.name)
+        return root.endswith(replays.EXTENSION)
+
+    def open_stored_replay(self) -> BinaryIO:
+        """Opens the replay as stored, JSON or binary, decompressed."""
+        return codec_for_file(self.replay.name).open_reader(self.replay.open("rb"))
+
+    def open_replay(self) -> BinaryIO:
+        """Opens the replay JSON, converting it back from binary if need be."""
+        reader = self.open_stored_replay()
+        if not self.has_binary_replay:
+            return reader
+        with reader:
+            return io.BytesIO(replays.to_json(reader.read()))
+
+    def replay_arrays(self, cache: bool = True) -> replays.ReplayArrays:
+        """
+        The replay decoded into arrays. Decoded replays are cached by uuid
+        under REPLAY_CACHE_DIR and memory-mapped from there. With ``cache``
+        False, a replay that isn't cached yet is decoded without caching it.
+        """
+        path = None
+        if settings.REPLAY_CACHE_DIR is not None:
+            path = os.path.join(settings.REPLAY_CACHE_DIR, str(self.uuid))
+            if os.path.isdir(path):
+                return replays.ReplayArrays.load(path)
+
+        with self.open_stored_replay() as f:
+            arrays = replays.ReplayArrays.parse(f.read())
+        if path is None or not cache:
+            return arrays
+        arrays.save(path)
+        return replays.ReplayArrays.load(path)
 
+    def replay_for_encoding(self, accept_encoding: str) -> Optional[str]:
+        """
+        The stored replay file a client sending ``accept_encoding`` can be
+        given as-is, or None if it would have to be decompressed first.
+        """
+        by_encoding = {}
+        for name in [self.replay.name, *self.replay_variants.values()]:
+            codec = codec_for_file(name)
+            if codec.content_encoding:
+                by_encoding.setdefault(codec.content_encoding, name)
+
+        encoding = best_encoding(
+            accept_encoding,
+            [e for e in CONTENT_ENCODING_PREFERENCE if e in by_encoding],
+        )
+        return by_encoding.get(encoding)
+
+    @staticmethod
+    def create_from_tar(file, match_id: str) -> "Match":
+        extracted = Match.extract_tar(file, match_id)
+        try:
+            return Match.record_matches([extracted])[0]
+        finally:
+            extracted.close()
+
+    @staticmethod
+    @metrics.EXTRACT_SECONDS.time()
+    def extract_tar(file, match_id: str) -> ExtractedMatch:
+        """
+        Extracts the result tarball of match ``match_id``. The id is passed in
+        rather than read from ``file.name``, which storage may have renamed.
+        """
         with tarfile.open(mode="r", fileobj=file) as result:
             match = MatchDataClass.from_dict(
-                json.load(result.extractfile(f"{filename}.json"))
-            )
-
-            replay_file = ContentFile(
-                gzip.compress(result.extractfile(match.replay).read(), compresslevel=9),
-                name=os.path.join(match.id, match.replay + ".gz"),
+                json.load(result.extractfile(f"{match_id}.json"))
             )
 
-            match_obj, created = Match.objects.update_or_create(
-                uuid=match.id,
-                defaults=dict(
-                    run_id=match.workflow_run_id,
-                    date=datetime.fromisoformat(match.date),
-                    seed=match.seed,
-                    width=match.width,
-                    height=match.height,
-                    replay=replay_file,
-                ),
-            )
+            replay_name = os.path.join(match.id, match.replay)
+            open_replay = functools.partial(result.extractfile, match.replay)
+            binary = encode_replay(open_replay, replay_name)
+            try:
+                match_stats = extract_stats(match, binary)
 
-            bots = {}
+                codecs = replay_codecs()
+                if settings.REPLAY_FORMAT == "binary":
+                    source, replay_name = convert_replay(
+                        binary, open_replay, replay_name
+                    )
+                else:
+                    source = open_replay()
+                with source, metrics.COMPRESS_SECONDS.time():
+                    replay_file, *variant_files = compress_stream(
+                        source, replay_name, codecs
+                    )
+            finally:
+                if binary is not None:
+                    binary.close()
 
+            error_log_files = {}
             for match_result in match.match_results:
-                bot = Bot.objects.select_for_update().get(
-                    user__username=match_result.bot_name
-                )
-                bots[match_result.bot_name] = bot, match_result
-
-            new_ratings = reduce(
-                operator.ior,
-                trueskill.rate(
-                    [
-                        {bot_name: trueskill.Rating(bot.mu, bot.sigma)}
-                        for bot_name, (bot, match_result) in bots.items()
-                    ],
-                    [
-                        match_result.rank - 1
-                        for bot_name, (bot, match_result) in bots.items()
-                    ],
-                ),
-                {},
-            )
-
-            for bot_name, (bot, match_result) in bots.items():
-                error_log_file = None
                 if match_result.error_log:
-                    error_log_file = ContentFile(
-                        gzip.compress(
-                            result.extractfile(match_result.error_log).read(),
-                            compresslevel=9,
-                        ),
-                        name=os.path.join(match.id, match_result.error_log + ".gz"),
+                    (error_log_files[match_result.bot_name],) = compress_member(
+                        result,
+                        match_result.error_log,
+                        os.path.join(match.id, match_result.error_log),
+                        [GzipCodec()],
                     )
 
-                rating: trueskill.Rating = new_ratings[bot_name]
+        return ExtractedMatch(
+            match=match,
+            replay=replay_file,
+            replay_variants={
+                codec.name: f for codec, f in zip(codecs[1:], variant_files)
+            },
+            error_logs=error_log_files,
+            stats=match_stats,
+        )
 
-                created, match_result_obj = MatchResult.objects.get_or_create(
-                    bot=bot,
-                    match=match_obj,
+    @staticmethod
+    @metrics.RECORD_SECONDS.time()
+    @transaction.atomic
+    def record_matches(extracted: list[ExtractedMatch]) -> list["Match"]:
+        """
+        Saves extracted matches and rates them in date order with a single call
+        to the rating engine. Matches that already have results are returned
+        as they are, so recording the same match twice is a no-op.
+        """
+        bot_names = {
+            match_result.bot_name
+            for e in extracted
+            for match_result in e.match.match_results
+        }
+        bots = {
+            bot.name: bot
+            for bot in Bot.objects.select_for_update(of=("self",))
+            .select_related("user")
+            .filter(user__username__in=bot_names)
+            .order_by("pk")
+        }
+        for bot_name in bot_names - bots.keys():
+            raise Bot.DoesNotExist(f"Bot {bot_name} does not exist.")
+
+        matches = {}
+        new_matches = []
+        for e in sorted(extracted, key=lambda e: datetime.fromisoformat(e.match.date)):
+            if e.match.id in matches:
+                continue
+
+            match_obj = Match.objects.filter(uuid=e.match.id).first()
+            if match_obj is None or not match_obj.results.exists():
+                match_obj, _ = Match.objects.update_or_create(
+                    uuid=e.match.id,
                     defaults=dict(
-                        docker_image=match_result.docker_image,
-                        rank=match_result.rank,
-                        mu=rating.mu,
-                        sigma=rating.sigma,
-                        last_frame_alive=match_result.last_frame_alive,
-                        error_log=error_log_file,
+                        run_id=e.match.workflow_run_id,
+                        date=datetime.fromisoformat(e.match.date),
+                        seed=e.match.seed,
+                        width=e.match.width,
+                        height=e.match.height,
+                        replay=e.replay,
+                        replay_variants={
+                            name: f
+                            if isinstance(f, str)
+                            else default_storage.save(f.name, f)
+                            for name, f in e.replay_variants.items()
+                        },
                     ),
                 )
+                new_matches.append((e, match_obj))
+
+            matches[e.match.id] = match_obj
+
+        ratings = {
+            bot_name: trueskill.Rating(bot.mu, bot.sigma)
+            for bot_name, bot in bots.items()
+        }
+        with metrics.RATING_SECONDS.time():
+            new_ratings = rating.rate_batch(
+                ratings,
+                [
+                    {
+                        match_result.bot_name: match_result.rank
+                        for match_result in e.match.match_results
+                    }
+                    for e, _ in new_matches
+                ],
+            )
+
+        match_stats = []
+        rating_points = []
+        # matches, matches with statistics and summed peak territory shares
+        # of the bots' current images
+        leaderboard_counts = defaultdict(lambda: [0, 0, 0.0])
+        for (e, match_obj), match_ratings in zip(new_matches, new_ratings):
+            for match_result in e.match.match_results:
+                new_rating: trueskill.Rating = match_ratings[match_result.bot_name]
+                bot = bots[match_result.bot_name]
+                if match_result.docker_image == bot.docker_image:
+                    counts = leaderboard_counts[bot.pk]
+                    counts[0] += 1
+                    if match_result.bot_name in e.stats:
+                        counts[1] += 1
+                        counts[2] += e.stats[match_result.bot_name][
+                            "peak_territory_share"
+                        ]
+
+                result_obj = MatchResult.objects.create(
+                    bot=bot,
+                    match=match_obj,
+                    match_date=match_obj.date,
+                    docker_image=match_result.docker_image,
+                    rank=match_result.rank,
+                    mu=new_rating.mu,
+                    sigma=new_rating.sigma,
+                    last_frame_alive=match_result.last_frame_alive,
+                    error_log=e.error_logs.get(match_result.bot_name),
+                )
+                rating_points.append(
+                    RatingPoint(
+                        bot=result_obj.bot,
+                        time=RatingPoint.bucket(match_obj.date),
+                        date=match_obj.date,
+                        mu=new_rating.mu,
+                        sigma=new_rating.sigma,
+                    )
+                )
+                if match_result.bot_name in e.stats:
+                    match_stats.append(
+                        MatchStats(
+                            result=result_obj,
+                            bot=result_obj.bot,
+                            match=match_obj,
+                            **e.stats[match_result.bot_name],
+                        )
+                    )
+        MatchStats.objects.bulk_create(match_stats)
+        RatingPoint.append(rating_points)
+        players = [
+            [
+                (bots[r.bot_name].pk, r.docker_image, r.rank)
+                for r in e.match.match_results
+            ]
+            for e, _ in new_matches
+        ]
+        HeadToHead.add(HeadToHead.tally(players))
+        BotActivity.add(
+            BotActivity.tally(
+                (match_obj.date, match_players)
+                for (_, match_obj), match_players in zip(new_matches, players)
+            )
+        )
 
-                if created:
-                    bot.mu = rating.mu
-                    bot.sigma = rating.sigma
-                    bot.save(update_fields=["mu", "sigma", "updated_at"])
+        rated = [
+            bots[bot_name]
+            for bot_name in {
+                match_result.bot_name
+                for e, _ in new_matches
+                for match_result in e.match.match_results
+            }
+        ]
+        now = timezone.now()
+        for bot in rated:
+            bot.mu = ratings[bot.name].mu
+            bot.sigma = ratings[bot.name].sigma
+            bot.updated_at = now
+        # the leaderboard is updated once for the batch, not per bot save
+        Bot.objects.bulk_update(rated, ["mu", "sigma", "updated_at"])
+        LeaderboardEntry.add(
+            rated, {pk: tuple(counts) for pk, counts in leaderboard_counts.items()}
+        )
+        if new_matches:
+            transaction.on_commit(
+                lambda: metrics.MATCHES_RECORDED.inc(len(new_matches))
+            )
 
-        return match_obj
+        return [matches[e.match.id] for e in extracted]
 
 
 class MatchResult(models.Model):
     bot = models.ForeignKey(Bot, related_name="matches", on_delete=models.CASCADE)
     match = models.ForeignKey(Match, related_name="results", on_delete=models.CASCADE)
+    # the match's date, so that a bot's matches are listed from an index
+    match_date = models.DateTimeField(null=True)
     docker_image = models.CharField(max_length=2000)
     rank = models.IntegerField()
     mu = models.FloatField()
@@ -286,6 +660,691 @@ class MatchResult(models.Model):
         constraints = [
             models.UniqueConstraint(fields=["bot", "match"], name="unique_bot_match")
         ]
+        indexes = [
+            models.Index(fields=["bot", "docker_image"], name="matchresult_bot_image"),
+            models.Index(
+                fields=["bot", "-match_date", "-match"], name="matchresult_bot_date"
+            ),
+        ]
 
     def score(self) -> float:
         return self.mu - (self.sigma * 3)
+
+
+class MatchStats(models.Model):
+    """
+    Statistics of one bot in one match, computed from the replay when the
+    match is recorded (see tournament.stats).
+    """
+
+    result = models.OneToOneField(
+        MatchResult, related_name="stats", on_delete=models.CASCADE
+    )
+    bot = models.ForeignKey(Bot, related_name="stats", on_delete=models.CASCADE)
+    match = models.ForeignKey(Match, related_name="stats", on_delete=models.CASCADE)
+    player = models.PositiveSmallIntegerField()
+
+    peak_territory = models.PositiveIntegerField()
+    peak_territory_frame = models.PositiveIntegerField()
+    peak_territory_share = models.FloatField()
+    final_territory = models.PositiveIntegerField()
+    peak_strength = models.PositiveIntegerField()
+    production_captured = models.PositiveIntegerField()
+    cap_losses = models.PositiveIntegerField()
+    first_contact_frame = models.PositiveIntegerField(null=True)
+    damage_dealt = models.PositiveIntegerField()
+    damage_taken = models.PositiveIntegerField()
+    environment_damage = models.PositiveIntegerField()
+    overkill_damage = models.PositiveIntegerField()
+    territory_curve = models.JSONField()
+    strength_curve = models.JSONField()
+
+    created_at = CreationDateTimeField()
+
+    class Meta:
+        verbose_name_plural = "match stats"
+        indexes = [models.Index(fields=["bot", "match"], name="matchstats_bot_match")]
+
+    def __str__(self):
+        return f"{self.bot_id} in {self.match_id}"
+
+
+# a player in a match, as (bot_id, docker_image, rank)
+Player = tuple[int, str, int]
+
+
+class BotActivity(models.Model):
+    """
+    How many matches a bot played with an image and when it last did, kept
+    current as matches are recorded so seed selection never has to count
+    match results.
+    """
+
+    bot = models.ForeignKey(Bot, related_name="activity", on_delete=models.CASCADE)
+    docker_image = models.CharField(max_length=2000)
+    match_count = models.PositiveIntegerField(default=0)
+    last_match_date = models.DateTimeField(null=True)
+
+    class Meta:
+        verbose_name_plural = "bot activity"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bot", "docker_image"], name="unique_bot_activity"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.bot_id} with {self.docker_image}"
+
+    @staticmethod
+    def tally(
+        matches: Iterable[tuple[datetime, Collection[Player]]]
+    ) -> dict[tuple[int, str], tuple[int, datetime]]:
+        """
+        The match count and last match date of every bot and image playing
+        in ``matches``, given as their date and players.
+        """
+        counts = {}
+        for date, players in matches:
+            for bot_id, docker_image, _ in players:
+                count, last_date = counts.get((bot_id, docker_image), (0, date))
+                counts[(bot_id, docker_image)] = (count + 1, max(last_date, date))
+        return counts
+
+    @staticmethod
+    def add(counts: dict[tuple[int, str], tuple[int, datetime]]):
+        """
+        Adds ``counts`` from ``tally`` to the rows in place, creating those
+        that are missing. The bots must be locked, as they are while matches
+        are recorded.
+        """
+        if not counts:
+            return
+
+        counts = dict(counts)
+        existing = BotActivity.objects.filter(
+            bot__in={bot_id for bot_id, _ in counts}
+        ).values_list("bot", "docker_image")
+        for bot_id, docker_image in list(existing):
+            count = counts.pop((bot_id, docker_image), None)
+            if count is None:
+                continue
+            match_count, last_match_date = count
+            date = Value(last_match_date, output_field=models.DateTimeField())
+            BotActivity.objects.filter(bot=bot_id, docker_image=docker_image).update(
+                match_count=F("match_count") + match_count,
+                # null is the greatest on some databases
+                last_match_date=Greatest(Coalesce("last_match_date", date), date),
+            )
+
+        BotActivity.objects.bulk_create(
+            BotActivity(
+                bot_id=bot_id,
+                docker_image=docker_image,
+                match_count=match_count,
+                last_match_date=last_match_date,
+            )
+            for (bot_id, docker_image), (match_count, last_match_date) in counts.items()
+        )
+
+    @staticmethod
+    def refresh(bot_ids: Optional[Collection[int]] = None):
+        """
+        Recounts the matches of every image of ``bot_ids``, or of every bot,
+        from their match results.
+        """
+        results = MatchResult.objects.all()
+        if bot_ids is not None:
+            results = results.filter(bot__in=bot_ids)
+
+        BotActivity.objects.bulk_create(
+            [
+                BotActivity(
+                    bot_id=row["bot"],
+                    docker_image=row["docker_image"],
+                    match_count=row["match_count"],
+                    last_match_date=row["last_match_date"],
+                )
+                for row in results.values("bot", "docker_image")
+                .annotate(match_count=Count("pk"), last_match_date=Max("match__date"))
+                .order_by()
+            ],
+            update_conflicts=True,
+            unique_fields=["bot", "docker_image"],
+            update_fields=["match_count", "last_match_date"],
+        )
+
+
+class RatingPoint(models.Model):
+    """
+    A bot's rating at the end of an hour it played in. Points are appended
+    as matches are recorded, so a bot's rating chart is read from here
+    instead of from all of its match results.
+    """
+
+    bot = models.ForeignKey(Bot, related_name="rating_points", on_delete=models.CASCADE)
+    time = models.DateTimeField()
+    # date of the match the rating is from
+    date = models.DateTimeField()
+    mu = models.FloatField()
+    sigma = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["bot", "time"], name="unique_bot_time")
+        ]
+
+    def __str__(self):
+        return f"{self.bot_id} at {self.time.isoformat()}"
+
+    @staticmethod
+    def bucket(date: datetime) -> datetime:
+        """The start of the hour ``date`` falls in."""
+        return date.replace(minute=0, second=0, microsecond=0)
+
+    @staticmethod
+    def append(points: Collection["RatingPoint"]):
+        """
+        Saves ``points``, the one from the latest match of each bot and hour
+        winning, over saved points too. Matches can be recorded out of date
+        order, and a point from an older one never replaces a newer one.
+        """
+        latest = {}
+        for point in points:
+            key = (point.bot_id, point.time)
+            if key not in latest or point.date >= latest[key].date:
+                latest[key] = point
+        if not latest:
+            return
+
+        saved = RatingPoint.objects.filter(
+            bot_id__in={bot_id for bot_id, _ in latest},
+            time__in={time for _, time in latest},
+        ).values_list("bot_id", "time", "date")
+        for bot_id, time, date in saved:
+            point = latest.get((bot_id, time))
+            if point is not None and point.date < date:
+                del latest[(bot_id, time)]
+
+        RatingPoint.objects.bulk_create(
+            latest.values(),
+            update_conflicts=True,
+            unique_fields=["bot", "time"],
+            update_fields=["date", "mu", "sigma"],
+        )
+
+    @staticmethod
+    def rebuild(batch_size: int = 5000):
+        """Recomputes every point from the match results."""
+        RatingPoint.objects.all().delete()
+        points = []
+        results = (
+            MatchResult.objects.filter(match__date__isnull=False)
+            .order_by("match__date", "match_id")
+            .values_list("bot_id", "match__date", "mu", "sigma")
+        )
+        for bot_id, date, mu, sigma in results.iterator(chunk_size=batch_size):
+            points.append(
+                RatingPoint(
+                    bot_id=bot_id,
+                    time=RatingPoint.bucket(date),
+                    date=date,
+                    mu=mu,
+                    sigma=sigma,
+                )
+            )
+            if len(points) >= batch_size:
+                RatingPoint.append(points)
+                points = []
+        RatingPoint.append(points)
+
+
+class HeadToHead(models.Model):
+    """
+    How a bot did against another in the matches they played together, by
+    the image each played with. Every pair is kept both ways round, so a
+    bot's record against anyone is a lookup on its own side. Records are
+    added to as matches are recorded, instead of pairing up match results.
+    """
+
+    bot = models.ForeignKey(Bot, related_name="head_to_head", on_delete=models.CASCADE)
+    docker_image = models.CharField(max_length=2000)
+    opponent = models.ForeignKey(Bot, related_name="+", on_delete=models.CASCADE)
+    opponent_docker_image = models.CharField(max_length=2000)
+    games = models.PositiveIntegerField(default=0)
+    # games the bot finished ahead of the opponent
+    wins = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "head to head"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bot", "docker_image", "opponent", "opponent_docker_image"],
+                name="unique_head_to_head",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.bot_id} against {self.opponent_id}"
+
+    @staticmethod
+    def tally(matches: Iterable[Collection[Player]]) -> dict[tuple, list[int]]:
+        """
+        The games and wins of every ordered pair of players in ``matches``,
+        keyed by (bot_id, docker_image, opponent_id, opponent_docker_image).
+        """
+        counts = defaultdict(lambda: [0, 0])
+        for players in matches:
+            for (bot_id, docker_image, rank), (
+                opponent_id,
+                opponent_docker_image,
+                opponent_rank,
+            ) in itertools.permutations(players, 2):
+                count = counts[
+                    (bot_id, docker_image, opponent_id, opponent_docker_image)
+                ]
+                count[0] += 1
+                count[1] += rank < opponent_rank
+        return counts
+
+    @staticmethod
+    def _records(counts: dict[tuple, list[int]]) -> Iterable["HeadToHead"]:
+        for (bot_id, docker_image, opponent_id, opponent_docker_image), (
+            games,
+            wins,
+        ) in counts.items():
+            yield HeadToHead(
+                bot_id=bot_id,
+                docker_image=docker_image,
+                opponent_id=opponent_id,
+                opponent_docker_image=opponent_docker_image,
+                games=games,
+                wins=wins,
+            )
+
+    @staticmethod
+    def add(counts: dict[tuple, list[int]]):
+        """
+        Adds ``counts`` from ``tally`` to the records. The bots must be locked,
+        as they are while matches are recorded.
+        """
+        if not counts:
+            return
+
+        counts = dict(counts)
+        # only the records of the images being added to
+        sides = Q()
+        for bot_id, docker_image in {key[:2] for key in counts}:
+            sides |= Q(bot_id=bot_id, docker_image=docker_image)
+        opponent_ids = {key[2] for key in counts}
+        existing = []
+        for record in HeadToHead.objects.filter(sides, opponent__in=opponent_ids):
+            count = counts.pop(
+                (
+                    record.bot_id,
+                    record.docker_image,
+                    record.opponent_id,
+                    record.opponent_docker_image,
+                ),
+                None,
+            )
+            if count is not None:
+                record.games += count[0]
+                record.wins += count[1]
+                existing.append(record)
+
+        HeadToHead.objects.bulk_update(existing, ["games", "wins"])
+        HeadToHead.objects.bulk_create(HeadToHead._records(counts))
+
+    @staticmethod
+    def rebuild(batch_size: int = 5000):
+        """
+        Recounts every record from the match results, streamed a match at a
+        time, so memory is bounded by the number of records, not matches.
+        """
+        results = (
+            MatchResult.objects.order_by("match_id")
+            .values_list("match_id", "bot_id", "docker_image", "rank")
+            .iterator(chunk_size=batch_size)
+        )
+        counts = HeadToHead.tally(
+            [player[1:] for player in players]
+            for _, players in itertools.groupby(results, key=itemgetter(0))
+        )
+
+        HeadToHead.objects.all().delete()
+        HeadToHead.objects.bulk_create(
+            HeadToHead._records(counts), batch_size=batch_size
+        )
+
+
+# sent with the ids of the bots whose ratings or images changed, or None for all
+ratings_updated = Signal()
+
+
+class LeaderboardEntry(models.Model):
+    """
+    A listed bot (enabled, with a docker image) as the leaderboard shows it.
+    Entries are refreshed whenever a bot or its rating changes, so showing
+    the leaderboard never has to rank bots or count their matches.
+    """
+
+    bot = models.OneToOneField(
+        Bot,
+        primary_key=True,
+        related_name="leaderboard_entry",
+        on_delete=models.CASCADE,
+    )
+    name = models.CharField(max_length=150)
+    rank = models.PositiveIntegerField()
+    score = models.FloatField()
+    mu = models.FloatField()
+    sigma = models.FloatField()
+    match_count = models.PositiveIntegerField()
+    peak_territory_share = models.FloatField(null=True)
+    # matches peak_territory_share is the average of, those with statistics
+    stats_count = models.PositiveIntegerField(default=0)
+
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = "leaderboard"
+        ordering = ["rank", "-mu", "name"]
+        indexes = [
+            models.Index(fields=["rank", "-mu", "name"], name="leaderboard_order"),
+            models.Index(fields=["updated_at"], name="leaderboard_updated"),
+        ]
+
+    def __str__(self):
+        return f"{self.rank}. {self.name}"
+
+    @staticmethod
+    def refresh(bot_ids: Optional[Collection[int]] = None):
+        """
+        Recomputes the entries of ``bot_ids``, or of every bot, then the ranks
+        of all entries. Only the given bots' match results are counted.
+        """
+        now = timezone.now()
+        LeaderboardEntry._recount(bot_ids, now)
+        LeaderboardEntry.rerank(now)
+        ratings_updated.send(sender=LeaderboardEntry, bot_ids=bot_ids)
+
+    @staticmethod
+    def _recount(bot_ids: Optional[Collection[int]], now: datetime):
+        entries = LeaderboardEntry.objects.all()
+        bots = Bot.objects.all()
+        if bot_ids is not None:
+            entries = entries.filter(pk__in=bot_ids)
+            bots = bots.filter(pk__in=bot_ids)
+        listed = bots.filter(enabled=True).exclude(docker_image__exact="")
+
+        entries.exclude(pk__in=listed.values("pk")).delete()
+
+        totals = {row["bot"]: row for row in LeaderboardEntry.totals(listed)}
+        fields = ["name", "score", "mu", "sigma", "match_count"]
+        fields += ["peak_territory_share", "stats_count"]
+        LeaderboardEntry.objects.bulk_create(
+            [
+                LeaderboardEntry(
+                    bot=bot,
+                    name=bot.name,
+                    rank=0,
+                    score=bot.score(),
+                    mu=bot.mu,
+                    sigma=bot.sigma,
+                    match_count=totals.get(bot.pk, {}).get("match_count", 0),
+                    peak_territory_share=totals.get(bot.pk, {}).get(
+                        "peak_territory_share"
+                    ),
+                    stats_count=totals.get(bot.pk, {}).get("stats_count", 0),
+                    updated_at=now,
+                )
+                for bot in listed.select_related("user")
+            ],
+            update_conflicts=True,
+            unique_fields=["bot"],
+            update_fields=fields + ["updated_at"],
+        )
+
+    @staticmethod
+    def add(bots: Collection[Bot], counts: dict[int, tuple[int, int, float]]):
+        """
+        Updates the entries of ``bots`` with their ratings and adds ``counts``
+        of their current images' new matches to them, as (matches, matches
+        with statistics, sum of their peak territory shares) by bot id, then
+        reranks all entries. Entries that are missing or shouldn't be listed
+        are recomputed by ``refresh``.
+        """
+        now = timezone.now()
+        recount = []
+        for bot in bots:
+            matches, with_stats, share_sum = counts.get(bot.pk, (0, 0, 0.0))
+            values = dict(
+                score=bot.score(),
+                mu=bot.mu,
+                sigma=bot.sigma,
+                match_count=F("match_count") + matches,
+                updated_at=now,
+            )
+            if with_stats:
+                # updates read the values from before the update
+                values["peak_territory_share"] = (
+                    Coalesce("peak_territory_share", 0.0) * F("stats_count") + share_sum
+                ) / (F("stats_count") + with_stats)
+                values["stats_count"] = F("stats_count") + with_stats
+            if (
+                not bot.enabled
+                or not bot.docker_image
+                or not LeaderboardEntry.objects.filter(pk=bot.pk).update(**values)
+            ):
+                recount.append(bot.pk)
+
+        if recount:
+            LeaderboardEntry._recount(recount, now)
+        LeaderboardEntry.rerank(now)
+        ratings_updated.send(sender=LeaderboardEntry, bot_ids=[bot.pk for bot in bots])
+
+    @staticmethod
+    def totals(bots: QuerySet) -> QuerySet:
+        """
+        Match count and average peak territory, with the number of matches
+        it is the average of, of ``bots``' current images.
+        """
+        return (
+            MatchResult.objects.filter(
+                bot__in=bots, docker_image=F("bot__docker_image")
+            )
+            .values("bot")
+            .annotate(
+                match_count=Count("pk"),
+                peak_territory_share=Avg("stats__peak_territory_share"),
+                stats_count=Count("stats"),
+            )
+        )
+
+    @staticmethod
+    def rerank(now: datetime):
+        """Ranks entries by score, tied scores sharing a rank."""
+        changed = []
+        rank, previous_score = 0, None
+        for position, entry in enumerate(
+            LeaderboardEntry.objects.order_by("-score").only("pk", "score", "rank"),
+            start=1,
+        ):
+            if entry.score != previous_score:
+                rank, previous_score = position, entry.score
+            if entry.rank != rank:
+                entry.rank = rank
+                entry.updated_at = now
+                changed.append(entry)
+        LeaderboardEntry.objects.bulk_update(changed, ["rank", "updated_at"])
+
+    @staticmethod
+    def cached() -> list["LeaderboardEntry"]:
+        """
+        The whole leaderboard, from the cache when it hasn't changed. The cache
+        key is derived from the table, so refreshes made by other processes
+        are picked up without having to share the cache with them.
+        """
+        version = LeaderboardEntry.objects.aggregate(
+            count=Count("pk"), updated_at=Max("updated_at")
+        )
+        if version["updated_at"] is None:
+            return []
+
+        key = f"leaderboard:{version['count']}:{version['updated_at'].timestamp()}"
+        entries = cache.get(key)
+        if entries is None:
+            entries = list(LeaderboardEntry.objects.select_related("bot__user"))
+            cache.set(key, entries, settings.LEADERBOARD_CACHE_TIMEOUT)
+        return entries
+
+
+class RatingCheckpoint(models.Model):
+    match = models.ForeignKey(Match, related_name="+", on_delete=models.CASCADE)
+    date = models.DateTimeField()
+    match_count = models.PositiveIntegerField()
+    parameters = models.JSONField()
+    ratings = models.JSONField()
+
+    created_at = CreationDateTimeField()
+
+    class Meta:
+        ordering = ["-date", "-match"]
+
+    def __str__(self):
+        return f"{self.date.isoformat()} ({self.match_count} matches)"
+
+
+class MatchUpload(models.Model):
+    """
+    A match result tarball waiting to be recorded by the processuploads
+    worker. Uploads are keyed on the match uuid so a retried POST never
+    creates a second job for the same match.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        PROCESSING = "processing"
+        DONE = "done"
+        FAILED = "failed"
+
+    MAX_ATTEMPTS = 5
+
+    uuid = models.UUIDField(unique=True)
+    archive = models.FileField(upload_to="uploads", null=True)
+    status = models.CharField(
+        max_length=20, choices=Status.choices, default=Status.PENDING
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    available_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    match = models.ForeignKey(
+        Match, related_name="+", null=True, blank=True, on_delete=models.SET_NULL
+    )
+
+    created_at = CreationDateTimeField()
+    updated_at = ModificationDateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "available_at"], name="upload_status_available"
+            )
+        ]
+
+    def __str__(self):
+        return str(self.uuid)
+
+    @staticmethod
+    def enqueue(file, match_id: UUID) -> "MatchUpload":
+        with transaction.atomic():
+            upload, created = MatchUpload.objects.select_for_update().get_or_create(
+                uuid=match_id, defaults=dict(archive=file)
+            )
+            if not created and upload.status == MatchUpload.Status.FAILED:
+                upload.archive.delete(save=False)
+                upload.archive = file
+                upload.status = MatchUpload.Status.PENDING
+                upload.attempts = 0
+                upload.error = ""
+                upload.available_at = timezone.now()
+                upload.save()
+
+        return upload
+
+    @staticmethod
+    def claim(limit: int, lock_timeout: timedelta) -> list["MatchUpload"]:
+        """
+        Marks up to ``limit`` runnable uploads as processing and returns them.
+        Uploads stuck in processing longer than ``lock_timeout`` (a worker
+        died) are claimed again.
+        """
+        now = timezone.now()
+        with transaction.atomic():
+            uploads = list(
+                MatchUpload.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=MatchUpload.Status.PENDING, available_at__lte=now)
+                    | Q(
+                        status=MatchUpload.Status.PROCESSING,
+                        locked_at__lt=now - lock_timeout,
+                    )
+                )
+                .order_by("available_at")[:limit]
+            )
+            for upload in uploads:
+                upload.status = MatchUpload.Status.PROCESSING
+                upload.locked_at = now
+                upload.attempts += 1
+            MatchUpload.objects.bulk_update(
+                uploads, ["status", "locked_at", "attempts"]
+            )
+
+        return uploads
+
+    def succeed(self, match: Match):
+        self.status = MatchUpload.Status.DONE
+        self.match = match
+        self.error = ""
+        self.locked_at = None
+        self.archive.delete(save=False)
+        self.save()
+
+    def fail(self, error: Exception):
+        self.error = f"{type(error).__name__}: {error}"
+        self.locked_at = None
+        if self.attempts >= MatchUpload.MAX_ATTEMPTS:
+            self.status = MatchUpload.Status.FAILED
+        else:
+            self.status = MatchUpload.Status.PENDING
+            self.available_at = timezone.now() + timedelta(
+                seconds=min(10 * 2**self.attempts, 3600)
+            )
+        self.save()
+
+
+class MetricSeries(models.Model):
+    """
+    The value of a metric series in one process, saved periodically by
+    tournament.metrics so the site can serve every process' metrics.
+    """
+
+    process = models.CharField(max_length=255)
+    name = models.CharField(max_length=200)
+    # the values of the series' labels, as a JSON list
+    labels = models.CharField(max_length=1000)
+    value = models.JSONField()
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name_plural = "metric series"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["process", "name", "labels"], name="unique_metric_series"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.name}{self.labels} in {self.process}"
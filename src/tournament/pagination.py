@@ -0,0 +1,135 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are read with ``WHERE (date, id) < (cursor) ORDER BY date, id LIMIT n``
+instead of ``OFFSET``, so a page deep into a long history costs as much as
+the first one, and nothing is counted.
+"""
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from typing import Optional, Sequence
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+from django.http import Http404
+
+
+def _encode(values: list) -> str:
+    values = [v.isoformat() if isinstance(v, (date, datetime)) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError):
+        raise Http404("Invalid page cursor")
+    if not isinstance(values, list):
+        raise Http404("Invalid page cursor")
+    return values
+
+
+class CursorPage:
+    def __init__(
+        self, paginator: "CursorPaginator", object_list: list, has_next, has_previous
+    ):
+        self.paginator = paginator
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self) -> bool:
+        return self._has_next
+
+    def has_previous(self) -> bool:
+        return self._has_previous
+
+    def has_other_pages(self) -> bool:
+        return self._has_next or self._has_previous
+
+    def next_cursor(self) -> Optional[str]:
+        if not self._has_next:
+            return None
+        return self.paginator.cursor(self.object_list[-1])
+
+    def previous_cursor(self) -> Optional[str]:
+        if not self._has_previous:
+            return None
+        return self.paginator.cursor(self.object_list[0])
+
+
+class CursorPaginator:
+    """
+    Paginates ``queryset`` in the order of ``keys``, a list of ordering
+    expressions such as ``["-date", "-id"]``. The keys must be non-null and
+    together unique, and should be covered by an index.
+    """
+
+    def __init__(self, queryset: QuerySet, per_page: int, keys: Sequence[str]):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.keys = [key.lstrip("-") for key in keys]
+        self.descending = [key.startswith("-") for key in keys]
+
+    def cursor(self, obj) -> str:
+        values = []
+        for key in self.keys:
+            value = obj
+            for attr in key.split("__"):
+                value = getattr(value, attr)
+            values.append(value)
+        return _encode(values)
+
+    def _ordering(self, reverse: bool) -> list[str]:
+        return [
+            f"-{key}" if descending != reverse else key
+            for key, descending in zip(self.keys, self.descending)
+        ]
+
+    def _beyond(self, cursor: str, reverse: bool) -> Q:
+        """Rows after the cursor in the page order, or before it if
+        ``reverse``."""
+        values = _decode(cursor)
+        if len(values) != len(self.keys):
+            raise Http404("Invalid page cursor")
+
+        condition = Q()
+        for i, (key, descending) in enumerate(zip(self.keys, self.descending)):
+            lookup = "lt" if descending != reverse else "gt"
+            condition |= Q(
+                **{k: v for k, v in zip(self.keys[:i], values[:i])},
+                **{f"{key}__{lookup}": values[i]},
+            )
+        return condition
+
+    def page(
+        self, after: Optional[str] = None, before: Optional[str] = None
+    ) -> CursorPage:
+        """The page following the ``after`` cursor, or preceding ``before``,
+        or the first page."""
+        reverse = before is not None and after is None
+        queryset = self.queryset.order_by(*self._ordering(reverse))
+        cursor = before if reverse else after
+        if cursor is not None:
+            try:
+                queryset = queryset.filter(self._beyond(cursor, reverse))
+            except (ValidationError, TypeError, ValueError):
+                raise Http404("Invalid page cursor")
+
+        object_list = list(queryset[: self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[: self.per_page]
+
+        if reverse:
+            object_list.reverse()
+            return CursorPage(self, object_list, True, has_more)
+        return CursorPage(self, object_list, has_more, cursor is not None)
@@ -0,0 +1,431 @@
+"""
+Float64 TrueSkill engine.
+
+This runs the same factor graph schedule as ``trueskill.TrueSkill.rate`` but
+keeps every message in NumPy arrays so that many independent matches can be
+rated with one pass through the schedule. It reads its parameters from the
+global ``trueskill`` environment configured in ``apps.py``; only the backend
+(mpmath) is ignored.
+"""
+import math
+from collections import defaultdict
+from collections.abc import Hashable, Iterable, Mapping, MutableMapping, Sequence
+from typing import Optional
+
+from django.conf import settings
+
+import numpy as np
+import trueskill
+
+from tournament.exceptions import RatingToleranceError
+
+SQRT2 = math.sqrt(2)
+SQRT2PI = math.sqrt(2 * math.pi)
+
+# below this the normal cdf underflows, use the asymptotic Mills ratio instead
+ASYMPTOTIC_CUTOFF = -30.0
+
+_erfc = np.vectorize(math.erfc, otypes=[np.float64])
+
+
+def _pdf(x):
+    return np.exp(-(x**2) / 2) / SQRT2PI
+
+
+def _cdf(x):
+    return _erfc(-x / SQRT2) / 2
+
+
+def _v_win(x):
+    with np.errstate(divide="ignore", invalid="ignore", under="ignore"):
+        v = _pdf(x) / _cdf(x)
+        x2 = x**2
+        asymptotic = -x / (1 - 1 / x2 + 3 / x2**2 - 15 / x2**3)
+    return np.where(x < ASYMPTOTIC_CUTOFF, asymptotic, v)
+
+
+def _w_win(x, v):
+    return v * (v + x)
+
+
+def _v_draw(diff, draw_margin):
+    abs_diff = np.abs(diff)
+    a, b = draw_margin - abs_diff, -draw_margin - abs_diff
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = _cdf(a) - _cdf(b)
+        v = np.where(denom > 0, (_pdf(b) - _pdf(a)) / denom, a)
+    return v * np.where(diff < 0, -1, 1)
+
+
+def _w_draw(diff, draw_margin):
+    abs_diff = np.abs(diff)
+    a, b = draw_margin - abs_diff, -draw_margin - abs_diff
+    with np.errstate(divide="ignore", invalid="ignore"):
+        denom = _cdf(a) - _cdf(b)
+        v = _v_draw(abs_diff, draw_margin)
+        return v**2 + (a * _pdf(a) - b * _pdf(b)) / denom
+
+
+def _mu(pi, tau):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(pi > 0, tau / pi, 0.0)
+
+
+def _message(mu, pi_inv):
+    """Natural parameters of N(mu, pi_inv), with pi_inv == inf meaning flat."""
+    with np.errstate(divide="ignore"):
+        pi = np.where(np.isinf(pi_inv), 0.0, 1 / pi_inv)
+    return pi, pi * mu
+
+
+def _inv(pi):
+    with np.errstate(divide="ignore"):
+        return np.where(pi > 0, 1 / pi, np.inf)
+
+
+def _delta(old_pi, old_tau, new_pi, new_tau):
+    return np.maximum(np.abs(new_tau - old_tau), np.sqrt(np.abs(new_pi - old_pi)))
+
+
+class _Schedule:
+    """
+    Message state for a stack of matches that share a shape: the same team
+    sizes in rank order and the same tie pattern between neighbouring teams.
+    Arrays are indexed ``[match, player]``, ``[match, team]`` or
+    ``[match, diff]``.
+    """
+
+    def __init__(self, mu, sigma, team_sizes, ties, env, min_delta):
+        self.env = env
+        self.min_delta = min_delta
+        self.team_sizes = team_sizes
+        self.ties = ties
+        self.starts = np.cumsum([0] + list(team_sizes[:-1]))
+        self.team_of = np.repeat(np.arange(len(team_sizes)), team_sizes)
+
+        tau = float(env.tau)
+        beta = float(env.beta)
+        self.beta2 = beta**2
+
+        # rating layer and performance layer (gray arrows)
+        skill_var = sigma**2 + tau**2
+        self.skill_pi = 1 / skill_var
+        self.skill_tau = mu * self.skill_pi
+        self.perf_mu = mu
+        self.perf_var = skill_var + self.beta2
+
+        # team performance layer
+        self.team_mu = np.add.reduceat(self.perf_mu, self.starts, axis=1)
+        self.team_var = np.add.reduceat(self.perf_var, self.starts, axis=1)
+        self.prior_pi = 1 / self.team_var
+        self.prior_tau = self.team_mu * self.prior_pi
+        self.t_pi = self.prior_pi.copy()
+        self.t_tau = self.prior_tau.copy()
+
+        shape = (mu.shape[0], len(team_sizes) - 1)
+        self.left_pi, self.left_tau = np.zeros(shape), np.zeros(shape)
+        self.right_pi, self.right_tau = np.zeros(shape), np.zeros(shape)
+        self.down_pi, self.down_tau = np.zeros(shape), np.zeros(shape)
+        self.trunc_pi, self.trunc_tau = np.zeros(shape), np.zeros(shape)
+
+        self.draw_margins = []
+        for j in range(shape[1]):
+            if callable(env.draw_probability):
+                draw_probability = env.draw_probability(
+                    trueskill.Rating(
+                        float(self.team_mu[0, j]), math.sqrt(self.team_var[0, j])
+                    ),
+                    trueskill.Rating(
+                        float(self.team_mu[0, j + 1]),
+                        math.sqrt(self.team_var[0, j + 1]),
+                    ),
+                    env,
+                )
+            else:
+                draw_probability = env.draw_probability
+            size = team_sizes[j] + team_sizes[j + 1]
+            self.draw_margins.append(
+                float(trueskill.calc_draw_margin(draw_probability, size, env))
+            )
+
+        self.active = np.ones(shape[0], dtype=bool)
+
+    def _assign(self, target, j, value):
+        target[:, j] = np.where(self.active, value, target[:, j])
+
+    def _cavity(self, k, msg_pi, msg_tau, j):
+        return self.t_pi[:, k] - msg_pi[:, j], self.t_tau[:, k] - msg_tau[:, j]
+
+    def _set_team_message(self, k, msg_pi, msg_tau, j, pi, tau):
+        pi = np.where(self.active, pi, msg_pi[:, j])
+        tau = np.where(self.active, tau, msg_tau[:, j])
+        self.t_pi[:, k] += pi - msg_pi[:, j]
+        self.t_tau[:, k] += tau - msg_tau[:, j]
+        msg_pi[:, j] = pi
+        msg_tau[:, j] = tau
+
+    def diff_down(self, j):
+        a_pi, a_tau = self._cavity(j, self.left_pi, self.left_tau, j)
+        b_pi, b_tau = self._cavity(j + 1, self.right_pi, self.right_tau, j)
+        pi, tau = _message(_mu(a_pi, a_tau) - _mu(b_pi, b_tau), _inv(a_pi) + _inv(b_pi))
+        self._assign(self.down_pi, j, pi)
+        self._assign(self.down_tau, j, tau)
+
+    def trunc_up(self, j):
+        c, d = self.down_pi[:, j], self.down_tau[:, j]
+        sqrt_c = np.sqrt(c)
+        diff, draw_margin = d / sqrt_c, self.draw_margins[j] * sqrt_c
+
+        if self.ties[j]:
+            v = _v_draw(diff, draw_margin)
+            w = _w_draw(diff, draw_margin)
+        else:
+            x = diff - draw_margin
+            v = _v_win(x)
+            w = _w_win(x, v)
+
+        denom = 1 - w
+        pi, tau = c / denom, (d + sqrt_c * v) / denom
+        old_pi, old_tau = c + self.trunc_pi[:, j], d + self.trunc_tau[:, j]
+        self._assign(self.trunc_pi, j, pi - c)
+        self._assign(self.trunc_tau, j, tau - d)
+        return np.where(self.active, _delta(old_pi, old_tau, pi, tau), 0.0)
+
+    def diff_up_right(self, j):
+        # t[j + 1] = t[j] - d[j]
+        a_pi, a_tau = self._cavity(j, self.left_pi, self.left_tau, j)
+        d_pi, d_tau = self.trunc_pi[:, j], self.trunc_tau[:, j]
+        pi, tau = _message(_mu(a_pi, a_tau) - _mu(d_pi, d_tau), _inv(a_pi) + _inv(d_pi))
+        self._set_team_message(j + 1, self.right_pi, self.right_tau, j, pi, tau)
+
+    def diff_up_left(self, j):
+        # t[j] = d[j] + t[j + 1]
+        b_pi, b_tau = self._cavity(j + 1, self.right_pi, self.right_tau, j)
+        d_pi, d_tau = self.trunc_pi[:, j], self.trunc_tau[:, j]
+        pi, tau = _message(_mu(d_pi, d_tau) + _mu(b_pi, b_tau), _inv(d_pi) + _inv(b_pi))
+        self._set_team_message(j, self.left_pi, self.left_tau, j, pi, tau)
+
+    def run(self):
+        diffs = len(self.team_sizes) - 1
+
+        for _ in range(10):
+            if diffs == 1:
+                self.diff_down(0)
+                delta = self.trunc_up(0)
+            else:
+                delta = np.zeros_like(self.active, dtype=float)
+                for j in range(diffs - 1):
+                    self.diff_down(j)
+                    delta = np.maximum(delta, self.trunc_up(j))
+                    self.diff_up_right(j)
+                for j in range(diffs - 1, 0, -1):
+                    self.diff_down(j)
+                    delta = np.maximum(delta, self.trunc_up(j))
+                    self.diff_up_left(j)
+
+            self.active &= delta > self.min_delta
+            if not self.active.any():
+                break
+
+        self.active[:] = True
+        self.diff_up_left(0)
+        self.diff_up_right(diffs - 1)
+
+        # team performance -> player performance -> skill
+        cavity_pi = self.t_pi - self.prior_pi
+        cavity_tau = self.t_tau - self.prior_tau
+        team_mu = _mu(cavity_pi, cavity_tau)[:, self.team_of]
+        team_var = (1 / cavity_pi)[:, self.team_of]
+
+        others_mu = self.team_mu[:, self.team_of] - self.perf_mu
+        others_var = self.team_var[:, self.team_of] - self.perf_var
+        msg_var = team_var + others_var + self.beta2
+        msg_mu = team_mu - others_mu
+
+        pi = self.skill_pi + 1 / msg_var
+        tau = self.skill_tau + msg_mu / msg_var
+        if not (np.all(np.isfinite(tau)) and np.all(pi > 0)):
+            raise FloatingPointError("Rating update produced non-finite values.")
+
+        return tau / pi, np.sqrt(1 / pi)
+
+
+def _normalize(rating_groups, ranks):
+    if len(rating_groups) < 2:
+        raise ValueError("Need multiple rating groups")
+    if not all(rating_groups):
+        raise ValueError("Each group must contain multiple ratings")
+
+    if isinstance(rating_groups[0], dict):
+        keys = [tuple(group.keys()) for group in rating_groups]
+        groups = [tuple(group.values()) for group in rating_groups]
+    else:
+        keys = None
+        groups = [tuple(group) for group in rating_groups]
+
+    if ranks is None:
+        ranks = range(len(groups))
+    elif len(ranks) != len(groups):
+        raise ValueError("Wrong ranks")
+
+    order = sorted(range(len(groups)), key=lambda x: ranks[x])
+    sorted_ranks = [ranks[x] for x in order]
+    shape = (
+        tuple(len(groups[x]) for x in order),
+        tuple(a == b for a, b in zip(sorted_ranks, sorted_ranks[1:])),
+    )
+    flat = [rating for x in order for rating in groups[x]]
+    return groups, keys, order, shape, flat
+
+
+def rate_many(
+    matches: Sequence[tuple[Sequence, Optional[Sequence[int]]]],
+    min_delta: float = trueskill.DELTA,
+    env: Optional[trueskill.TrueSkill] = None,
+) -> list:
+    """
+    Rates independent matches, each given as ``(rating_groups, ranks)`` in the
+    form accepted by ``trueskill.rate``. Results are returned in the same order
+    and structure as ``trueskill.rate`` would return them one by one.
+    """
+    if env is None:
+        env = trueskill.global_env()
+
+    normalized = [_normalize(groups, ranks) for groups, ranks in matches]
+
+    by_shape = defaultdict(list)
+    for index, (_, _, _, shape, _) in enumerate(normalized):
+        by_shape[shape].append(index)
+
+    results = [None] * len(normalized)
+    for (team_sizes, ties), indexes in by_shape.items():
+        mu = np.array(
+            [[float(r.mu) for r in normalized[x][4]] for x in indexes], dtype=np.float64
+        )
+        sigma = np.array(
+            [[float(r.sigma) for r in normalized[x][4]] for x in indexes],
+            dtype=np.float64,
+        )
+        new_mu, new_sigma = _Schedule(mu, sigma, team_sizes, ties, env, min_delta).run()
+
+        for row, index in enumerate(indexes):
+            groups, keys, order, _, _ = normalized[index]
+            rated = [None] * len(groups)
+            position = 0
+            for team in order:
+                size = len(groups[team])
+                rated[team] = tuple(
+                    trueskill.Rating(float(m), float(s))
+                    for m, s in zip(
+                        new_mu[row, position : position + size],
+                        new_sigma[row, position : position + size],
+                    )
+                )
+                position += size
+
+            if keys is None:
+                results[index] = rated
+            else:
+                results[index] = [dict(zip(k, g)) for k, g in zip(keys, rated)]
+
+    return results
+
+
+def rate(
+    rating_groups: Sequence,
+    ranks: Optional[Sequence[int]] = None,
+    min_delta: float = trueskill.DELTA,
+    env: Optional[trueskill.TrueSkill] = None,
+) -> list:
+    """Drop in replacement for ``trueskill.rate`` (without weights)."""
+    return rate_many([(rating_groups, ranks)], min_delta=min_delta, env=env)[0]
+
+
+def rate_batch(
+    ratings: MutableMapping[Hashable, trueskill.Rating],
+    matches: Iterable[Mapping[Hashable, int]],
+    min_delta: float = trueskill.DELTA,
+    env: Optional[trueskill.TrueSkill] = None,
+) -> list[dict[Hashable, trueskill.Rating]]:
+    """
+    Rates a chronological sequence of free-for-all matches, each a mapping of
+    player to rank. ``ratings`` holds the current rating of every player and is
+    updated in place. Matches are split into waves of matches that share no
+    players, so each wave is rated in one vectorized pass while every player
+    still sees their matches in order. Returns the new ratings of each match.
+    """
+    matches = list(matches)
+    results = [None] * len(matches)
+
+    pending = list(range(len(matches)))
+    while pending:
+        wave, deferred, busy = [], [], set()
+        for index in pending:
+            players = matches[index].keys()
+            if busy.isdisjoint(players):
+                wave.append(index)
+            else:
+                deferred.append(index)
+            # a later match must not overtake an earlier one for any player
+            busy.update(players)
+
+        rated = rate_many(
+            [
+                (
+                    [{player: ratings[player]} for player in matches[index]],
+                    list(matches[index].values()),
+                )
+                for index in wave
+            ],
+            min_delta=min_delta,
+            env=env,
+        )
+
+        for index, groups in zip(wave, rated):
+            new_ratings = {}
+            for group in groups:
+                new_ratings.update(group)
+            ratings.update(new_ratings)
+            results[index] = new_ratings
+
+        pending = deferred
+
+    return results
+
+
+def check_against_reference(
+    rating_groups: Sequence,
+    ranks: Optional[Sequence[int]] = None,
+    tolerance: Optional[float] = None,
+) -> float:
+    """
+    Rates a match with both this engine and ``trueskill.rate`` (the mpmath
+    backend) and returns the largest absolute difference in mu or sigma.
+    Raises ``RatingToleranceError`` if it exceeds ``tolerance``, which
+    defaults to ``settings.RATING_ENGINE_TOLERANCE``.
+    """
+    if tolerance is None:
+        tolerance = settings.RATING_ENGINE_TOLERANCE
+
+    ours = rate(rating_groups, ranks)
+    reference = trueskill.rate(rating_groups, ranks)
+
+    deviation = 0.0
+    for our_group, reference_group in zip(ours, reference):
+        if isinstance(our_group, dict):
+            pairs = [(our_group[k], reference_group[k]) for k in our_group]
+        else:
+            pairs = zip(our_group, reference_group)
+        for our_rating, reference_rating in pairs:
+            deviation = max(
+                deviation,
+                abs(our_rating.mu - float(reference_rating.mu)),
+                abs(our_rating.sigma - float(reference_rating.sigma)),
+            )
+
+    if deviation > tolerance:
+        raise RatingToleranceError(
+            f"Rating deviates from the reference by {deviation:g} (tolerance {tolerance:g})."
+        )
+
+    return deviation
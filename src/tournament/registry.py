@@ -0,0 +1,152 @@
+"""
+Resolves docker image tags to digests, which bots are pinned to.
+
+Digests are cached for ``DOCKER_DIGEST_CACHE_TIMEOUT`` seconds, and tags
+that don't exist for ``DOCKER_DIGEST_MISSING_TIMEOUT``. Each thread keeps a
+client per repository, which holds on to its registry token, and an HTTP
+session per registry, so lookups that do reach a registry reuse both.
+"""
+import threading
+from collections.abc import Collection
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+
+import requests
+from docker_image.reference import Reference
+from dxf import DXF
+from dxf.exceptions import DXFUnauthorizedError
+
+from tournament.exceptions import (
+    HaliteError,
+    ImageNotFoundError,
+    RegistryAccessError,
+    RegistryUnavailableError,
+)
+
+PLATFORM = "linux/amd64"
+REGISTRY_TIMEOUT = 10
+# cached in place of the digest of a tag that doesn't exist
+MISSING = "missing"
+
+_local = threading.local()
+
+
+def registry_host(reference: Reference) -> str:
+    domain = reference.domain()
+    if domain == "docker.io":
+        return "registry-1.docker.io"
+    return domain
+
+
+def authenticate(dxf: DXF, response: requests.Response):
+    if dxf._host == "ghcr.io":
+        dxf.authenticate(
+            "USERNAME", settings.GITHUB_READ_PACKAGES_TOKEN, response=response
+        )
+    if dxf._host == "registry-1.docker.io":
+        dxf.authenticate(
+            settings.DOCKER_PUBLIC_READ_USERNAME,
+            settings.DOCKER_PUBLIC_READ_TOKEN,
+            response=response,
+        )
+
+
+def get_client(host: str, repository: str) -> DXF:
+    """This thread's client for ``repository``, sharing a session per host."""
+    if not hasattr(_local, "clients"):
+        _local.clients, _local.sessions = {}, {}
+
+    client = _local.clients.get((host, repository))
+    if client is None:
+        session = _local.sessions.get(host)
+        if session is None:
+            session = _local.sessions[host] = requests.Session()
+        client = DXF(host, repository, authenticate, timeout=REGISTRY_TIMEOUT)
+        # what entering the client as a context manager does, with a session
+        # that outlives it
+        client._sessions.insert(0, session)
+        _local.clients[(host, repository)] = client
+    return client
+
+
+def fetch_digest(reference: Reference) -> str:
+    """Asks the registry for the digest of ``reference``'s tag."""
+    try:
+        client = get_client(registry_host(reference), reference.path())
+        _, digest = client._get_alias(
+            reference["tag"],
+            manifest=None,
+            verify=True,
+            sizes=False,
+            get_digest=True,
+            get_dcd=True,
+            get_manifest=False,
+            platform=PLATFORM,
+            ml=True,
+        )
+    except DXFUnauthorizedError:
+        raise RegistryAccessError(
+            "I don't have read access to that registry. Try hosting somewhere else."
+        )
+    except requests.RequestException as e:
+        if e.response is not None:
+            if e.response.status_code == 404:
+                raise ImageNotFoundError("Image not found. Check your image and tag.")
+            elif e.response.status_code == 403:
+                raise RegistryAccessError(
+                    "I don't have read access to that image. Make sure it is publicly readable."
+                )
+
+        raise RegistryUnavailableError(
+            "I wasn't able to reach the registry. Check your image."
+        )
+    return digest
+
+
+def cache_key(reference: Reference) -> str:
+    return (
+        f"digest:{registry_host(reference)}:{reference.path()}:"
+        f"{reference['tag']}:{PLATFORM}"
+    )
+
+
+def resolve_digest(reference: Reference, refresh: bool = False) -> str:
+    """
+    The digest of ``reference``'s tag, from the cache unless ``refresh``.
+    Raises ``ImageNotFoundError`` for tags that don't exist.
+    """
+    key = cache_key(reference)
+    if not refresh:
+        digest = cache.get(key)
+        if digest == MISSING:
+            raise ImageNotFoundError("Image not found. Check your image and tag.")
+        if digest is not None:
+            return digest
+
+    try:
+        digest = fetch_digest(reference)
+    except ImageNotFoundError:
+        cache.set(key, MISSING, settings.DOCKER_DIGEST_MISSING_TIMEOUT)
+        raise
+    cache.set(key, digest, settings.DOCKER_DIGEST_CACHE_TIMEOUT)
+    return digest
+
+
+def resolve_digests(
+    references: Collection[Reference], refresh: bool = False, workers: int = 8
+) -> list[str | HaliteError]:
+    """
+    Resolves many references at once, returning the digest of each or the
+    error it failed with, in order.
+    """
+
+    def resolve(reference: Reference) -> str | HaliteError:
+        try:
+            return resolve_digest(reference, refresh)
+        except HaliteError as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(resolve, references))
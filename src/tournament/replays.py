@@ -0,0 +1,955 @@
+"""
+Binary replay format.
+
+A ``.hlt`` replay stores every frame as a full grid of ``[owner, strength]``
+pairs, although every frame but the first follows from the one before it,
+its moves and the productions by the rules of the game. The binary format
+(``.hltb``) stores the same replay as typed arrays:
+
+- the productions grid and the first frame
+- whether each piece moved, grouped by the piece's strength over its
+  cell's production, which bots mostly decide moving on, so that each
+  group compresses well
+- the direction of every piece that moved, and any moves from unowned cells
+- the cells where a frame differs from the one the rules predict (none, for
+  replays written by the game environment) and their owner and strength
+
+Frames are decoded by replaying the moves from the first frame with
+``next_frame``.
+
+Layout, little-endian::
+
+    magic "HLTB" | u16 format version | u16 reserved | u32 header length
+    header: utf-8 JSON with the other replay fields and the array table
+    arrays, each starting on an 8 byte boundary
+
+Converting back gives the exact JSON the game environment wrote, which the
+visualizer relies on (it seeds its colors with the replay text).
+"""
+import functools
+import io
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import tempfile
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import BinaryIO, Optional
+
+import numpy as np
+
+from tournament.exceptions import ReplayFormatError
+
+MAGIC = b"HLTB"
+FORMAT_VERSION = 2
+PREAMBLE = struct.Struct("<4sHHI")
+ALIGNMENT = 8
+EXTENSION = ".hltb"
+# bytes read or written at a time when converting
+CHUNK_SIZE = 1 << 16
+
+ARRAY_FIELDS = ["frames", "moves", "productions"]
+
+MAX_STRENGTH = 255
+# row and column offsets of STILL, NORTH, EAST, SOUTH, WEST
+DIRECTIONS = np.array([[0, 0], [-1, 0], [0, 1], [1, 0], [0, -1]])
+# groups pieces are sorted into by strength over production when storing
+# whether they moved
+MOVE_CONTEXTS = 16
+
+
+def is_binary(data: bytes) -> bool:
+    return data[: len(MAGIC)] == MAGIC
+
+
+def binary_name(name: str) -> str:
+    """The name of the binary version of the replay called ``name``."""
+    root, _ = os.path.splitext(name)
+    return root + EXTENSION
+
+
+def _dtype_for(low: int, high: int) -> np.dtype:
+    """The smallest integer dtype holding every value from ``low`` to ``high``."""
+    for kind in ("u", "i") if low >= 0 else ("i",):
+        for size in (1, 2, 4):
+            dtype = np.dtype(f"<{kind}{size}")
+            info = np.iinfo(dtype)
+            if info.min <= low and high <= info.max:
+                return dtype
+    raise ReplayFormatError(f"Values out of range: {low}..{high}")
+
+
+def _smallest_dtype(values: np.ndarray) -> np.dtype:
+    if values.size == 0:
+        return np.dtype("<u1")
+    return _dtype_for(int(values.min()), int(values.max()))
+
+
+def _grid(value, ndim: int, name: str) -> np.ndarray:
+    try:
+        array = np.array(value)
+    except ValueError as e:
+        raise ReplayFormatError(f"{name} is not a regular grid") from e
+    if array.ndim != ndim or array.dtype.kind not in "iu":
+        raise ReplayFormatError(f"{name} is not a {ndim}d grid of integers")
+    return array
+
+
+class _JsonReader:
+    """
+    Reads replay JSON from a stream a value at a time, so that only about a
+    frame of it is in memory at once.
+    """
+
+    SEPARATORS = bytes.maketrans(b"[],", b"   ")
+    WHITESPACE = b" \t\n\r"
+
+    def __init__(self, source: BinaryIO):
+        self.source = source
+        self.buffer = b""
+        self.position = 0
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        """Reads at least as much as is buffered, so that searching the
+        buffer again after each read stays linear."""
+        chunk = self.source.read(max(CHUNK_SIZE, len(self.buffer) - self.position))
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+        return True
+
+    def peek(self) -> bytes:
+        """The next byte that isn't whitespace, empty at the end."""
+        while True:
+            while (
+                self.position < len(self.buffer)
+                and self.buffer[self.position] in self.WHITESPACE
+            ):
+                self.position += 1
+            if self.position < len(self.buffer) or not self._fill():
+                return self.buffer[self.position : self.position + 1]
+
+    def expect(self, token: bytes):
+        if self.peek() != token:
+            raise ReplayFormatError(f"Replay JSON is malformed, expected {token!r}")
+        self.position += 1
+
+    def items(self, start: bytes, end: bytes) -> Iterator[None]:
+        """Steps through a list or object, stopping before each item."""
+        self.expect(start)
+        if self.peek() == end:
+            self.position += 1
+            return
+        while True:
+            yield
+            if self.peek() == end:
+                self.position += 1
+                return
+            self.expect(b",")
+
+    def value(self):
+        """Decodes the next value, which is expected to be small."""
+        self.peek()
+        while True:
+            try:
+                text = self.buffer[self.position :].decode()
+                value, end = self.decoder.raw_decode(text)
+            except ValueError:
+                # a truncated value or utf-8 sequence
+                if not self._fill():
+                    raise ReplayFormatError("Replay is not valid JSON")
+                continue
+            # a number may go on in the next chunk
+            if end == len(text) and self._fill():
+                continue
+            self.position += len(text[:end].encode())
+            return value
+
+    def grid(self, ndim: int) -> tuple[np.ndarray, int]:
+        """
+        The next ``ndim`` dimensional grid of integers, flattened, and the
+        number of lists it is made of. The grid ends at its first ``ndim``
+        closing brackets in a row.
+        """
+        if self.peek() != b"[":
+            raise ReplayFormatError("Replay JSON is malformed, expected a grid")
+        end = re.compile(rb"\]" + rb"\s*\]" * (ndim - 1))
+        while (found := end.search(self.buffer, self.position)) is None:
+            if not self._fill():
+                raise ReplayFormatError("Replay is not valid JSON")
+        text = self.buffer[self.position : found.end()]
+        self.position = found.end()
+        try:
+            values = np.array(text.translate(self.SEPARATORS).split(), dtype=np.int64)
+        except (ValueError, OverflowError) as e:
+            raise ReplayFormatError("Replay grids are not all integers") from e
+        return values, text.count(b"[")
+
+
+class _ArrayWriter:
+    """
+    Appends integers to a temporary file, keeping track of their range so
+    they can be copied out in the smallest dtype that holds them.
+    """
+
+    def __init__(self, dtype=np.int64):
+        self.file = tempfile.TemporaryFile()
+        self.dtype = np.dtype(dtype)
+        self.size = 0
+        self.low = self.high = 0
+
+    def append(self, values: np.ndarray):
+        if not values.size:
+            return
+        low, high = int(values.min()), int(values.max())
+        if self.size:
+            low, high = min(low, self.low), max(high, self.high)
+        self.low, self.high = low, high
+        self.size += values.size
+        self.file.write(values.astype(self.dtype, copy=False).tobytes())
+
+    def smallest_dtype(self) -> np.dtype:
+        return _dtype_for(self.low, self.high) if self.size else np.dtype("<u1")
+
+    def copy_to(self, destination: BinaryIO, dtype: np.dtype):
+        self.file.seek(0)
+        chunk_size = CHUNK_SIZE - CHUNK_SIZE % self.dtype.itemsize
+        while chunk := self.file.read(chunk_size):
+            destination.write(np.frombuffer(chunk, self.dtype).astype(dtype).tobytes())
+
+    def copy_packed_to(self, destination: BinaryIO, bits: int):
+        """Copies the values out as ``bits`` bit integers, see ``_pack``."""
+        self.file.seek(0)
+        # a whole number of bytes' worth of values at a time
+        chunk_size = CHUNK_SIZE - CHUNK_SIZE % (8 * self.dtype.itemsize)
+        while chunk := self.file.read(chunk_size):
+            destination.write(_pack(np.frombuffer(chunk, self.dtype), bits).tobytes())
+
+    def packed_size(self, bits: int) -> int:
+        return -(-self.size * bits // 8)
+
+    def close(self):
+        self.file.close()
+
+
+def _around(grid: np.ndarray) -> np.ndarray:
+    """Sums ``grid[..., y, x]`` over each cell and its four neighbours,
+    wrapping around the map."""
+    return grid + sum(
+        np.roll(grid, (dy, dx), axis=(-2, -1)) for dy, dx in DIRECTIONS[1:]
+    )
+
+
+def next_frame(
+    owners: np.ndarray,
+    strengths: np.ndarray,
+    moves: np.ndarray,
+    productions: np.ndarray,
+    players: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    The owners and strengths (``[y, x]``) of the frame after ``moves`` are
+    made, by the rules of the game environment. ``players`` counts the
+    unowned cells as player 0.
+    """
+    height, width = owners.shape
+    cells = height * width
+    owners = owners.astype(np.intp)
+    strengths = strengths.astype(np.int64)
+    moves = moves.astype(np.intp)
+    owned = owners > 0
+
+    # pieces that stay still gain production, up to the maximum strength
+    still = owned & (moves == 0)
+    moving = np.where(
+        still, np.minimum(strengths + productions, MAX_STRENGTH), strengths
+    )
+
+    # pieces of the same player moving onto the same cell merge, and every
+    # cell a player moved off still holds a piece of strength 0
+    ys, xs = np.indices((height, width))
+    ty = (ys + DIRECTIONS[moves, 0]) % height
+    tx = (xs + DIRECTIONS[moves, 1]) % width
+    targets = ((owners * height + ty) * width + tx)[owned]
+    origins = ((owners * height + ys) * width + xs)[owned]
+    size = players * cells
+    shape = (players, height, width)
+    merged = np.bincount(targets, weights=moving[owned], minlength=size)
+    pieces = np.minimum(merged, MAX_STRENGTH).astype(np.int64).reshape(shape)
+    present = (
+        np.bincount(targets, minlength=size) + np.bincount(origins, minlength=size)
+    ).reshape(shape) > 0
+
+    # every piece damages the pieces of other players on and next to its
+    # cell, and unowned cells with strength the pieces on them
+    near = _around(pieces)
+    near_present = _around(present.astype(np.int64))
+    damage = near.sum(axis=0) - near
+    injured = present & (near_present.sum(axis=0) - near_present > 0)
+    sites = np.where(owned, 0, strengths)
+    fighting = present & (sites > 0)
+    damage += np.where(fighting, sites, 0)
+    injured |= fighting
+    sites = np.maximum(sites - np.where(fighting, pieces, 0).sum(axis=0), 0)
+
+    # pieces taking at least their strength in damage die
+    alive = present & ~(injured & (damage >= pieces))
+    pieces -= np.where(injured, damage, 0)
+    next_owners = np.zeros((height, width), dtype=np.intp)
+    for player in range(1, players):
+        next_owners[alive[player]] = player
+        sites[alive[player]] = pieces[player][alive[player]]
+    return next_owners, sites
+
+
+def _move_contexts(strengths: np.ndarray, productions: np.ndarray) -> np.ndarray:
+    """The group each piece's move is stored in."""
+    return np.clip(strengths // np.maximum(productions, 1), 0, MOVE_CONTEXTS - 1)
+
+
+class _GridFile:
+    """Integer grids kept in a temporary file, to be read back in order."""
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.count = 0
+        self.size = 0
+
+    def append(self, values: np.ndarray):
+        self.file.write(values.astype(np.int64, copy=False).tobytes())
+        self.count += 1
+        self.size = values.size
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        self.file.seek(0)
+        for _ in range(self.count):
+            yield np.frombuffer(self.file.read(self.size * 8), dtype=np.int64)
+
+    def close(self):
+        self.file.close()
+
+
+def _pack(values: np.ndarray, bits: int) -> np.ndarray:
+    """``values`` as ``bits`` bit integers, packed most significant bit first."""
+    values = values.astype(np.uint8)
+    return np.packbits((values[:, None] >> np.arange(bits - 1, -1, -1)) & 1)
+
+
+def _unpack(data: np.ndarray, start: int, stop: int, bits: int) -> np.ndarray:
+    """Values ``start`` to ``stop`` of the ``bits`` bit integers in ``data``."""
+    first, last = start * bits, stop * bits
+    unpacked = np.unpackbits(data[first // 8 : -(-last // 8)])
+    unpacked = unpacked[first % 8 : first % 8 + last - first]
+    return unpacked.reshape(-1, bits) @ (1 << np.arange(bits - 1, -1, -1))
+
+
+def encode(source: BinaryIO, destination: BinaryIO):
+    """
+    Converts the replay JSON read from ``source`` to the binary format and
+    writes it to ``destination``. The grids are read into temporary files a
+    frame at a time and the moves then replayed a frame at a time, and the
+    arrays are kept in temporary files until their dtypes are known, so
+    memory doesn't grow with the length of the replay.
+    """
+    reader = _JsonReader(source)
+    names = ["first_owners", "first_strengths", "moved", "directions"]
+    names += ["stray_counts", "stray_cells", "stray_moves"]
+    names += ["delta_counts", "delta_cells", "delta_owners", "delta_strengths"]
+    writers = {name: _ArrayWriter() for name in names if name != "moved"}
+    moved = [_ArrayWriter(np.uint8) for _ in range(MOVE_CONTEXTS)]
+    # bits per value of the arrays stored packed, see _pack
+    packed = {"moved": 1, "directions": 2}
+    grids = {"frames": _GridFile(), "moves": _GridFile()}
+    keys, fields, productions = [], {}, None
+    # the number of values and of lists in each frame, and in each moves grid
+    frame_shapes, move_shapes = set(), set()
+    low_owner = high_owner = 0
+    try:
+        for _ in reader.items(b"{", b"}"):
+            key = reader.value()
+            if not isinstance(key, str):
+                raise ReplayFormatError("Replay is not a JSON object")
+            reader.expect(b":")
+            keys.append(key)
+
+            if key == "frames":
+                for _ in reader.items(b"[", b"]"):
+                    values, lists = reader.grid(3)
+                    frame_shapes.add((values.size, lists))
+                    if len(frame_shapes) > 1 or values.size % 2:
+                        raise ReplayFormatError("frames is not a regular grid")
+                    if values.size:
+                        low_owner = min(low_owner, int(values[::2].min()))
+                        high_owner = max(high_owner, int(values[::2].max()))
+                    grids["frames"].append(values)
+            elif key == "moves":
+                for _ in reader.items(b"[", b"]"):
+                    values, lists = reader.grid(2)
+                    move_shapes.add((values.size, lists))
+                    if len(move_shapes) > 1:
+                        raise ReplayFormatError("moves is not a regular grid")
+                    if values.size and not 0 <= values.min() <= values.max() <= 4:
+                        raise ReplayFormatError("moves are not all directions")
+                    grids["moves"].append(values)
+            elif key == "productions":
+                productions = _grid(reader.value(), 2, "productions")
+            else:
+                fields[key] = reader.value()
+        if reader.peek():
+            raise ReplayFormatError("Replay JSON is malformed, data after the end")
+        if not set(ARRAY_FIELDS) <= set(keys):
+            raise ReplayFormatError("Replay is missing frames, moves or productions")
+
+        try:
+            height, width = int(fields["height"]), int(fields["width"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ReplayFormatError("Replay has no height and width") from e
+        cells = height * width
+        if (
+            not frame_shapes <= {(cells * 2, 1 + height + cells)}
+            or not move_shapes <= {(cells, 1 + height)}
+            or productions.shape != (height, width)
+        ):
+            raise ReplayFormatError("Replay grids don't match its height and width")
+        num_frames, num_moves = grids["frames"].count, grids["moves"].count
+        if num_moves != max(num_frames - 1, 0):
+            raise ReplayFormatError("Replay doesn't have moves for every frame")
+        if low_owner < 0:
+            raise ReplayFormatError("Replay has negative owners")
+        players = high_owner + 1
+
+        all_moves = iter(grids["moves"])
+        owners = strengths = moves = None
+        for frame, values in enumerate(grids["frames"]):
+            values = values.reshape(height, width, 2)
+            if frame == 0:
+                writers["first_owners"].append(values[..., 0].ravel())
+                writers["first_strengths"].append(values[..., 1].ravel())
+                changed = np.zeros(0, dtype=np.intp)
+            else:
+                owners, strengths = next_frame(
+                    owners, strengths, moves, productions, players
+                )
+                changed = np.flatnonzero(
+                    (owners != values[..., 0]) | (strengths != values[..., 1])
+                )
+                writers["delta_owners"].append(values[..., 0].ravel()[changed])
+                writers["delta_strengths"].append(values[..., 1].ravel()[changed])
+            writers["delta_cells"].append(changed)
+            writers["delta_counts"].append(np.array([changed.size]))
+            owners, strengths = values[..., 0], values[..., 1]
+            if frame == num_moves:
+                continue
+
+            moves = next(all_moves).reshape(height, width)
+            pieces = np.flatnonzero(owners > 0)
+            piece_moves = moves.ravel()[pieces]
+            contexts = _move_contexts(
+                strengths.ravel()[pieces], productions.ravel()[pieces]
+            )
+            for context in np.unique(contexts):
+                moved[context].append(piece_moves[contexts == context] != 0)
+            writers["directions"].append(piece_moves[piece_moves != 0] - 1)
+            stray = np.flatnonzero((owners == 0) & (moves != 0))
+            writers["stray_cells"].append(stray)
+            writers["stray_moves"].append(moves.ravel()[stray])
+            writers["stray_counts"].append(np.array([stray.size]))
+
+        shapes = {
+            "first_owners": [min(num_frames, 1), cells],
+            "first_strengths": [min(num_frames, 1), cells],
+            "stray_counts": [num_moves],
+            "delta_counts": [num_frames],
+        }
+        dtypes = {name: writer.smallest_dtype() for name, writer in writers.items()}
+        dtypes["moved"] = dtypes["directions"] = np.dtype("|u1")
+        dtypes["stray_counts"] = dtypes["delta_counts"] = np.dtype("<u4")
+        dtypes["stray_cells"] = dtypes["delta_cells"] = np.dtype(
+            "<u2" if cells <= 1 << 16 else "<u4"
+        )
+        sizes = {name: writer.size for name, writer in writers.items()}
+        sizes["moved"] = sum(writer.packed_size(1) for writer in moved)
+        sizes["directions"] = writers["directions"].packed_size(2)
+        productions = productions.astype(_smallest_dtype(productions))
+        table = [["productions", productions.dtype.str, list(productions.shape)]]
+        table += [
+            [name, dtypes[name].str, shapes.get(name, [sizes[name]])] for name in names
+        ]
+
+        header = json.dumps(
+            {
+                "keys": keys,
+                "fields": fields,
+                "num_frames": num_frames,
+                "players": players,
+                "moved_counts": [writer.size for writer in moved],
+                "arrays": table,
+            },
+            separators=(",", ":"),
+        ).encode()
+        destination.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, len(header)))
+        destination.write(header)
+        offset = PREAMBLE.size + len(header)
+
+        offset += _pad(destination, offset)
+        destination.write(productions.tobytes())
+        offset += productions.nbytes
+        for name in names:
+            offset += _pad(destination, offset)
+            for writer in moved if name == "moved" else [writers[name]]:
+                if name in packed:
+                    writer.copy_packed_to(destination, packed[name])
+                else:
+                    writer.copy_to(destination, dtypes[name])
+            offset += sizes[name] * dtypes[name].itemsize
+    finally:
+        for writer in [*writers.values(), *moved, *grids.values()]:
+            writer.close()
+
+
+def _pad(destination: BinaryIO, offset: int) -> int:
+    padding = -offset % ALIGNMENT
+    destination.write(bytes(padding))
+    return padding
+
+
+def read_arrays(data) -> tuple[dict, dict[str, np.ndarray]]:
+    """
+    Parses the header and returns it with views of the arrays in ``data``,
+    which can be anything supporting the buffer protocol (bytes, mmap).
+    """
+    if len(data) < PREAMBLE.size:
+        raise ReplayFormatError("Replay is truncated")
+    magic, version, _, header_length = PREAMBLE.unpack_from(data)
+    if magic != MAGIC:
+        raise ReplayFormatError("Not a binary replay")
+    if version != FORMAT_VERSION:
+        raise ReplayFormatError(f"Unsupported binary replay version {version}")
+
+    offset = PREAMBLE.size + header_length
+    header = json.loads(bytes(data[PREAMBLE.size : offset]))
+
+    arrays = {}
+    for name, dtype, shape in header["arrays"]:
+        offset += -offset % ALIGNMENT
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape, dtype=np.int64))
+        if offset + count * dtype.itemsize > len(data):
+            raise ReplayFormatError("Replay is truncated")
+        arrays[name] = np.frombuffer(
+            data, dtype=dtype, count=count, offset=offset
+        ).reshape(shape)
+        offset += count * dtype.itemsize
+    return header, arrays
+
+
+def _turns(
+    header: dict, arrays: dict[str, np.ndarray]
+) -> Iterator[tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]]:
+    """
+    Replays a binary replay from its first frame, yielding the owners and
+    strengths of every frame and the moves made from it (None for the last).
+    """
+    height, width = header["fields"]["height"], header["fields"]["width"]
+    num_frames, num_moves = header["num_frames"], len(arrays["stray_counts"])
+    if not num_frames:
+        return
+    productions = arrays["productions"].astype(np.int64)
+    owners = arrays["first_owners"][0].astype(np.intp).reshape(height, width)
+    strengths = arrays["first_strengths"][0].astype(np.int64).reshape(height, width)
+    # each context's bits of whether its pieces moved start on a new byte
+    moved_bytes = [-(-count // 8) for count in header["moved_counts"]]
+    moved = np.split(arrays["moved"], np.cumsum(moved_bytes)[:-1])
+    moved_at = [0] * MOVE_CONTEXTS
+    delta = direction = stray = 0
+
+    for frame in range(num_frames):
+        if frame:
+            owners, strengths = next_frame(
+                owners, strengths, moves, productions, header["players"]
+            )
+            end = delta + int(arrays["delta_counts"][frame])
+            cells = arrays["delta_cells"][delta:end]
+            owners.flat[cells] = arrays["delta_owners"][delta:end]
+            strengths.flat[cells] = arrays["delta_strengths"][delta:end]
+            delta = end
+        if frame == num_moves:
+            yield owners, strengths, None
+            continue
+
+        moves = np.zeros(height * width, dtype=np.uint8)
+        pieces = np.flatnonzero(owners > 0)
+        contexts = _move_contexts(strengths.flat[pieces], productions.flat[pieces])
+        pieces_moved = np.zeros(len(pieces), dtype=bool)
+        for context in np.unique(contexts):
+            in_context = contexts == context
+            end = moved_at[context] + np.count_nonzero(in_context)
+            pieces_moved[in_context] = _unpack(
+                moved[context], moved_at[context], end, 1
+            )
+            moved_at[context] = end
+        end = direction + np.count_nonzero(pieces_moved)
+        moves[pieces[pieces_moved]] = (
+            _unpack(arrays["directions"], direction, end, 2) + 1
+        )
+        direction = end
+        end = stray + int(arrays["stray_counts"][frame])
+        moves[arrays["stray_cells"][stray:end]] = arrays["stray_moves"][stray:end]
+        stray = end
+        moves = moves.reshape(height, width)
+        yield owners, strengths, moves
+
+
+def iter_turns(
+    header: dict, arrays: dict[str, np.ndarray], chunk_size: int, dtype=np.int64
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """
+    Rebuilds the frames in order, ``chunk_size`` at a time, as
+    ``(frames, height, width, 2)`` grids along with the moves made from them,
+    which the last chunk has one fewer of.
+    """
+    height, width = header["fields"]["height"], header["fields"]["width"]
+
+    def chunk():
+        return (
+            np.stack(frames),
+            np.array(moves, dtype=np.uint8).reshape(-1, height, width),
+        )
+
+    frames, moves = [], []
+    for owners, strengths, frame_moves in _turns(header, arrays):
+        frames.append(np.stack([owners, strengths], axis=-1).astype(dtype))
+        if frame_moves is not None:
+            moves.append(frame_moves)
+        if len(frames) == chunk_size:
+            yield chunk()
+            frames, moves = [], []
+    if frames:
+        yield chunk()
+
+
+def iter_frames(
+    header: dict, arrays: dict[str, np.ndarray], chunk_size: int, dtype=np.int64
+) -> Iterator[np.ndarray]:
+    """Rebuilds the frames in order, ``chunk_size`` at a time."""
+    for frames, _ in iter_turns(header, arrays, chunk_size, dtype):
+        yield frames
+
+
+def decode_frames(
+    header: dict,
+    arrays: dict[str, np.ndarray],
+    start: int = 0,
+    stop: Optional[int] = None,
+    dtype=np.int64,
+) -> np.ndarray:
+    """
+    Rebuilds frames ``start`` to ``stop`` as a ``(frames, height, width, 2)``
+    grid, replaying every frame before them.
+    """
+    height, width = header["fields"]["height"], header["fields"]["width"]
+    start, stop, _ = slice(start, stop).indices(header["num_frames"])
+    stop = max(start, stop)
+
+    frames = np.empty((stop - start, height, width, 2), dtype=dtype)
+    for frame, (owners, strengths, _) in enumerate(_turns(header, arrays)):
+        if frame >= stop:
+            break
+        if frame >= start:
+            frames[frame - start, ..., 0] = owners
+            frames[frame - start, ..., 1] = strengths
+    return frames
+
+
+def decode_moves(header: dict, arrays: dict[str, np.ndarray]) -> np.ndarray:
+    """Every moves grid, ``(frames - 1, height, width)``."""
+    height, width = header["fields"]["height"], header["fields"]["width"]
+    moves = np.empty((len(arrays["stray_counts"]), height, width), dtype=np.uint8)
+    for frame, (_, _, frame_moves) in enumerate(_turns(header, arrays)):
+        if frame_moves is not None:
+            moves[frame] = frame_moves
+    return moves
+
+
+def decode(data) -> dict:
+    header, arrays = read_arrays(data)
+    values = {
+        **header["fields"],
+        "frames": decode_frames(header, arrays).tolist(),
+        "moves": decode_moves(header, arrays).tolist(),
+        "productions": arrays["productions"].tolist(),
+    }
+    return {key: values[key] for key in header["keys"]}
+
+
+def dumps(replay) -> bytes:
+    """Serializes a replay, or part of one, the way the game environment does."""
+    return json.dumps(replay, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def iter_json(data) -> Iterator[bytes]:
+    """
+    The replay JSON of a binary replay in pieces, replaying a frame at a
+    time.
+    """
+    header, arrays = read_arrays(data)
+    for i, key in enumerate(header["keys"]):
+        yield (b"," if i else b"{") + dumps(key) + b":"
+        if key == "frames":
+            for j, (owners, strengths, _) in enumerate(_turns(header, arrays)):
+                frame = np.stack([owners, strengths], axis=-1)
+                yield (b"," if j else b"[") + dumps(frame.tolist())
+            yield b"]" if header["num_frames"] else b"[]"
+        elif key == "moves":
+            turns = _turns(header, arrays)
+            moves = (moves for _, _, moves in turns if moves is not None)
+            for j, frame_moves in enumerate(moves):
+                yield (b"," if j else b"[") + dumps(frame_moves.tolist())
+            yield b"]" if len(arrays["stray_counts"]) else b"[]"
+        elif key == "productions":
+            yield dumps(arrays["productions"].tolist())
+        else:
+            yield dumps(header["fields"][key])
+    yield b"}" if header["keys"] else b"{}"
+
+
+def matches_json(data, source: BinaryIO) -> bool:
+    """Whether the binary replay ``data`` converts back to exactly the JSON
+    read from ``source``."""
+    for piece in iter_json(data):
+        if source.read(len(piece)) != piece:
+            return False
+    return source.read(1) == b""
+
+
+@contextmanager
+def map_file(f: BinaryIO) -> Iterator[mmap.mmap]:
+    """Memory-maps a binary replay written to the file ``f``."""
+    f.flush()
+    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        yield data
+    finally:
+        try:
+            data.close()
+        except BufferError:
+            # arrays still use it, it's closed once they're freed
+            pass
+
+
+def from_json(data: bytes) -> bytes:
+    """
+    Converts replay JSON to the binary format, checking that it converts back
+    to the same bytes.
+    """
+    binary = io.BytesIO()
+    encode(io.BytesIO(data), binary)
+    if not matches_json(binary.getbuffer(), io.BytesIO(data)):
+        raise ReplayFormatError("Replay does not round trip through the binary format")
+    return binary.getvalue()
+
+
+def to_json(data) -> bytes:
+    return b"".join(iter_json(data))
+
+
+def per_player(
+    owners: np.ndarray, players: int, weights: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Sums ``weights`` (default 1) over the cells of ``owners[t, y, x]`` each
+    of ``players`` owns in every frame, ``[t, player]``.
+    """
+    num_frames = len(owners)
+    index = owners.reshape(num_frames, -1).astype(np.intp)
+    index += np.arange(num_frames)[:, None] * players
+    if weights is not None:
+        weights = np.broadcast_to(weights, owners.shape).ravel()
+    return np.bincount(
+        index.ravel(), weights=weights, minlength=num_frames * players
+    ).reshape(num_frames, players)
+
+
+class ReplayArrays:
+    """
+    A replay decoded into contiguous arrays: ``frames[t, y, x]`` holds
+    ``(owner, strength)``, ``moves[t, y, x]`` the move made from each cell and
+    ``productions[y, x]`` the production of each cell. The other replay
+    fields are in ``fields``.
+
+    Arrays loaded with ``load`` are memory-mapped, so only the frames that
+    are actually used are read from disk.
+    """
+
+    ARRAYS = ["frames", "moves", "productions"]
+
+    def __init__(
+        self,
+        fields: dict,
+        frames: np.ndarray,
+        moves: np.ndarray,
+        productions: np.ndarray,
+    ):
+        self.fields = fields
+        self.frames = frames
+        self.moves = moves
+        self.productions = productions
+
+    @classmethod
+    def parse(cls, data: bytes) -> "ReplayArrays":
+        """Decodes a replay in either format. The frames of a binary one are
+        only decoded when they're used."""
+        if not is_binary(data):
+            replay = json.loads(data)
+            grids = [
+                _grid(replay["frames"], 4, "frames"),
+                _grid(replay["moves"], 3, "moves"),
+                _grid(replay["productions"], 2, "productions"),
+            ]
+            return cls(
+                {k: v for k, v in replay.items() if k not in ARRAY_FIELDS},
+                *(grid.astype(_smallest_dtype(grid)) for grid in grids),
+            )
+
+        return EncodedReplayArrays(*read_arrays(data))
+
+    @classmethod
+    def load(cls, path: str) -> "ReplayArrays":
+        with open(os.path.join(path, "fields.json")) as f:
+            fields = json.load(f)
+        return cls(
+            fields,
+            *(
+                np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                for name in cls.ARRAYS
+            ),
+        )
+
+    def save(self, path: str):
+        """
+        Writes the arrays as ``.npy`` files into the directory ``path``. The
+        directory is written elsewhere and renamed into place, so readers
+        never see a partial one.
+        """
+        parent = os.path.dirname(path)
+        os.makedirs(parent, exist_ok=True)
+        partial = tempfile.mkdtemp(dir=parent)
+        try:
+            for name in self.ARRAYS:
+                np.save(os.path.join(partial, f"{name}.npy"), getattr(self, name))
+            with open(os.path.join(partial, "fields.json"), "w") as f:
+                json.dump(self.fields, f)
+            os.rename(partial, path)
+        except OSError:
+            # someone else cached it first
+            if not os.path.isdir(path):
+                raise
+        finally:
+            shutil.rmtree(partial, ignore_errors=True)
+
+    @property
+    def num_frames(self) -> int:
+        return len(self.frames)
+
+    @property
+    def num_players(self) -> int:
+        return self.fields["num_players"]
+
+    @property
+    def owners(self) -> np.ndarray:
+        return self.frames[..., 0]
+
+    @property
+    def strengths(self) -> np.ndarray:
+        return self.frames[..., 1]
+
+    def frame_range(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        return self.frames[start:stop]
+
+    def iter_frames(self, chunk_size: int) -> Iterator[np.ndarray]:
+        """The frames in order, ``chunk_size`` at a time."""
+        for start in range(0, self.num_frames, chunk_size):
+            yield self.frames[start : start + chunk_size]
+
+    def iter_turns(self, chunk_size: int) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+        """The frames in order, ``chunk_size`` at a time, with the moves made
+        from them."""
+        for start in range(0, self.num_frames, chunk_size):
+            yield (
+                self.frames[start : start + chunk_size],
+                self.moves[start : start + chunk_size],
+            )
+
+    def _per_player(self, weights: Optional[np.ndarray] = None) -> np.ndarray:
+        """Sums ``weights`` (default 1) over the cells each player owns in
+        every frame. Column 0 is the unowned cells."""
+        return per_player(self.owners, self.num_players + 1, weights)
+
+    def territory(self) -> np.ndarray:
+        """Cells owned by each player in every frame, ``[t, player]``."""
+        return self._per_player()
+
+    def strength(self) -> np.ndarray:
+        """Total strength of each player in every frame, ``[t, player]``."""
+        return self._per_player(self.strengths).astype(np.int64)
+
+    def production(self) -> np.ndarray:
+        """Production of the cells each player owns in every frame, ``[t, player]``."""
+        return self._per_player(self.productions).astype(np.int64)
+
+    def production_share(self) -> np.ndarray:
+        """Share of the map's production each player owns in every frame."""
+        return self.production() / max(int(self.productions.sum()), 1)
+
+    def last_frame_alive(self) -> np.ndarray:
+        """The last frame each player owns a cell in, -1 if they never do.
+        Indexed like the columns of ``territory``."""
+        alive = self.territory() > 0
+        last = self.num_frames - 1 - np.argmax(alive[::-1], axis=0)
+        return np.where(alive.any(axis=0), last, -1)
+
+
+class EncodedReplayArrays(ReplayArrays):
+    """
+    The arrays of a binary replay. Frames and moves are decoded by replaying
+    the moves when they're used, so going through them with ``iter_turns``
+    only ever holds a chunk of them in memory.
+    """
+
+    def __init__(self, header: dict, arrays: dict[str, np.ndarray]):
+        self.fields = header["fields"]
+        self.productions = arrays["productions"]
+        self.header = header
+        self.arrays = arrays
+        self.dtype = np.result_type(
+            arrays["first_owners"],
+            arrays["first_strengths"],
+            arrays["delta_owners"],
+            arrays["delta_strengths"],
+        )
+
+    @functools.cached_property
+    def frames(self) -> np.ndarray:
+        return decode_frames(self.header, self.arrays, dtype=self.dtype)
+
+    @functools.cached_property
+    def moves(self) -> np.ndarray:
+        return decode_moves(self.header, self.arrays)
+
+    @property
+    def num_frames(self) -> int:
+        return self.header["num_frames"]
+
+    def frame_range(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        return decode_frames(self.header, self.arrays, start, stop, self.dtype)
+
+    def iter_frames(self, chunk_size: int) -> Iterator[np.ndarray]:
+        return iter_frames(self.header, self.arrays, chunk_size, self.dtype)
+
+    def iter_turns(self, chunk_size: int) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+        return iter_turns(self.header, self.arrays, chunk_size, self.dtype)
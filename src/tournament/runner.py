@@ -1,103 +1,572 @@
 import json
+import logging
+import os
 import random
+import shlex
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
 from collections.abc import Collection
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
-from uuid import uuid4
+from uuid import UUID, uuid4
 
+from django import db
 from django.conf import settings
-from django.db.models import F
-from django.db.models.functions import Abs
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files import File
+from django.db.models import F, FilteredRelation, Q, QuerySet
+from django.db.models.functions import Coalesce, Exp, Random
+from django.utils import timezone
 
-from github import Auth, Github, Workflow
+import requests
+from github import Github, GithubException, Workflow
 from github.WorkflowRun import WorkflowRun
-from tenacity import RetryError, TryAgain, retry, stop_after_delay, wait_fixed
 
+from tournament import github_client, matchmaking, metrics
+from tournament.dataclasses import MatchDataClass, MatchResultDataClass
 from tournament.exceptions import (
+    GithubRateLimitError,
+    HaliteError,
     TooFewPlayersError,
     TooManyPlayersError,
     WorkflowFailedToStartError,
-    WorkflowRunNotFoundError,
 )
-from tournament.models import Bot, Match
+from tournament.github_client import MATCH_REPOSITORY, MATCH_WORKFLOW
+from tournament.models import Bot, Match, MatchUpload
+
+logger = logging.getLogger(__name__)
 
 MAP_SIZES = [20, 25, 25, 30, 30, 30, 35, 35, 35, 35, 40, 40, 40, 45, 45, 50]
 SEED_NUM_PLAYERS = [2, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 5, 5, 6]
+SEED_SELECTIONS = [1, 1, 2, 3]
+# seed selection 2 picks from this many bots with fewer than SEED_MAX_MATCHES
+SEED_RECENT_POOL = 15
+SEED_MAX_MATCHES = 400
+# concurrent workflow dispatches
+DISPATCH_THREADS = 8
+
 
+def find_runs(
+    start: datetime, workflow: Workflow, match_ids: Collection[str]
+) -> dict[str, WorkflowRun]:
+    """
+    Finds the runs of dispatched matches by their titles, listing the
+    workflow's runs created since ``start`` once for all of the matches.
+    """
+    pending = set(match_ids)
+    found = {}
+    page = 1
+    while pending:
+        runs = github_client.list_runs(workflow, page, event="workflow_dispatch").runs
+        metrics.RUN_LOOKUP_PAGES.inc()
+        for run in runs:
+            if run.created_at < start:
+                return found
 
-@retry(stop=stop_after_delay(60), wait=wait_fixed(3))
-def find_run(
-    start: datetime, workflow: Workflow, match_id: str
-) -> Optional[WorkflowRun]:
-    for run in workflow.get_runs(event="workflow_dispatch"):
-        if run.created_at < start:
+            if run.display_title in pending:
+                found[run.display_title] = run
+                pending.discard(run.display_title)
+        if len(runs) < github_client.RUNS_PER_PAGE:
             break
+        page += 1
+    return found
+
+
+def find_missing_runs(workflow: Workflow) -> int:
+    """
+    Looks up the runs of matches whose workflow_run webhook hasn't arrived
+    within ``MATCH_RUN_WEBHOOK_GRACE`` seconds. Returns how many were found.
+    """
+    started_before = timezone.now() - timedelta(
+        seconds=settings.MATCH_RUN_WEBHOOK_GRACE
+    )
+    missing = list(
+        Match.in_flight()
+        .filter(run_id__isnull=True, created_at__lt=started_before)
+        .order_by("created_at")
+    )
+    if not missing:
+        return 0
 
-        if run.display_title == match_id:
-            return run
+    # run times are naive utc, allowing for clock skew
+    start = missing[0].created_at.replace(tzinfo=None) - timedelta(minutes=1)
+    runs = find_runs(start, workflow, [str(match.uuid) for match in missing])
+    found = sum(Match.record_run(title, run.id) for title, run in runs.items())
+    metrics.RUNS_FOUND.inc(found)
+    return found
 
-    raise TryAgain
+
+def seed_bots() -> QuerySet:
+    """The bots that can seed a match."""
+    return Bot.objects.exclude(docker_image__exact="").exclude(user__is_npc=True)
+
+
+def with_activity(bots: QuerySet) -> QuerySet:
+    """Annotates ``bots`` with the match count and last game date of their
+    current image, from ``BotActivity``."""
+    return bots.annotate(
+        current_activity=FilteredRelation(
+            "activity", condition=Q(activity__docker_image=F("docker_image"))
+        ),
+        last_game_date=F("current_activity__last_match_date"),
+        match_count=Coalesce("current_activity__match_count", 0),
+    )
+
+
+def seed_candidates(seed_selection: int) -> QuerySet:
+    """The bots a seed player is picked from, in order of preference."""
+    if seed_selection == 1:
+        return seed_bots().order_by((Random() * Exp("sigma")).desc())
+
+    # bots that never played first
+    by_last_game = F("last_game_date").asc(nulls_first=True)
+    if seed_selection == 2:
+        return (
+            with_activity(seed_bots())
+            .filter(match_count__lt=SEED_MAX_MATCHES)
+            .order_by(by_last_game)[:SEED_RECENT_POOL]
+        )
+    return with_activity(seed_bots()).order_by(by_last_game)
+
+
+def pick_seed_player(seed_selection: Optional[int] = None) -> Bot:
+    # https://github.com/HaliteChallenge/Halite/blob/6fe9f685849f26e6e5ea2800b3c3854da23d6a12/website/api/manager/ManagerAPI.php#L79
+
+    # pick seed player
+    # 50%: pick a player at random weighted by their sigma (uncertainty)
+    # 25%: pick a player with less than 400 games from the top 15 players who played a game the longest ago
+    # 25%: pick the player who hasn't played a game in the longest amount of time
+    if seed_selection is None:
+        seed_selection = random.choice(SEED_SELECTIONS)
+    if seed_selection == 2:
+        return random.choice(seed_candidates(seed_selection))
+    return seed_candidates(seed_selection).first()
+
+
+def rank_limit() -> int:
+    """How many of the bots nearest in mu a seed's opponents are picked from,
+    usually a handful but with a long tail."""
+    return int(5.0 / random.uniform(0.00001, 1) ** 0.65)
 
 
 def get_players_for_seed(bot: Bot, num_players: Optional[int] = None):
     if num_players is None:
         num_players = random.choice(SEED_NUM_PLAYERS)
 
-    mu_rank_limit = int(5.0 / random.uniform(0.00001, 1) ** 0.65)
-    nearby_players = (
-        Bot.objects.exclude(pk=bot)
-        .exclude(docker_image__exact="")
-        .order_by(Abs(F("mu") - bot.mu))[:mu_rank_limit]
-    )
-    return [bot] + list(
-        Bot.objects.filter(pk__in=nearby_players).order_by("?")[: num_players - 1]
-    )
+    return [bot] + matchmaking.get_index().opponents(bot, num_players - 1, rank_limit())
+
+
+def get_workflow(github: Optional[Github] = None) -> Workflow:
+    """The match workflow, through ``github`` or this thread's shared client."""
+    if github is None:
+        return github_client.get_workflow()
+    return github.get_repo(MATCH_REPOSITORY).get_workflow(MATCH_WORKFLOW)
 
 
-def start_match(bots: Collection[Bot]) -> Match:
+@dataclass
+class MatchStart:
+    bots: list[Bot]
+    match: Optional[Match] = None
+    error: Optional[HaliteError] = None
+
+
+def check_players(bots: Collection[Bot]):
     if len(bots) < 2:
         raise TooFewPlayersError("Too few players. Minimum 2.")
 
     if len(bots) > 6:
         raise TooManyPlayersError("Too many players. Maximum 6.")
 
-    auth = Auth.Token(settings.GITHUB_WORKFLOW_TOKEN)
-    github = Github(auth=auth)
-
-    workflow = github.get_repo("nmalaguti/halite-matches").get_workflow("match.yml")
 
-    match_id = str(uuid4())
+def dispatch_inputs(match_id: str, bots: Collection[Bot]) -> dict:
     dimension = random.choice(MAP_SIZES)
+    return {
+        "id": match_id,
+        "map-size": f"{dimension} {dimension}",
+        "bots": json.dumps(
+            [
+                {
+                    "name": bot.name,
+                    "docker-image": bot.docker_image,
+                }
+                for bot in bots
+            ]
+        ),
+    }
 
-    created = workflow.create_dispatch(
-        "main",
-        {
-            "id": match_id,
-            "map-size": f"{dimension} {dimension}",
-            "bots": json.dumps(
-                [
-                    {
-                        "name": bot.name,
-                        "docker-image": bot.docker_image,
-                    }
-                    for bot in bots
-                ]
-            ),
-        },
-    )
 
-    if not created:
-        raise WorkflowFailedToStartError("Workflow dispatch did not succeed.")
+_dispatch_pool: Optional[ThreadPoolExecutor] = None
+
+
+def create_dispatches(workflow: Workflow, inputs: list[dict]) -> list[bool]:
+    """
+    Dispatches a workflow run for each of ``inputs`` at once, returning which
+    were created. Dispatches are sent from a pool of threads that live as
+    long as the process, each with a client of its own.
+    """
+    global _dispatch_pool
+
+    def dispatch(match_inputs: dict, workflow: Optional[Workflow] = None) -> bool:
+        try:
+            return github_client.dispatch(workflow or get_workflow(), match_inputs)
+        except (GithubException, requests.RequestException):
+            logger.exception(f"Failed to dispatch match {match_inputs['id']}")
+            return False
+
+    if len(inputs) == 1:
+        # no need for another client
+        return [dispatch(inputs[0], workflow)]
+
+    if _dispatch_pool is None:
+        _dispatch_pool = ThreadPoolExecutor(
+            max_workers=DISPATCH_THREADS, thread_name_prefix="dispatch"
+        )
+    return list(_dispatch_pool.map(dispatch, inputs))
+
+
+class RunnerBackend:
+    """
+    Somewhere matches run. Backends are dispatched with the inputs of the
+    match workflow and send results back as the workflow's tarball, through
+    the match result API or ``MatchUpload``.
+    """
+
+    name = ""
+
+    def allowance(self, count: int) -> int:
+        """How many of ``count`` matches can be dispatched right now."""
+        return count
+
+    def queued(self) -> int:
+        """Dispatched matches waiting for somewhere to run."""
+        raise NotImplementedError
+
+    def dispatch(self, inputs: list[dict]) -> list[bool]:
+        """Dispatches a match for each of ``inputs``, returning which were."""
+        raise NotImplementedError
+
+    def reconcile(self):
+        """Catches up on anything missed, called every scheduler tick."""
+
+
+class GithubBackend(RunnerBackend):
+    """Runs matches on GitHub Actions with the match workflow."""
+
+    name = "github"
+
+    def __init__(self, workflow: Optional[Workflow] = None):
+        self._workflow = workflow
+
+    @property
+    def workflow(self) -> Workflow:
+        return self._workflow or get_workflow()
 
+    def allowance(self, count: int) -> int:
+        return github_client.governor.allowance(count)
+
+    def queued(self) -> int:
+        return github_client.list_runs(self.workflow, status="queued").total_count
+
+    def dispatch(self, inputs: list[dict]) -> list[bool]:
+        return create_dispatches(self.workflow, inputs)
+
+    def reconcile(self):
+        found = find_missing_runs(self.workflow)
+        if found:
+            logger.info(f"Found {found} runs whose webhooks never arrived")
+
+
+@dataclass
+class HaliteOutput:
+    """What the Halite environment's quiet output (``-q``) reports."""
+
+    width: int
+    height: int
+    replay: str
+    seed: int
+    # rank and last frame alive by player tag, from 1 in command order
+    results: dict[int, tuple[int, int]]
+    error_logs: dict[int, str]
+
+
+def parse_halite_output(output: str, num_players: int) -> HaliteOutput:
+    """
+    Parses the quiet output of the Halite environment run with ``-o``: the
+    map size, the replay and map seed, a ``tag rank lastFrameAlive`` line per
+    player, the tags of the players that timed out and their logs.
+    """
+    lines = output.splitlines()
     try:
-        run = find_run(datetime.utcnow() - timedelta(minutes=1), workflow, match_id)
-    except RetryError:
-        raise WorkflowRunNotFoundError(
-            f"Failed to find workflow run with id {match_id}"
+        start = next(
+            n for n, line in enumerate(lines) if line.partition(" ")[0].endswith(".hlt")
         )
+        width, height = map(int, lines[start - 1].split())
+        replay, seed = lines[start].split()[:2]
+        results = {}
+        for line in lines[start + 1 : start + 1 + num_players]:
+            tag, rank, last_frame_alive = map(int, line.split())
+            results[tag] = (rank, last_frame_alive)
+    except (StopIteration, ValueError) as e:
+        raise HaliteError(f"Unexpected Halite environment output: {output!r}") from e
+
+    rest = lines[start + 1 + num_players :] + ["", ""]
+    timed_out = [int(tag) for tag in rest[0].split()]
+    error_logs = dict(zip(timed_out, rest[1].split()))
+    return HaliteOutput(width, height, replay, int(seed), results, error_logs)
+
+
+def local_run_id(match_id: str) -> int:
+    """A run id for a match run locally, fitting the same column as GitHub's."""
+    return UUID(match_id).int >> 65
+
+
+class LocalBackend(RunnerBackend):
+    """
+    Runs matches on this host, ``workers`` at a time. The Halite environment
+    (``LOCAL_RUNNER_HALITE``) plays each bot through ``docker run`` of its
+    image, and the replay, error logs and ``<id>.json`` match description
+    are packed up like the workflow's tarball and queued as an upload.
+
+    A ``command`` replaces all of that: it runs in an empty directory with
+    the match's workflow inputs as JSON on stdin and leaves the files the
+    tarball holds there.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        command: Optional[list[str]] = None,
+        workers: Optional[int] = None,
+        halite: Optional[str] = None,
+    ):
+        self.command = command or settings.LOCAL_RUNNER_COMMAND
+        self.halite = halite or settings.LOCAL_RUNNER_HALITE
+        if not self.command and shutil.which(self.halite) is None:
+            raise ImproperlyConfigured(
+                f"LOCAL_RUNNER_HALITE {self.halite!r} is not an executable."
+            )
+
+        self.pool = ThreadPoolExecutor(
+            max_workers=workers or settings.LOCAL_RUNNER_WORKERS,
+            thread_name_prefix="match",
+        )
+        self.waiting = 0
+        self._lock = threading.Lock()
+
+    def queued(self) -> int:
+        return self.waiting
+
+    def dispatch(self, inputs: list[dict]) -> list[bool]:
+        with self._lock:
+            self.waiting += len(inputs)
+        for match_inputs in inputs:
+            self.pool.submit(self.run, match_inputs)
+        return [True] * len(inputs)
+
+    def run(self, inputs: dict):
+        with self._lock:
+            self.waiting -= 1
+        try:
+            Match.record_run(inputs["id"], local_run_id(inputs["id"]))
+            archive = self.run_match(inputs)
+            with archive:
+                MatchUpload.enqueue(archive, UUID(inputs["id"]))
+        except subprocess.CalledProcessError as e:
+            logger.error(f"Match {inputs['id']} failed to run: {e}\n{e.stderr}")
+            Match.objects.filter(uuid=inputs["id"], date__isnull=True).delete()
+        except Exception:
+            logger.exception(f"Match {inputs['id']} failed to run")
+            Match.objects.filter(uuid=inputs["id"], date__isnull=True).delete()
+        finally:
+            db.connection.close()
+
+    def run_match(self, inputs: dict) -> File:
+        """Runs the match, returning its result tarball."""
+        archive = tempfile.TemporaryFile()
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                if self.command:
+                    subprocess.run(
+                        self.command,
+                        input=json.dumps(inputs),
+                        text=True,
+                        cwd=directory,
+                        capture_output=True,
+                        timeout=settings.MATCH_TIMEOUT,
+                        check=True,
+                    )
+                else:
+                    self.play(inputs, directory)
+                if not os.path.exists(os.path.join(directory, f"{inputs['id']}.json")):
+                    raise WorkflowFailedToStartError("Match left no description.")
+
+                with tarfile.open(fileobj=archive, mode="w:xz") as result:
+                    for name in sorted(os.listdir(directory)):
+                        result.add(os.path.join(directory, name), arcname=name)
+        except BaseException:
+            archive.close()
+            raise
+        archive.seek(0)
+        return File(archive, name=f"{inputs['id']}.tar.xz")
+
+    def play(self, inputs: dict, directory: str):
+        """
+        Plays the match with the Halite environment in ``directory``, writing
+        the match description the workflow would.
+        """
+        bots = json.loads(inputs["bots"])
+        containers = [f"halite-{inputs['id']}-{n}" for n in range(len(bots))]
+        seed = random.randrange(1, 2**31)
+        args = [self.halite, "-q", "-o", "-d", inputs["map-size"], "-s", str(seed)]
+        for bot, container in zip(bots, containers):
+            args += [
+                shlex.join(
+                    [
+                        "docker",
+                        "run",
+                        "--rm",
+                        "-i",
+                        "--name",
+                        container,
+                        *settings.LOCAL_RUNNER_DOCKER_ARGS,
+                        bot["docker-image"],
+                    ]
+                ),
+                bot["name"],
+            ]
+
+        try:
+            process = subprocess.run(
+                args,
+                text=True,
+                cwd=directory,
+                capture_output=True,
+                timeout=settings.MATCH_TIMEOUT,
+                check=True,
+            )
+        finally:
+            # killing ``docker run`` leaves its container running
+            subprocess.run(
+                ["docker", "rm", "--force", *containers], capture_output=True
+            )
+
+        output = parse_halite_output(process.stdout, len(bots))
+        match = MatchDataClass(
+            id=inputs["id"],
+            date=timezone.now().isoformat(),
+            replay=output.replay,
+            seed=output.seed,
+            width=output.width,
+            height=output.height,
+            match_results=[
+                MatchResultDataClass(
+                    bot_name=bot["name"],
+                    docker_image=bot["docker-image"],
+                    rank=output.results[tag][0],
+                    last_frame_alive=output.results[tag][1],
+                    error_log=output.error_logs.get(tag),
+                )
+                for tag, bot in enumerate(bots, start=1)
+            ],
+            workflow_run_id=local_run_id(inputs["id"]),
+        )
+        with open(os.path.join(directory, f"{inputs['id']}.json"), "w") as f:
+            json.dump(match.to_dict(), f)
+
+
+BACKENDS = {"github": GithubBackend, "local": LocalBackend}
+_backend: Optional[RunnerBackend] = None
+
+
+def get_backend() -> RunnerBackend:
+    """This process' backend, picked by ``MATCH_RUNNER_BACKEND``."""
+    global _backend
+
+    if _backend is None:
+        _backend = BACKENDS[settings.MATCH_RUNNER_BACKEND]()
+    return _backend
+
+
+def start_matches(
+    bot_groups: Collection[Collection[Bot]], backend: Optional[RunnerBackend] = None
+) -> list[MatchStart]:
+    """
+    Starts a match for each group of bots, dispatching them together.
+    Returns what happened to each group, in order. Matches are created
+    before they are dispatched. On GitHub their run ids arrive later
+    through the workflow_run webhook (see ``views.WorkflowRunWebhookView``).
+    """
+    if backend is None:
+        backend = get_backend()
+
+    starts = [MatchStart(list(bots)) for bots in bot_groups]
+    for match_start in starts:
+        try:
+            check_players(match_start.bots)
+        except HaliteError as e:
+            match_start.error = e
+            metrics.MATCH_START_FAILURES.inc(backend=backend.name, reason="players")
+        else:
+            match_start.match = Match(uuid=uuid4())
+
+    pending = [match_start for match_start in starts if match_start.match]
+    allowed = backend.allowance(len(pending))
+    for match_start in pending[allowed:]:
+        match_start.match = None
+        match_start.error = GithubRateLimitError(
+            "Too little of the GitHub rate limit left to dispatch."
+        )
+    if pending[allowed:]:
+        metrics.MATCH_START_FAILURES.inc(
+            len(pending[allowed:]), backend=backend.name, reason="rate_limit"
+        )
+    pending = pending[:allowed]
+    if not pending:
+        return starts
+
+    Match.objects.bulk_create([match_start.match for match_start in pending])
+    try:
+        created = backend.dispatch(
+            [
+                dispatch_inputs(str(match_start.match.uuid), match_start.bots)
+                for match_start in pending
+            ]
+        )
+    except Exception:
+        # none of them can be told to have started
+        Match.objects.filter(
+            uuid__in=[match_start.match.uuid for match_start in pending]
+        ).delete()
+        raise
+
+    failed = []
+    for match_start, ok in zip(pending, created):
+        if not ok:
+            failed.append(match_start.match.uuid)
+            match_start.match = None
+            match_start.error = WorkflowFailedToStartError(
+                "Workflow dispatch did not succeed."
+            )
+    if failed:
+        Match.objects.filter(uuid__in=failed).delete()
+        metrics.MATCH_START_FAILURES.inc(
+            len(failed), backend=backend.name, reason="dispatch"
+        )
+    metrics.MATCHES_DISPATCHED.inc(len(pending) - len(failed), backend=backend.name)
+
+    return starts
 
-    match, created = Match.objects.get_or_create(
-        uuid=match_id, defaults=dict(run_id=run.id)
-    )
 
-    return match
+def start_match(
+    bots: Collection[Bot], backend: Optional[RunnerBackend] = None
+) -> Match:
+    (match_start,) = start_matches([bots], backend)
+    if match_start.error is not None:
+        raise match_start.error
+    return match_start.match
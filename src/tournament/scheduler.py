@@ -0,0 +1,156 @@
+"""
+Keeps a number of matches running at once (see the schedulematches command).
+"""
+import logging
+import math
+import random
+import time
+from collections.abc import Collection
+from datetime import datetime
+from typing import Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from tournament.models import Bot, Match
+from tournament.runner import (
+    SEED_MAX_MATCHES,
+    SEED_RECENT_POOL,
+    SEED_SELECTIONS,
+    RunnerBackend,
+    get_backend,
+    get_players_for_seed,
+    seed_bots,
+    start_matches,
+    with_activity,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SeedPool:
+    """
+    The bots that can seed a match, with when they last played and how many
+    matches their image has. The pool is loaded from the database every
+    ``ttl`` seconds and updated in memory as matches are started in between,
+    so picking a seed player costs no queries. Picks the way
+    ``runner.pick_seed_player`` does.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.bots: list[Bot] = []
+        self.loaded_at: Optional[float] = None
+
+    def refresh(self):
+        self.bots = list(with_activity(seed_bots()))
+        self.loaded_at = time.monotonic()
+
+    def refresh_if_stale(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > self.ttl:
+            self.refresh()
+
+    @staticmethod
+    def _last_played(bot: Bot) -> datetime:
+        # bots that never played first
+        return bot.last_game_date or datetime.min.replace(tzinfo=timezone.utc)
+
+    def pick(self, seed_selection: Optional[int] = None) -> Optional[Bot]:
+        if not self.bots:
+            return None
+        if seed_selection is None:
+            seed_selection = random.choice(SEED_SELECTIONS)
+
+        if seed_selection == 1:
+            return max(self.bots, key=lambda b: random.random() * math.exp(b.sigma))
+        if seed_selection == 2:
+            candidates = sorted(
+                (b for b in self.bots if b.match_count < SEED_MAX_MATCHES),
+                key=self._last_played,
+            )[:SEED_RECENT_POOL]
+            return random.choice(candidates) if candidates else None
+        return min(self.bots, key=self._last_played)
+
+    def started(self, bots: Collection[Bot]):
+        """Records that ``bots`` just started a match."""
+        now = timezone.now()
+        for bot in self.bots:
+            if bot in bots:
+                bot.last_game_date = now
+                bot.match_count += 1
+
+
+class MatchScheduler:
+    """
+    Starts matches while fewer than ``concurrency`` are running and fewer
+    than ``max_queued_runs`` are waiting for somewhere to run.
+    """
+
+    def __init__(
+        self,
+        pool: SeedPool,
+        concurrency: Optional[int] = None,
+        max_queued_runs: Optional[int] = None,
+        backend: Optional[RunnerBackend] = None,
+    ):
+        self.pool = pool
+        self.concurrency = concurrency or settings.MATCH_CONCURRENCY
+        self.max_queued_runs = (
+            settings.MATCH_MAX_QUEUED_RUNS
+            if max_queued_runs is None
+            else max_queued_runs
+        )
+        self.backend = backend if backend is not None else get_backend()
+
+    def capacity(self) -> int:
+        """How many more matches can be started right now."""
+        free = self.concurrency - Match.in_flight().count()
+        if free <= 0:
+            return 0
+        queued = self.backend.queued()
+        if queued >= self.max_queued_runs:
+            logger.info(f"{queued} matches queued, waiting for runners")
+            return 0
+        allowed = self.backend.allowance(free)
+        if allowed < free:
+            logger.warning(f"Runner allows starting {allowed} of {free} matches")
+        return allowed
+
+    def pick_groups(self, count: int) -> list[list[Bot]]:
+        """Up to ``count`` groups of players, each around a seed player."""
+        groups = []
+        for _ in range(count):
+            seed_player = self.pool.pick()
+            if seed_player is None:
+                logger.warning("No bots can seed a match")
+                break
+
+            players = get_players_for_seed(seed_player)
+            self.pool.started(players)
+            groups.append(players)
+        return groups
+
+    def tick(self) -> list[Match]:
+        """
+        Starts matches up to the current capacity in one batch, returning
+        those that started. Errors are logged rather than raised, for the
+        next tick to try again.
+        """
+        started = []
+        try:
+            self.pool.refresh_if_stale()
+            self.backend.reconcile()
+
+            groups = self.pick_groups(self.capacity())
+            if groups:
+                for match_start in start_matches(groups, self.backend):
+                    if match_start.error is not None:
+                        logger.error(
+                            f"Failed to start a match seeded by "
+                            f"{match_start.bots[0]}: {match_start.error}"
+                        )
+                    else:
+                        started.append(match_start.match)
+        except Exception:
+            logger.exception("Failed to start matches")
+        return started
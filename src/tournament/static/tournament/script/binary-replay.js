@@ -0,0 +1,208 @@
+// Reads replays in the binary format (see tournament/replays.py) back into
+// the replay JSON text, replaying the moves from the first frame.
+const BINARY_REPLAY_MAGIC = [0x48, 0x4c, 0x54, 0x42] // "HLTB"
+const BINARY_REPLAY_ALIGNMENT = 8
+const BINARY_REPLAY_TYPES = {
+    "|u1": Uint8Array,
+    "<u2": Uint16Array,
+    "<u4": Uint32Array,
+    "|i1": Int8Array,
+    "<i2": Int16Array,
+    "<i4": Int32Array,
+}
+const BINARY_REPLAY_MAX_STRENGTH = 255
+// row and column offsets of STILL, NORTH, EAST, SOUTH, WEST
+const BINARY_REPLAY_DIRECTIONS = [[0, 0], [-1, 0], [0, 1], [1, 0], [0, -1]]
+const BINARY_REPLAY_MOVE_CONTEXTS = 16
+
+function isBinaryReplay(bytes) {
+    return bytes.length >= BINARY_REPLAY_MAGIC.length && BINARY_REPLAY_MAGIC.every((b, i) => bytes[i] === b)
+}
+
+// Value `index` of the `bits` bit integers packed most significant bit first.
+function unpackBinaryReplayValue(bytes, index, bits) {
+    let value = 0
+    for (let bit = index * bits; bit < (index + 1) * bits; bit++) {
+        value = (value << 1) | ((bytes[bit >> 3] >> (7 - (bit & 7))) & 1)
+    }
+    return value
+}
+
+// The frame after `moves` are made, by the rules of the game, the same way
+// as next_frame in tournament/replays.py. Updates owners and strengths.
+function nextBinaryReplayFrame(owners, strengths, moves, productions, players, height, width) {
+    const cells = height * width
+    const neighbour = (cell, direction) => {
+        const [dy, dx] = BINARY_REPLAY_DIRECTIONS[direction]
+        const y = (Math.floor(cell / width) + dy + height) % height
+        const x = ((cell % width) + dx + width) % width
+        return y * width + x
+    }
+
+    // pieces that stay still gain production, pieces of the same player
+    // moving onto the same cell merge, and every cell a player moved off
+    // still holds a piece of strength 0
+    const pieces = new Float64Array(players * cells)
+    const present = new Uint8Array(players * cells)
+    const sites = new Float64Array(cells)
+    for (let cell = 0; cell < cells; cell++) {
+        const owner = owners[cell]
+        if (owner === 0) {
+            sites[cell] = strengths[cell]
+            continue
+        }
+        let strength = strengths[cell]
+        if (moves[cell] === 0) {
+            strength = Math.min(strength + productions[cell], BINARY_REPLAY_MAX_STRENGTH)
+        }
+        const target = owner * cells + neighbour(cell, moves[cell])
+        pieces[target] += strength
+        present[target] = 1
+        present[owner * cells + cell] = 1
+    }
+    for (let i = 0; i < pieces.length; i++) {
+        pieces[i] = Math.min(pieces[i], BINARY_REPLAY_MAX_STRENGTH)
+    }
+
+    // every piece damages the pieces of other players on and next to its
+    // cell, and unowned cells with strength the pieces on them
+    const damage = new Float64Array(players * cells)
+    const injured = new Uint8Array(players * cells)
+    const siteDamage = new Float64Array(cells)
+    for (let player = 1; player < players; player++) {
+        for (let cell = 0; cell < cells; cell++) {
+            const piece = player * cells + cell
+            if (!present[piece]) {
+                continue
+            }
+            for (let direction = 0; direction < BINARY_REPLAY_DIRECTIONS.length; direction++) {
+                const target = neighbour(cell, direction)
+                for (let other = 1; other < players; other++) {
+                    if (other !== player && present[other * cells + target]) {
+                        damage[other * cells + target] += pieces[piece]
+                        injured[other * cells + target] = 1
+                    }
+                }
+            }
+            if (sites[cell] > 0) {
+                damage[piece] += sites[cell]
+                injured[piece] = 1
+                siteDamage[cell] += pieces[piece]
+            }
+        }
+    }
+
+    // pieces taking at least their strength in damage die
+    for (let cell = 0; cell < cells; cell++) {
+        owners[cell] = 0
+        strengths[cell] = Math.max(sites[cell] - siteDamage[cell], 0)
+    }
+    for (let player = 1; player < players; player++) {
+        for (let cell = 0; cell < cells; cell++) {
+            const piece = player * cells + cell
+            if (present[piece] && !(injured[piece] && damage[piece] >= pieces[piece])) {
+                owners[cell] = player
+                strengths[cell] = injured[piece] ? pieces[piece] - damage[piece] : pieces[piece]
+            }
+        }
+    }
+}
+
+function binaryReplayToText(bytes) {
+    const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength)
+    const version = view.getUint16(4, true)
+    if (version !== 2) {
+        throw new Error("Unsupported binary replay version " + version)
+    }
+    let offset = 12 + view.getUint32(8, true)
+    const header = JSON.parse(new TextDecoder().decode(bytes.subarray(12, offset)))
+
+    const arrays = {}
+    for (const [name, dtype, shape] of header.arrays) {
+        offset += (BINARY_REPLAY_ALIGNMENT - offset % BINARY_REPLAY_ALIGNMENT) % BINARY_REPLAY_ALIGNMENT
+        const type = BINARY_REPLAY_TYPES[dtype]
+        const length = shape.reduce((a, b) => a * b, 1) * type.BYTES_PER_ELEMENT
+        // copied so every array starts at an offset aligned for its type
+        const start = bytes.byteOffset + offset
+        arrays[name] = new type(bytes.buffer.slice(start, start + length))
+        offset += length
+    }
+
+    const height = header.fields.height
+    const width = header.fields.width
+    const cells = height * width
+
+    function toGrid(cellValue) {
+        const grid = []
+        for (let y = 0; y < height; y++) {
+            const row = []
+            for (let x = 0; x < width; x++) {
+                row.push(cellValue(y * width + x))
+            }
+            grid.push(row)
+        }
+        return grid
+    }
+
+    // each context's bits of whether its pieces moved start on a new byte
+    const moved = []
+    let movedOffset = 0
+    for (const count of header.moved_counts) {
+        moved.push({bytes: arrays.moved.subarray(movedOffset), next: 0})
+        movedOffset += Math.ceil(count / 8)
+    }
+
+    const owners = new Int32Array(cells)
+    const strengths = new Int32Array(cells)
+    if (header.num_frames) {
+        owners.set(arrays.first_owners)
+        strengths.set(arrays.first_strengths)
+    }
+    const frameMoves = new Uint8Array(cells)
+    const frames = []
+    const moves = []
+    let delta = 0
+    let direction = 0
+    let stray = 0
+    for (let frame = 0; frame < header.num_frames; frame++) {
+        if (frame) {
+            nextBinaryReplayFrame(owners, strengths, frameMoves, arrays.productions, header.players, height, width)
+            for (const end = delta + arrays.delta_counts[frame]; delta < end; delta++) {
+                const cell = arrays.delta_cells[delta]
+                owners[cell] = arrays.delta_owners[delta]
+                strengths[cell] = arrays.delta_strengths[delta]
+            }
+        }
+        frames.push(toGrid(cell => [owners[cell], strengths[cell]]))
+        if (frame === arrays.stray_counts.length) {
+            break
+        }
+
+        frameMoves.fill(0)
+        for (let cell = 0; cell < cells; cell++) {
+            if (owners[cell] === 0) {
+                continue
+            }
+            const ratio = Math.floor(strengths[cell] / Math.max(arrays.productions[cell], 1))
+            const context = moved[Math.min(Math.max(ratio, 0), BINARY_REPLAY_MOVE_CONTEXTS - 1)]
+            if (unpackBinaryReplayValue(context.bytes, context.next++, 1)) {
+                frameMoves[cell] = unpackBinaryReplayValue(arrays.directions, direction++, 2) + 1
+            }
+        }
+        for (const end = stray + arrays.stray_counts[frame]; stray < end; stray++) {
+            frameMoves[arrays.stray_cells[stray]] = arrays.stray_moves[stray]
+        }
+        moves.push(toGrid(cell => frameMoves[cell]))
+    }
+
+    const values = Object.assign({}, header.fields, {
+        frames: frames,
+        moves: moves,
+        productions: toGrid(cell => arrays.productions[cell]),
+    })
+    const game = {}
+    for (const key of header.keys) {
+        game[key] = values[key]
+    }
+    return JSON.stringify(game)
+}
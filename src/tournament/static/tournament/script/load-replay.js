@@ -16,14 +16,14 @@ $(() => {
                 if (!isMinimal) {
                     $elem.html(`<h1><span class="glyphicon glyphicon-refresh glyphicon-refresh-animate"></span> Preparing replay...</h1>`);
                 }
-                let data = await response.arrayBuffer()
-                let text
+                let data = new Uint8Array(await response.arrayBuffer())
                 try {
-                    text = pako.inflate(data, {to: 'string'});
+                    data = pako.inflate(data);
                 } catch (err) {
-                    text = new TextDecoder().decode(data);
+                    // already decoded by the browser (Content-Encoding)
                 }
                 try {
+                    const text = isBinaryReplay(data) ? binaryReplayToText(data) : new TextDecoder().decode(data);
                     showGame(textToGame(text), $elem, {
                         showmovement: true,
                         isminimal: isMinimal,
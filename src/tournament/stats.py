@@ -0,0 +1,225 @@
+"""
+Per-player match statistics computed from replay arrays.
+
+Moves are replayed with the same rules as ``processFrame`` in the
+visualizer's parse-replay.js, vectorized over players, cells and a chunk of
+frames at a time. Unlike the visualizer, damage dealt is capped at each
+target's strength and overkill is the damage an attacker dealt that its
+targets no longer had the strength to take.
+"""
+from typing import Optional
+
+import numpy as np
+
+from tournament.exceptions import ReplayFormatError
+from tournament.replays import DIRECTIONS, MAX_STRENGTH, ReplayArrays, per_player
+
+SIMULATED = [
+    "production_captured",
+    "cap_losses",
+    "damage_dealt",
+    "environment_damage",
+    "damage_taken",
+    "overkill_damage",
+]
+# cells times pairs of players simulated at a time
+SIMULATED_CELLS = 1 << 18
+
+
+def _neighbors(grid: np.ndarray, direction: int) -> np.ndarray:
+    """``grid[..., y, x]`` moved so each cell holds the value of its
+    neighbour in ``direction``, wrapping around the map."""
+    dy, dx = DIRECTIONS[direction]
+    return np.roll(grid, (-dy, -dx), axis=(-2, -1))
+
+
+def _per_player(values: np.ndarray) -> np.ndarray:
+    """Sums ``[t, player, y, x]`` over the cells."""
+    return values.sum(axis=(-2, -1))
+
+
+def _total(values: np.ndarray) -> np.ndarray:
+    """Sums ``[t, ..., y, x]`` over everything but the frames."""
+    return values.reshape(len(values), -1).sum(axis=1)
+
+
+def _simulate(owners, strengths, moves, productions, players) -> dict:
+    """
+    Replays the moves of frames ``owners``/``strengths`` (``[t, y, x]``) and
+    returns ``[t, player]`` totals of what happened during each frame.
+    """
+    frames, height, width = owners.shape
+    owners = owners.astype(np.intp)
+    strengths = strengths.astype(np.int64)
+    productions = productions.astype(np.int64)
+    owned = owners > 0
+
+    # pieces that stay still gain production, up to the maximum strength
+    still = owned & (moves == 0)
+    gained = np.where(still, np.clip(MAX_STRENGTH - strengths, 0, productions), 0)
+    cap_losses = np.where(
+        still, np.maximum(strengths + productions - MAX_STRENGTH, 0), 0
+    )
+    moving = strengths + gained
+
+    # pieces of the same player moving onto the same cell merge, and every
+    # cell a player moved off still holds a piece of strength 0
+    ys, xs = np.indices((height, width))
+    ty = (ys + DIRECTIONS[moves, 0]) % height
+    tx = (xs + DIRECTIONS[moves, 1]) % width
+    slots = np.arange(frames)[:, None, None] * players + owners
+    targets = ((slots * height + ty) * width + tx)[owned]
+    origins = ((slots * height + ys) * width + xs)[owned]
+
+    size = frames * players * height * width
+    shape = (frames, players, height, width)
+    merged = np.bincount(targets, weights=moving[owned], minlength=size)
+    merged = merged.astype(np.int64).reshape(shape)
+    present = (
+        np.bincount(targets, minlength=size) + np.bincount(origins, minlength=size)
+    ).reshape(shape) > 0
+    present[:, 0] = False
+    pieces = np.minimum(merged, MAX_STRENGTH)
+    merge_losses = merged - pieces
+
+    # every piece damages the pieces of other players on and next to its
+    # cell, and unowned cells with strength the pieces on them. Damage dealt
+    # is capped at the target's strength, and the part of it the target no
+    # longer had left after the hits before (in player, then direction order)
+    # is the attacker's overkill
+    environment = np.where(owners == 0, strengths, 0)
+    fighting = present & (environment[:, None] > 0)
+    remaining = pieces.copy()
+    environment_remaining = environment.copy()
+    damage_dealt = np.zeros((frames, players), dtype=np.int64)
+    environment_damage = np.zeros((frames, players), dtype=np.int64)
+    overkill = np.zeros((frames, players), dtype=np.int64)
+    damage_received = np.where(fighting, environment[:, None], 0)
+    opponents = np.zeros(shape, dtype=np.int64)
+    others = ~np.eye(players, dtype=bool)[:, None, :, None, None]
+    for player in range(1, players):
+        for direction in range(len(DIRECTIONS)):
+            # hits[t, q, y, x]: q has a piece at (y, x), player one next to it
+            hits = (
+                others[player]
+                & present
+                & _neighbors(present[:, player], direction)[:, None]
+            )
+            attacker = _neighbors(pieces[:, player], direction)[:, None]
+            dealt = np.where(hits, np.minimum(attacker, pieces), 0)
+            effective = np.where(hits, np.minimum(attacker, remaining), 0)
+            remaining -= effective
+            damage_dealt[:, player] += _total(dealt)
+            overkill[:, player] += _total(dealt - effective)
+            damage_received += np.where(hits, attacker, 0)
+            opponents += hits
+
+        attacker = pieces[:, player]
+        dealt = np.where(fighting[:, player], np.minimum(attacker, environment), 0)
+        effective = np.where(
+            fighting[:, player], np.minimum(attacker, environment_remaining), 0
+        )
+        environment_remaining -= effective
+        environment_damage[:, player] += _total(dealt)
+        overkill[:, player] += _total(dealt - effective)
+
+    damage_taken = np.where(present, np.minimum(damage_received, pieces), 0)
+
+    def by_owner(values):
+        return (
+            np.bincount(slots[owned], weights=values[owned], minlength=frames * players)
+            .astype(np.int64)
+            .reshape(frames, players)
+        )
+
+    return {
+        "pieces_in_contact": _per_player(opponents > 0),
+        "production_captured": by_owner(gained),
+        "cap_losses": by_owner(cap_losses) + _per_player(merge_losses),
+        "damage_dealt": damage_dealt,
+        "environment_damage": environment_damage,
+        "damage_taken": _per_player(damage_taken),
+        "overkill_damage": overkill,
+    }
+
+
+def player_stats(replay: ReplayArrays, chunk_size: Optional[int] = None) -> list[dict]:
+    """
+    Statistics of every player in the replay, in player order. Frames are
+    decoded and processed ``chunk_size`` at a time, by default as many as
+    keep the simulation to about ``SIMULATED_CELLS`` cells, so memory
+    doesn't grow with the length of the replay.
+
+    First contact is the first frame in which a player's pieces fight
+    another player's. Territories never touch in recorded frames, since
+    fighting pieces are removed before the frame is written.
+    """
+    players = replay.num_players + 1
+    cells = replay.productions.size
+    if chunk_size is None:
+        chunk_size = max(1, SIMULATED_CELLS // (players * players * cells))
+
+    totals = {name: np.zeros(players, dtype=np.int64) for name in SIMULATED}
+    territory, strength = [], []
+    in_contact = [np.zeros((0, players), dtype=bool)]
+    for frames, moves in replay.iter_turns(chunk_size):
+        owners, strengths = frames[..., 0], frames[..., 1]
+        territory.append(per_player(owners, players))
+        strength.append(per_player(owners, players, strengths).astype(np.int64))
+
+        if not len(moves):
+            continue
+        frame_totals = _simulate(
+            owners[: len(moves)],
+            strengths[: len(moves)],
+            moves,
+            replay.productions,
+            players,
+        )
+        in_contact.append(frame_totals.pop("pieces_in_contact") > 0)
+        for name, values in frame_totals.items():
+            totals[name] += values.sum(axis=0)
+
+    territory = np.concatenate(territory)
+    strength = np.concatenate(strength)
+    in_contact = np.concatenate(in_contact)
+    stats = []
+    for player in range(1, players):
+        contact_frames = np.flatnonzero(in_contact[:, player])
+        stats.append(
+            {
+                "player": player,
+                "peak_territory": int(territory[:, player].max()),
+                "peak_territory_frame": int(territory[:, player].argmax()),
+                "peak_territory_share": float(territory[:, player].max() / cells),
+                "final_territory": int(territory[-1, player]),
+                "peak_strength": int(strength[:, player].max()),
+                "first_contact_frame": (
+                    int(contact_frames[0]) if len(contact_frames) else None
+                ),
+                **{name: int(values[player]) for name, values in totals.items()},
+                "territory_curve": territory[:, player].tolist(),
+                "strength_curve": strength[:, player].tolist(),
+            }
+        )
+    return stats
+
+
+def stats_by_bot(bot_names: list[str], replay: ReplayArrays) -> dict[str, dict]:
+    """
+    Player statistics keyed by bot name. Players are matched to bots by name
+    when the replay's player names are the bot names, otherwise in the order
+    the bots are listed in the match results.
+    """
+    player_names = replay.fields.get("player_names", [])
+    if len(set(player_names)) == len(player_names) and sorted(player_names) == sorted(
+        bot_names
+    ):
+        bot_names = player_names
+
+    all_stats = player_stats(replay)
+    if len(all_stats) != len(bot_names):
+        raise ReplayFormatError(
+            f"Replay has {len(all_stats)} players, the match {len(bot_names)} bots"
+        )
+    return dict(zip(bot_names, all_stats))
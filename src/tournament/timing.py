@@ -0,0 +1,169 @@
+"""
+Per-request timing of database queries, template rendering and storage.
+
+``RequestTimingMiddleware`` sends each request's totals in a
+``Server-Timing`` header and logs requests slower than
+``SLOW_REQUEST_THRESHOLD`` seconds as JSON, with the statements they ran
+most often (see the reportslowrequests command). Templates and storage are
+timed by wrapping their methods once, in ``instrument``. Outside of a
+request the wrappers only check that there is none. The totals overlap:
+a query run while rendering a template counts towards both.
+"""
+import functools
+import json
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Optional
+
+from django.conf import settings
+from django.core.files.storage import storages
+from django.db import connections
+from django.template.backends.django import Template
+
+logger = logging.getLogger(__name__)
+
+# starts each slow request log message, followed by a JSON object
+SLOW_REQUEST = "slow request"
+STORAGE_METHODS = ["open", "save", "delete", "exists", "size", "url", "listdir"]
+
+
+@dataclass
+class RequestTimings:
+    queries: int = 0
+    db_time: float = 0.0
+    template_time: float = 0.0
+    storage_time: float = 0.0
+    # count and time of each statement run, by its SQL
+    statements: dict[str, tuple[int, float]] = field(default_factory=dict)
+    # totals being timed, so nested calls aren't counted twice
+    active: set[str] = field(default_factory=set)
+
+    def execute(self, execute, sql, params, many, context):
+        """A database execute wrapper, timing every query."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            count, total = self.statements.get(sql, (0, 0.0))
+            self.statements[sql] = (count + 1, total + elapsed)
+
+    def duplicates(self, top: int) -> list[dict]:
+        """The ``top`` statements run more than once, most repeated first."""
+        repeated = sorted(
+            (
+                (count, total, sql)
+                for sql, (count, total) in self.statements.items()
+                if count > 1
+            ),
+            key=lambda statement: (-statement[0], -statement[1]),
+        )
+        return [
+            dict(sql=sql, count=count, ms=round(total * 1000, 1))
+            for count, total, sql in repeated[:top]
+        ]
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def timed(total: str):
+    """Adds the time the wrapped method takes to ``total`` of the request's."""
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            timings = _current.get()
+            if timings is None or total in timings.active:
+                return method(*args, **kwargs)
+
+            timings.active.add(total)
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                setattr(
+                    timings,
+                    total,
+                    getattr(timings, total) + time.perf_counter() - start,
+                )
+                timings.active.discard(total)
+
+        return wrapper
+
+    return decorator
+
+
+@functools.cache
+def instrument():
+    """Wraps template rendering and the configured storages' I/O methods."""
+    Template.render = timed("template_time")(Template.render)
+
+    for alias in settings.STORAGES:
+        # static files are served by whitenoise, not read through storage
+        if alias == "staticfiles":
+            continue
+        storage_class = type(storages[alias])
+        for name in STORAGE_METHODS:
+            method = getattr(storage_class, name, None)
+            if method is not None:
+                setattr(storage_class, name, timed("storage_time")(method))
+
+
+def server_timing(timings: RequestTimings, total: float) -> str:
+    return ", ".join(
+        [
+            f'db;dur={timings.db_time * 1000:.1f};desc="{timings.queries} queries"',
+            f"template;dur={timings.template_time * 1000:.1f}",
+            f"storage;dur={timings.storage_time * 1000:.1f}",
+            f"total;dur={total * 1000:.1f}",
+        ]
+    )
+
+
+class RequestTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument()
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings.execute))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        total = time.perf_counter() - start
+
+        response["Server-Timing"] = server_timing(timings, total)
+        if total >= settings.SLOW_REQUEST_THRESHOLD:
+            self.log_slow_request(request, response, timings, total)
+        return response
+
+    @staticmethod
+    def log_slow_request(request, response, timings: RequestTimings, total: float):
+        match = request.resolver_match
+        record = dict(
+            view=match.view_name if match is not None else None,
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+            ms=round(total * 1000, 1),
+            queries=timings.queries,
+            db_ms=round(timings.db_time * 1000, 1),
+            template_ms=round(timings.template_time * 1000, 1),
+            storage_ms=round(timings.storage_time * 1000, 1),
+            duplicates=timings.duplicates(settings.SLOW_REQUEST_STATEMENTS),
+        )
+        logger.warning(f"{SLOW_REQUEST} {json.dumps(record)}")
@@ -10,7 +10,19 @@ urlpatterns = [
     path("profile/", views.BotPrivateDetailView.as_view(), name="profile"),
     path("profile/edit/", views.BotPrivateUpdateView.as_view(), name="profile_edit"),
     path("bot/<str:name>/", views.BotDetailView.as_view(), name="bot_detail"),
+    path(
+        "bot/<str:name>/head-to-head/",
+        views.BotHeadToHeadView.as_view(),
+        name="bot_head_to_head",
+    ),
+    path("ratings/", views.RatingHistoryView.as_view(), name="rating_history"),
+    path("head-to-head/", views.HeadToHeadView.as_view(), name="head_to_head"),
     path("match/<uuid:uuid>/", views.MatchDetailView.as_view(), name="match_detail"),
+    path(
+        "match/<uuid:uuid>/replay/",
+        views.MatchReplayView.as_view(),
+        name="match_replay",
+    ),
     path(
         "recent/",
         views.MatchListView.as_view(),
@@ -37,4 +49,10 @@ urlpatterns = [
         views.MatchResultView.as_view(),
         name="match_result",
     ),
+    path(
+        "api/v1/github-webhook/",
+        views.WorkflowRunWebhookView.as_view(),
+        name="github_webhook",
+    ),
+    path("api/v1/metrics/", views.MetricsView.as_view(), name="metrics"),
 ]
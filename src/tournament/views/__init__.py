@@ -1,5 +1,13 @@
-from .api import MatchResultView
+from .api import MatchResultView, MetricsView, WorkflowRunWebhookView
 from .auth import login, logout
-from .bot import BotDetailView, BotListView, BotPrivateDetailView, BotPrivateUpdateView
+from .bot import (
+    BotDetailView,
+    BotHeadToHeadView,
+    BotListView,
+    BotPrivateDetailView,
+    BotPrivateUpdateView,
+    HeadToHeadView,
+    RatingHistoryView,
+)
 from .documentation import documentation
-from .match import MatchDetailView, MatchListView
+from .match import MatchDetailView, MatchListView, MatchReplayView
@@ -1,8 +1,16 @@
-from django.db import transaction
+import hashlib
+import hmac
+import tarfile
+from uuid import UUID
+
+from django.conf import settings
+from django.http import HttpResponse
 from rest_framework import authentication, exceptions, parsers, permissions, views
 from rest_framework.response import Response
 
-from tournament.models import Match
+from tournament import metrics
+from tournament.github_client import MATCH_REPOSITORY
+from tournament.models import Match, MatchUpload
 
 
 class MatchResultView(views.APIView):
@@ -10,7 +18,6 @@ class MatchResultView(views.APIView):
     authentication_classes = [authentication.TokenAuthentication]
     permission_classes = [permissions.IsAdminUser]
 
-    @transaction.atomic
     def post(self, request):
         if "result" not in request.data:
             raise exceptions.ParseError(
@@ -24,11 +31,97 @@ class MatchResultView(views.APIView):
             )
 
         try:
-            Match.create_from_tar(file)
-        except Exception as e:
-            print(f"Failed to process upload: {e}")
+            match_id = UUID(file.name[:-7])
+        except ValueError:
+            raise exceptions.ParseError(
+                detail="File name must be the match id.", code="bad_filename"
+            )
+
+        # the worker records it later, so at least check it can be read now
+        try:
+            with tarfile.open(mode="r", fileobj=file):
+                pass
+        except tarfile.TarError:
+            raise exceptions.ParseError(
+                detail="File is not a readable tarball.", code="bad_archive"
+            )
+        finally:
+            file.seek(0)
+
+        metrics.UPLOAD_BYTES.observe(file.size)
+        upload = MatchUpload.enqueue(file, match_id)
+
+        return Response(
+            data=dict(uuid=str(upload.uuid), status=upload.status), status=202
+        )
+
+
+class HasGithubSignature(permissions.BasePermission):
+    """Allows requests signed with ``GITHUB_WEBHOOK_SECRET``, as github does,
+    and none while it is unset."""
+
+    def has_permission(self, request, view):
+        if not settings.GITHUB_WEBHOOK_SECRET:
+            return False
+        signature = request.headers.get("X-Hub-Signature-256", "")
+        expected = hmac.new(
+            settings.GITHUB_WEBHOOK_SECRET.encode(), request.body, hashlib.sha256
+        ).hexdigest()
+        return hmac.compare_digest(signature, f"sha256={expected}")
+
+
+class WorkflowRunWebhookView(views.APIView):
+    """
+    Receives the match repository's workflow_run events and fills in the run
+    id of the match each run is titled after.
+    """
+
+    parser_classes = [parsers.JSONParser]
+    authentication_classes = []
+    permission_classes = [HasGithubSignature]
+
+    def post(self, request):
+        event = request.headers.get("X-GitHub-Event")
+        if event != "workflow_run":
+            return Response(data=dict(event=event, recorded=False))
+
+        try:
+            repository = request.data["repository"]["full_name"]
+            run = request.data["workflow_run"]
+            display_title, run_id = run["display_title"], int(run["id"])
+        except (KeyError, TypeError, ValueError):
             raise exceptions.ParseError(
-                detail="Failed to process the file.", code="file_malformed"
+                detail="Malformed workflow_run event.", code="bad_event"
             )
 
-        return Response(status=204)
+        recorded = repository == MATCH_REPOSITORY and Match.record_run(
+            display_title, run_id
+        )
+        metrics.WEBHOOKS.inc(recorded=str(recorded).lower())
+        return Response(data=dict(event=event, recorded=recorded))
+
+
+class HasMetricsToken(permissions.BasePermission):
+    """Allows requests with ``METRICS_TOKEN`` as their bearer token, and none
+    while it is unset."""
+
+    def has_permission(self, request, view):
+        if not settings.METRICS_TOKEN:
+            return False
+        return hmac.compare_digest(
+            request.headers.get("Authorization", ""),
+            f"Bearer {settings.METRICS_TOKEN}",
+        )
+
+
+class MetricsView(views.APIView):
+    """Every process' metrics, in the Prometheus text format."""
+
+    authentication_classes = []
+    permission_classes = [HasMetricsToken]
+
+    def get(self, request):
+        return HttpResponse(
+            metrics.registry.exposition(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
@@ -1,67 +1,72 @@
+from collections import defaultdict
+
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
-from django.db.models import F, Func, OuterRef, Subquery, Window
-from django.db.models.functions import Rank
+from django.db.models import Sum
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.views import generic
 
 from crispy_forms.layout import Submit
 
-from tournament.models import Bot, MatchResult
+from tournament.forms import BotForm
+from tournament.models import (
+    Bot,
+    HeadToHead,
+    LeaderboardEntry,
+    Match,
+    MatchResult,
+    RatingPoint,
+)
 
-from .generic import DetailListView, FormHelperMixin
+from .generic import CursorPaginationMixin, DetailListView, FormHelperMixin
 
 
 class BotListView(generic.ListView):
-    model = Bot
     paginate_by = 20
+    template_name = "tournament/bot_list.html"
+    context_object_name = "leaderboard"
 
     def get_queryset(self):
-        return (
-            super()
-            .get_queryset()
-            .filter(enabled=True)
-            .exclude(docker_image__exact="")
-            .annotate(
-                rank=Window(
-                    expression=Rank(), order_by=(F("mu") - (F("sigma") * 3)).desc()
-                ),
-                match_count=Subquery(
-                    MatchResult.objects.filter(
-                        bot=OuterRef("pk"), docker_image=OuterRef("docker_image")
-                    )
-                    .annotate(count=Func(F("pk"), function="Count"))
-                    .values("count")
-                ),
-            )
-            .order_by((F("mu") - (F("sigma") * 3)).desc(), "-mu", "user__username")
-        )
+        return LeaderboardEntry.cached()
+
+
+def bot_match_results(bot: Bot):
+    return (
+        MatchResult.objects.filter(bot=bot)
+        .exclude(match__replay__isnull=True)
+        .select_related("match", "stats")
+        .prefetch_related(Match.prefetch_results("match__results"))
+    )
 
 
-class BotPrivateDetailView(LoginRequiredMixin, DetailListView):
+class BotPrivateDetailView(LoginRequiredMixin, CursorPaginationMixin, DetailListView):
     model = Bot
     paginate_by = 20
+    paginate_keys = ["-match_date", "-match_id"]
     template_name_suffix = "_private_detail"
 
+    def get_queryset(self):
+        return super().get_queryset().select_related("user").with_summary()
+
     def get_object(self, queryset=None):
         if queryset is None:
             queryset = self.get_queryset()
         return get_object_or_404(queryset, user=self.request.user)
 
     def get_object_list(self):
-        return (
-            MatchResult.objects.filter(bot=self.get_object())
-            .exclude(match__replay__isnull=True)
-            .order_by("-match__date")
-        )
+        return bot_match_results(self.object)
 
 
 class BotPrivateUpdateView(
     LoginRequiredMixin, SuccessMessageMixin, FormHelperMixin, generic.UpdateView
 ):
     model = Bot
-    fields = ["docker_image"]
+    form_class = BotForm
     template_name_suffix = "_private_update"
     success_message = "Updated Docker Image successfully!"
 
@@ -82,15 +87,170 @@ class BotPrivateUpdateView(
         return get_object_or_404(queryset, user=self.request.user)
 
 
-class BotDetailView(DetailListView):
+class BotDetailView(CursorPaginationMixin, DetailListView):
     model = Bot
     paginate_by = 20
+    paginate_keys = ["-match_date", "-match_id"]
     slug_field = "user__username"
     slug_url_kwarg = "name"
 
+    def get_queryset(self):
+        return super().get_queryset().select_related("user").with_summary()
+
     def get_object_list(self):
-        return (
-            MatchResult.objects.filter(bot=self.get_object())
-            .exclude(match__replay__isnull=True)
-            .order_by("-match__date")
+        return bot_match_results(self.object)
+
+
+class BotHeadToHeadView(generic.DetailView):
+    """How the bot's current image did against each of its opponents."""
+
+    model = Bot
+    slug_field = "user__username"
+    slug_url_kwarg = "name"
+    template_name_suffix = "_head_to_head"
+
+    def get_queryset(self):
+        return super().get_queryset().select_related("user")
+
+    def get_context_data(self, **kwargs):
+        records = list(
+            HeadToHead.objects.filter(
+                bot=self.object, docker_image=self.object.docker_image
+            )
+            .values("opponent")
+            .annotate(games=Sum("games"), wins=Sum("wins"))
+            .order_by("-games", "opponent")
+        )
+        opponents = Bot._base_manager.select_related("user").in_bulk(
+            [record["opponent"] for record in records]
+        )
+        for record in records:
+            record["opponent"] = opponents[record["opponent"]]
+            record["losses"] = record["games"] - record["wins"]
+        return super().get_context_data(records=records, **kwargs)
+
+
+class HeadToHeadView(generic.View):
+    """
+    How the ``bot`` query parameter's bot did against the ``opponent``
+    parameter's, in total and by the images they played with.
+    """
+
+    def get(self, request, *args, **kwargs):
+        names = [request.GET.get("bot"), request.GET.get("opponent")]
+        if not all(names) or names[0] == names[1]:
+            return HttpResponseBadRequest("bot and opponent must name two bots")
+
+        bots = {
+            bot.name: bot
+            for bot in Bot.objects.filter(user__username__in=names).select_related(
+                "user"
+            )
+        }
+        if len(bots) < 2:
+            raise Http404("No bots found.")
+        bot, opponent = bots[names[0]], bots[names[1]]
+
+        # bots are saved whenever they play
+        last_modified = max(bot.updated_at, opponent.updated_at)
+        response = get_conditional_response(
+            request, last_modified=int(last_modified.timestamp())
+        )
+        if response is None:
+            images = list(
+                HeadToHead.objects.filter(bot=bot, opponent=opponent)
+                .order_by("-games")
+                .values("docker_image", "opponent_docker_image", "games", "wins")
+            )
+            response = JsonResponse(
+                {
+                    "bot": bot.name,
+                    "opponent": opponent.name,
+                    "games": sum(record["games"] for record in images),
+                    "wins": sum(record["wins"] for record in images),
+                    "images": images,
+                }
+            )
+            response["Last-Modified"] = http_date(last_modified.timestamp())
+
+        patch_cache_control(
+            response, public=True, max_age=settings.HEAD_TO_HEAD_MAX_AGE
+        )
+        return response
+
+
+def rating_curve(points, resolution: str) -> dict:
+    """
+    Columns of a bot's rating points, keeping the last point of each day at
+    day resolution. Times are unix seconds.
+    """
+    curve = {"time": [], "mu": [], "sigma": []}
+    last_day = None
+    for time, mu, sigma in points:
+        if resolution == "day":
+            day = time.date()
+            if day == last_day:
+                for column in curve.values():
+                    column.pop()
+            last_day = day
+        curve["time"].append(int(time.timestamp()))
+        curve["mu"].append(mu)
+        curve["sigma"].append(sigma)
+    return curve
+
+
+class RatingHistoryView(generic.View):
+    """
+    The rating curves of the bots named by ``bot`` query parameters, by
+    ``hour`` or ``day`` (the default) as the ``resolution`` parameter asks.
+    """
+
+    max_bots = 10
+    resolutions = ["hour", "day"]
+
+    def get(self, request, *args, **kwargs):
+        names = request.GET.getlist("bot")[: self.max_bots]
+        resolution = request.GET.get("resolution", "day")
+        if resolution not in self.resolutions:
+            return HttpResponseBadRequest(
+                f"resolution must be one of {self.resolutions}"
+            )
+
+        bots = {
+            bot.pk: bot
+            for bot in Bot.objects.filter(user__username__in=names).select_related(
+                "user"
+            )
+        }
+        if not bots:
+            raise Http404("No bots found.")
+
+        # bots are saved whenever their rating changes
+        last_modified = max(bot.updated_at for bot in bots.values())
+        response = get_conditional_response(
+            request, last_modified=int(last_modified.timestamp())
+        )
+        if response is None:
+            points = defaultdict(list)
+            for bot_id, time, mu, sigma in (
+                RatingPoint.objects.filter(bot__in=bots)
+                .order_by("bot", "time")
+                .values_list("bot", "time", "mu", "sigma")
+            ):
+                points[bot_id].append((time, mu, sigma))
+
+            response = JsonResponse(
+                {
+                    "resolution": resolution,
+                    "bots": {
+                        bot.name: rating_curve(points[pk], resolution)
+                        for pk, bot in bots.items()
+                    },
+                }
+            )
+            response["Last-Modified"] = http_date(last_modified.timestamp())
+
+        patch_cache_control(
+            response, public=True, max_age=settings.RATING_HISTORY_MAX_AGE
         )
+        return response
@@ -5,6 +5,8 @@ from django.views.generic.list import MultipleObjectMixin
 
 from crispy_forms.helper import FormHelper
 
+from tournament.pagination import CursorPaginator
+
 
 class FormHelperMixin(FormMixin):
     helper: FormHelper
@@ -19,6 +21,23 @@ class FormHelperMixin(FormMixin):
         return form_class
 
 
+class CursorPaginationMixin(MultipleObjectMixin):
+    """
+    Paginates with cursors from the ``after`` and ``before`` query parameters
+    instead of page numbers, ordered by ``paginate_keys``.
+    """
+
+    paginate_keys: list[str]
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = CursorPaginator(queryset, page_size, self.paginate_keys)
+        page = paginator.page(
+            after=self.request.GET.get("after"),
+            before=self.request.GET.get("before"),
+        )
+        return paginator, page, page.object_list, page.has_other_pages()
+
+
 class DetailListView(generic.DetailView, MultipleObjectMixin):
     def get_object_list(self):
         pass
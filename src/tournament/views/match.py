@@ -1,7 +1,14 @@
+from wsgiref.util import FileWrapper
+
+from django.http import HttpResponseRedirect, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from django.views import generic
+from django.views.generic.detail import SingleObjectMixin
 
 from tournament.models import Match
 
+from .generic import CursorPaginationMixin
+
 
 class MatchDetailView(generic.DetailView):
     model = Match
@@ -16,12 +23,43 @@ class MatchDetailView(generic.DetailView):
             .exclude(date__isnull=True)
             .exclude(replay__isnull=True)
             .exclude(results__isnull=True)
+            .prefetch_related(Match.prefetch_results())
         )
 
 
-class MatchListView(generic.ListView):
+class MatchReplayView(SingleObjectMixin, generic.View):
+    """
+    Sends the visualizer to the stored replay file in the best encoding the
+    client accepts. Replays are never recompressed here; a client accepting
+    none of the stored encodings gets the replay decompressed instead.
+    """
+
+    model = Match
+    slug_field = "uuid"
+    slug_url_kwarg = "uuid"
+
+    def get_queryset(self):
+        return super().get_queryset().exclude(replay__isnull=True)
+
+    def get(self, request, *args, **kwargs):
+        match = self.get_object()
+
+        name = match.replay_for_encoding(request.headers.get("Accept-Encoding", ""))
+        if name is not None:
+            response = HttpResponseRedirect(match.replay.storage.url(name))
+        else:
+            response = StreamingHttpResponse(
+                FileWrapper(match.open_replay()), content_type="application/json"
+            )
+
+        patch_vary_headers(response, ["Accept-Encoding"])
+        return response
+
+
+class MatchListView(CursorPaginationMixin, generic.ListView):
     model = Match
     paginate_by = 20
+    paginate_keys = ["-date", "-id"]
 
     def get_queryset(self):
         return (
@@ -30,5 +68,5 @@ class MatchListView(generic.ListView):
             .exclude(date__isnull=True)
             .exclude(replay__isnull=True)
             .exclude(results__isnull=True)
-            .order_by("-date")
+            .prefetch_related(Match.prefetch_results())
         )
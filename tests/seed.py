@@ -0,0 +1,123 @@
+"""
+Generated bots and matches for the query tests.
+"""
+import itertools
+import random
+import uuid
+from datetime import timedelta
+
+from django.utils import timezone
+
+from tournament.models import (
+    Bot,
+    HeadToHead,
+    LeaderboardEntry,
+    Match,
+    MatchResult,
+    MatchStats,
+    RatingPoint,
+    User,
+)
+from tournament.runner import SEED_NUM_PLAYERS
+
+
+def seed_matches(
+    num_bots: int, num_matches: int, with_stats: bool = False, seed: int = 0
+) -> tuple[list[Bot], list[Match]]:
+    """
+    Creates ``num_bots`` bots, every other one an NPC, and ``num_matches``
+    matches a minute apart between random groups of them.
+    """
+    rng = random.Random(seed)
+    users = User.objects.bulk_create(
+        User(username=f"seed-{uuid.uuid4().hex[:12]}", is_npc=n % 2 == 0)
+        for n in range(num_bots)
+    )
+    bots = Bot.objects.bulk_create(
+        Bot(
+            user=user,
+            mu=rng.uniform(0, 50),
+            sigma=rng.uniform(1, 8),
+            docker_image=f"seed/bot{n}:latest",
+        )
+        for n, user in enumerate(users)
+    )
+
+    now = timezone.now()
+    matches = Match.objects.bulk_create(
+        Match(
+            uuid=uuid.uuid4(),
+            run_id=n,
+            date=now - timedelta(minutes=n),
+            seed=n,
+            width=30,
+            height=30,
+            replay=f"seed/{n}.hlt.gz",
+        )
+        for n in range(num_matches)
+    )
+
+    results = MatchResult.objects.bulk_create(
+        MatchResult(
+            bot=bot,
+            match=match,
+            match_date=match.date,
+            docker_image=bot.docker_image,
+            rank=rank,
+            mu=bot.mu,
+            sigma=bot.sigma,
+            last_frame_alive=100,
+        )
+        for match in matches
+        for rank, bot in enumerate(
+            rng.sample(bots, min(rng.choice(SEED_NUM_PLAYERS), len(bots))), start=1
+        )
+    )
+
+    if with_stats:
+        MatchStats.objects.bulk_create(
+            MatchStats(
+                result=result,
+                bot=result.bot,
+                match=result.match,
+                player=result.rank,
+                peak_territory=100,
+                peak_territory_frame=50,
+                peak_territory_share=rng.random(),
+                final_territory=50,
+                peak_strength=1000,
+                production_captured=500,
+                cap_losses=10,
+                first_contact_frame=40,
+                damage_dealt=100,
+                damage_taken=100,
+                environment_damage=50,
+                overkill_damage=20,
+                territory_curve=[],
+                strength_curve=[],
+            )
+            for result in results
+        )
+
+    RatingPoint.append(
+        [
+            RatingPoint(
+                bot=result.bot,
+                time=RatingPoint.bucket(result.match.date),
+                date=result.match.date,
+                mu=result.mu,
+                sigma=result.sigma,
+            )
+            for result in sorted(results, key=lambda result: result.match.date)
+        ]
+    )
+    HeadToHead.add(
+        HeadToHead.tally(
+            [(result.bot.pk, result.docker_image, result.rank) for result in players]
+            for _, players in itertools.groupby(
+                results, key=lambda result: result.match.pk
+            )
+        )
+    )
+    LeaderboardEntry.refresh([bot.pk for bot in bots])
+    return bots, matches
@@ -0,0 +1,96 @@
+import io
+import os
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+import numpy as np
+
+from tournament.models import Bot, LeaderboardEntry, Match, MatchStats, User
+from tournament.replays import ReplayArrays
+from tournament.stats import player_stats
+
+from .test_process_uploads import result_tarball
+
+
+class ComputeStatsTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.cache_dir = cache_dir.name
+        self.enterContext(
+            override_settings(
+                MEDIA_ROOT=media_root.name, REPLAY_CACHE_DIR=self.cache_dir
+            )
+        )
+
+        for n in range(2):
+            user = User.objects.create(username=f"bot{n}")
+            Bot.objects.filter(user=user).update(docker_image=f"halite/bot{n}:latest")
+        match_id, archive = result_tarball(["bot0", "bot1"])
+        self.match = Match.create_from_tar(archive, match_id)
+
+    def test_replays_are_not_cached(self):
+        MatchStats.objects.all().delete()
+        call_command("computestats", stdout=io.StringIO())
+
+        self.assertEqual(MatchStats.objects.filter(match=self.match).count(), 2)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_leaderboard_is_refreshed_after_a_recompute(self):
+        MatchStats.objects.update(peak_territory_share=0.0)
+        LeaderboardEntry.refresh()
+        call_command("computestats", "--recompute", stdout=io.StringIO())
+
+        for stats in MatchStats.objects.select_related("bot"):
+            entry = LeaderboardEntry.objects.get(bot=stats.bot)
+            self.assertEqual(entry.stats_count, 1)
+            self.assertGreater(entry.peak_territory_share, 0)
+            self.assertAlmostEqual(
+                entry.peak_territory_share, stats.peak_territory_share
+            )
+
+    def test_cached_replays_are_used(self):
+        cached = self.match.replay_arrays()
+        self.assertEqual(os.listdir(self.cache_dir), [str(self.match.uuid)])
+        with mock.patch.object(Match, "open_stored_replay", side_effect=AssertionError):
+            arrays = self.match.replay_arrays(cache=False)
+        self.assertEqual(arrays.num_frames, cached.num_frames)
+
+
+class PlayerStatsTest(SimpleTestCase):
+    def test_damage_is_capped_and_overkill_credited_to_attackers(self):
+        # player 2's 20 sits between player 1's 30 and 15, everything stays
+        # still and nothing produces
+        first = [
+            [[0, 0], [0, 0], [0, 0]],
+            [[1, 30], [2, 20], [1, 15]],
+            [[0, 0], [0, 0], [0, 0]],
+        ]
+        after = [
+            [[0, 0], [0, 0], [0, 0]],
+            [[1, 10], [0, 0], [0, 0]],
+            [[0, 0], [0, 0], [0, 0]],
+        ]
+        replay = ReplayArrays(
+            {"num_players": 2, "width": 3, "height": 3},
+            np.array([first, after]),
+            np.zeros((1, 3, 3), dtype=np.uint8),
+            np.zeros((3, 3), dtype=np.uint8),
+        )
+        stats = player_stats(replay)
+
+        # the 15 hits first and the 30 then only has 5 of the 20 left to take
+        self.assertEqual(stats[0]["damage_dealt"], 15 + 20)
+        self.assertEqual(stats[0]["overkill_damage"], 20 - 5)
+        self.assertEqual(stats[0]["damage_taken"], 20 + 15)
+        # the 20 hits each neighbour once, taking all 15 of the weaker one
+        self.assertEqual(stats[1]["damage_dealt"], 20 + 15)
+        self.assertEqual(stats[1]["overkill_damage"], 0)
+        self.assertEqual(stats[1]["damage_taken"], 20)
+        self.assertEqual(stats[0]["environment_damage"], 0)
+        self.assertEqual(stats[0]["first_contact_frame"], 0)
@@ -0,0 +1,114 @@
+import io
+import json
+import os
+import tarfile
+import tempfile
+import tracemalloc
+import uuid
+
+from django.test import SimpleTestCase, override_settings
+
+import numpy as np
+
+from tournament import replays
+from tournament.models import Match
+
+MiB = 1 << 20
+
+
+def write_replay(f, num_frames: int, size: int = 50, num_players: int = 6):
+    """Writes a replay of random frames and moves, a frame at a time."""
+    rng = np.random.default_rng(num_frames)
+    owners = rng.integers(0, num_players + 1, (size, size))
+    strengths = rng.integers(0, 256, (size, size))
+    f.write(b'{"frames":[')
+    for frame in range(num_frames):
+        changed = rng.random((size, size)) < 0.1
+        owners[changed] = rng.integers(0, num_players + 1, changed.sum())
+        strengths[changed] = rng.integers(0, 256, changed.sum())
+        grid = np.stack([owners, strengths], axis=-1).tolist()
+        f.write((b"," if frame else b"") + replays.dumps(grid))
+    f.write(b'],"height":%d,"moves":[' % size)
+    for frame in range(num_frames - 1):
+        moves = rng.integers(0, 5, (size, size)).tolist()
+        f.write((b"," if frame else b"") + replays.dumps(moves))
+    rest = {
+        "num_frames": num_frames,
+        "num_players": num_players,
+        "player_names": [f"bot{player}" for player in range(num_players)],
+        "productions": rng.integers(1, 10, (size, size)).tolist(),
+        "version": 11,
+        "width": size,
+    }
+    f.write(b"]," + replays.dumps(rest)[1:])
+
+
+def add_member(tar: tarfile.TarFile, name: str, f):
+    info = tarfile.TarInfo(name)
+    info.size = f.seek(0, io.SEEK_END)
+    f.seek(0)
+    tar.addfile(info, f)
+
+
+@override_settings(REPLAY_FORMAT="binary", REPLAY_VARIANTS=["br"])
+class ExtractTarMemoryTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def make_tar(self, num_frames: int) -> tuple[str, int]:
+        """A result tarball with a synthetic replay, and the replay's size."""
+        match_id = str(uuid.uuid4())
+        path = os.path.join(self.directory, f"{match_id}.tar.xz")
+        match = {
+            "id": match_id,
+            "date": "2023-06-01T00:00:00+00:00",
+            "replay": f"{match_id}.hlt",
+            "seed": 1,
+            "width": 50,
+            "height": 50,
+            "match_results": [
+                {
+                    "bot_name": f"bot{player}",
+                    "docker_image": f"ghcr.io/halite/bot{player}:latest",
+                    "rank": player + 1,
+                    "last_frame_alive": num_frames - 1,
+                    "error_log": None,
+                }
+                for player in range(6)
+            ],
+            "workflow_run_id": 1,
+        }
+        with tarfile.open(path, "w:gz", compresslevel=1) as tar:
+            with tempfile.TemporaryFile() as replay:
+                write_replay(replay, num_frames)
+                size = replay.tell()
+                add_member(tar, match["replay"], replay)
+            add_member(tar, f"{match_id}.json", io.BytesIO(json.dumps(match).encode()))
+        return path, size
+
+    def extract_peak(self, path: str) -> int:
+        with open(path, "rb") as f:
+            tracemalloc.start()
+            try:
+                extracted = Match.extract_tar(f, os.path.basename(path)[:-7])
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+        extracted.close()
+        self.assertTrue(extracted.replay.name.endswith(".hltb.gz"))
+        self.assertEqual(len(extracted.stats), 6)
+        return peak
+
+    def test_peak_memory_does_not_grow_with_the_replay(self):
+        short_path, short_size = self.make_tar(20)
+        long_path, long_size = self.make_tar(300)
+        self.assertGreater(long_size, 6 * MiB)
+
+        short_peak = self.extract_peak(short_path)
+        long_peak = self.extract_peak(long_path)
+        # well under the size of the replay, and about the same for 15 times
+        # as many frames
+        self.assertLess(long_peak, long_size)
+        self.assertLess(long_peak, short_peak + MiB)
@@ -0,0 +1,196 @@
+import hashlib
+import hmac
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from github import Auth, Github
+
+from tournament import runner
+from tournament.exceptions import WorkflowFailedToStartError
+from tournament.github_client import MATCH_REPOSITORY, MATCH_WORKFLOW
+from tournament.models import Bot, Match, User
+
+WEBHOOK_SECRET = "webhook-secret"
+
+
+def sign(body: bytes, secret: str = WEBHOOK_SECRET) -> str:
+    digest = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+@override_settings(GITHUB_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class WorkflowRunWebhookTest(TestCase):
+    def setUp(self):
+        self.match = Match.objects.create(uuid=uuid.uuid4())
+
+    def post(self, body: bytes, signature: Optional[str] = None):
+        headers = {"X-GitHub-Event": "workflow_run"}
+        if signature is not None:
+            headers["X-Hub-Signature-256"] = signature
+        return self.client.post(
+            reverse("tournament:github_webhook"),
+            body,
+            content_type="application/json",
+            headers=headers,
+        )
+
+    def event(self, run_id: int = 1234) -> bytes:
+        return json.dumps(
+            {
+                "action": "requested",
+                "repository": {"full_name": MATCH_REPOSITORY},
+                "workflow_run": {"id": run_id, "display_title": str(self.match.uuid)},
+            }
+        ).encode()
+
+    def test_valid_signature_records_the_run(self):
+        body = self.event()
+        response = self.post(body, sign(body))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()["recorded"])
+        self.match.refresh_from_db()
+        self.assertEqual(self.match.run_id, 1234)
+
+    def test_bad_signature_is_rejected(self):
+        body = self.event()
+        for signature in [sign(body, "other-secret"), sign(body + b" "), "sha256="]:
+            with self.subTest(signature):
+                response = self.post(body, signature)
+                self.assertEqual(response.status_code, 403)
+        self.match.refresh_from_db()
+        self.assertIsNone(self.match.run_id)
+
+    def test_every_request_is_rejected_without_a_secret(self):
+        body = self.event()
+        for secret in [None, ""]:
+            with self.subTest(secret), self.settings(GITHUB_WEBHOOK_SECRET=secret):
+                response = self.post(body, sign(body, ""))
+                self.assertEqual(response.status_code, 403)
+        self.match.refresh_from_db()
+        self.assertIsNone(self.match.run_id)
+
+    def test_missing_signature_is_rejected(self):
+        response = self.post(self.event())
+
+        self.assertEqual(response.status_code, 403)
+        self.match.refresh_from_db()
+        self.assertIsNone(self.match.run_id)
+
+
+class FakeGithub(ThreadingHTTPServer):
+    """
+    Answers the repository, workflow and dispatch requests of the GitHub API,
+    recording the dispatches and answering them with ``dispatch_status``.
+    """
+
+    workflow_path = f"/repos/{MATCH_REPOSITORY}/actions/workflows/{MATCH_WORKFLOW}"
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeGithubHandler)
+        self.url = f"http://127.0.0.1:{self.server_port}"
+        self.dispatches = []
+        self.dispatch_status = 204
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeGithubHandler(BaseHTTPRequestHandler):
+    server: FakeGithub
+
+    def respond(self, status: int, data=None):
+        body = json.dumps(data).encode() if data is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == f"/repos/{MATCH_REPOSITORY}":
+            return self.respond(
+                200,
+                {
+                    "full_name": MATCH_REPOSITORY,
+                    "url": f"{self.server.url}/repos/{MATCH_REPOSITORY}",
+                },
+            )
+        if self.path != self.server.workflow_path:
+            return self.respond(404, {"message": "Not Found"})
+        self.respond(
+            200,
+            {
+                "id": 1,
+                "name": "match",
+                "path": f".github/workflows/{MATCH_WORKFLOW}",
+                "url": f"{self.server.url}{self.server.workflow_path}",
+            },
+        )
+
+    def do_POST(self):
+        if self.path != f"{self.server.workflow_path}/dispatches":
+            return self.respond(404, {"message": "Not Found"})
+        length = int(self.headers["Content-Length"])
+        self.server.dispatches.append(json.loads(self.rfile.read(length)))
+        if self.server.dispatch_status == 204:
+            return self.respond(204)
+        self.respond(self.server.dispatch_status, {"message": "Unprocessable"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DispatchTest(TestCase):
+    def setUp(self):
+        self.bots = []
+        for n in range(2):
+            user = User.objects.create(username=f"bot{n}")
+            Bot.objects.filter(user=user).update(docker_image=f"halite/bot{n}:latest")
+            self.bots.append(Bot.objects.select_related("user").get(user=user))
+
+        self.github = self.enterContext(FakeGithub())
+        client = Github(auth=Auth.Token("token"), base_url=self.github.url)
+        self.backend = runner.GithubBackend(runner.get_workflow(client))
+
+    def test_dispatch_creates_the_match(self):
+        (start,) = runner.start_matches([self.bots], self.backend)
+
+        self.assertIsNone(start.error)
+        (dispatch,) = self.github.dispatches
+        self.assertEqual(dispatch["ref"], "main")
+        self.assertEqual(dispatch["inputs"]["id"], str(start.match.uuid))
+        self.assertEqual(
+            [bot["name"] for bot in json.loads(dispatch["inputs"]["bots"])],
+            ["bot0", "bot1"],
+        )
+        self.assertTrue(Match.objects.filter(uuid=start.match.uuid).exists())
+
+    def test_failed_dispatch_deletes_the_match(self):
+        self.github.dispatch_status = 422
+        (start,) = runner.start_matches([self.bots], self.backend)
+
+        self.assertIsNone(start.match)
+        self.assertIsInstance(start.error, WorkflowFailedToStartError)
+        self.assertEqual(len(self.github.dispatches), 1)
+        self.assertFalse(Match.objects.exists())
+
+    def test_unreachable_github_deletes_the_match(self):
+        self.github.__exit__()
+        with self.assertLogs("tournament.runner", "ERROR"):
+            (start,) = runner.start_matches([self.bots], self.backend)
+
+        self.assertIsNone(start.match)
+        self.assertIsInstance(start.error, WorkflowFailedToStartError)
+        self.assertFalse(Match.objects.exists())
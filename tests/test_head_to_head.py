@@ -0,0 +1,68 @@
+import io
+
+from django.core.management import call_command
+from django.test import TestCase
+
+import numpy as np
+
+from tournament.models import Bot, HeadToHead, Match, User
+
+from .test_record_matches import extracted_match
+
+
+class HeadToHeadTest(TestCase):
+    def setUp(self):
+        self.bots = []
+        for n in range(3):
+            user = User.objects.create(username=f"bot{n}")
+            Bot.objects.filter(user=user).update(docker_image=f"halite/bot{n}:v1")
+            self.bots.append(Bot.objects.select_related("user").get(user=user))
+
+    def records(self) -> dict:
+        return {
+            (
+                record.bot_id,
+                record.docker_image,
+                record.opponent_id,
+                record.opponent_docker_image,
+            ): (record.games, record.wins)
+            for record in HeadToHead.objects.all()
+        }
+
+    def test_records_are_kept_both_ways_round(self):
+        bot0, bot1, bot2 = self.bots
+        Match.record_matches([extracted_match(0, [bot0, bot1, bot2])])
+        tied = extracted_match(1, [bot1, bot0, bot2])
+        tied.match.match_results[1].rank = 1
+        # without a draw margin the tied ranks' difference has no width
+        with np.errstate(divide="ignore"):
+            Match.record_matches([tied])
+        Bot.objects.filter(pk=bot0.pk).update(docker_image="halite/bot0:v2")
+        bot0.refresh_from_db()
+        # recorded together, adding to one existing record and creating others
+        Match.record_matches(
+            [extracted_match(2, [bot0, bot2]), extracted_match(3, [bot2, bot1])]
+        )
+
+        v1, v2 = ":v1", ":v2"
+        image = {bot.pk: f"halite/{bot.name}" for bot in self.bots}
+        expected = {
+            # a tie counts as a game but no win for either bot
+            (bot0.pk, v1, bot1.pk, v1): (2, 1),
+            (bot1.pk, v1, bot0.pk, v1): (2, 0),
+            (bot0.pk, v1, bot2.pk, v1): (2, 2),
+            (bot2.pk, v1, bot0.pk, v1): (2, 0),
+            (bot1.pk, v1, bot2.pk, v1): (3, 2),
+            (bot2.pk, v1, bot1.pk, v1): (3, 1),
+            (bot0.pk, v2, bot2.pk, v1): (1, 1),
+            (bot2.pk, v1, bot0.pk, v2): (1, 0),
+        }
+        expected = {
+            (bot, image[bot] + tag, opponent, image[opponent] + opponent_tag): count
+            for (bot, tag, opponent, opponent_tag), count in expected.items()
+        }
+        self.assertEqual(self.records(), expected)
+
+        HeadToHead.objects.update(games=0, wins=0)
+        call_command("rebuildheadtohead", stdout=io.StringIO())
+        self.assertEqual(self.records(), expected)
@@ -0,0 +1,80 @@
+import io
+import os
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from tournament import metrics
+from tournament.models import Bot, Match, User
+
+from .test_process_uploads import result_tarball
+
+
+class ImportMatchesTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+        archives = tempfile.TemporaryDirectory()
+        self.addCleanup(archives.cleanup)
+        self.archives = archives.name
+
+        for n in range(2):
+            user = User.objects.create(username=f"bot{n}")
+            Bot.objects.filter(user=user).update(docker_image=f"halite/bot{n}:latest")
+
+    def write(self, directory: str, match_id: str, archive) -> None:
+        os.makedirs(os.path.join(self.archives, directory), exist_ok=True)
+        path = os.path.join(self.archives, directory, f"{match_id}.tar.xz")
+        with open(path, "wb") as f:
+            f.write(archive.read())
+
+    def stored(self) -> list[str]:
+        return sorted(
+            name for _, _, names in os.walk(self.media_root) for name in names
+        )
+
+    def import_matches(self) -> tuple[str, str]:
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command(
+            "importmatches", self.archives, processes=1, stdout=stdout, stderr=stderr
+        )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_duplicate_archives_leave_no_files(self):
+        match_id, archive = result_tarball(["bot0", "bot1"])
+        self.write("a", match_id, archive)
+        self.write("b", *result_tarball(["bot0", "bot1"], match_id))
+        self.import_matches()
+
+        match = Match.objects.get(uuid=match_id)
+        self.assertEqual(match.results.count(), 2)
+        kept = [match.replay.name, *match.replay_variants.values()]
+        self.assertEqual(self.stored(), sorted(os.path.basename(f) for f in kept))
+
+    def test_failed_batches_are_reported(self):
+        good_id, good = result_tarball(["bot0", "bot1"])
+        self.write("a", good_id, good)
+        # bot5 doesn't exist, failing the batch and then the match
+        bad_id, bad = result_tarball(["bot0", "bot5"])
+        self.write("a", bad_id, bad)
+        stdout, stderr = self.import_matches()
+
+        self.assertIn("Failed to record batch of 2 matches", stderr)
+        self.assertIn(f"Failed to record match {bad_id}", stderr)
+        self.assertIn("Imported 1 matches", stdout)
+        self.assertTrue(Match.objects.get(uuid=good_id).results.exists())
+        self.assertFalse(Match.objects.filter(uuid=bad_id).exists())
+
+    def test_extraction_is_timed_in_the_importing_process(self):
+        def extractions() -> int:
+            counts = metrics.EXTRACT_SECONDS.values.get((), [0])
+            return sum(counts[:-1])
+
+        before = extractions()
+        for directory in ["a", "b"]:
+            self.write(directory, *result_tarball(["bot0", "bot1"]))
+        self.import_matches()
+        self.assertEqual(extractions(), before + 2)
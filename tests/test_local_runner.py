@@ -0,0 +1,105 @@
+import json
+import os
+import shlex
+import stat
+import sys
+import tarfile
+import tempfile
+import uuid
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from tournament import runner
+
+# stands in for the Halite environment: records its arguments and plays a
+# match in which the second bot wins and the first times out
+FAKE_HALITE = """\
+import json, sys
+
+args = sys.argv[1:]
+with open("args.json", "w") as f:
+    json.dump(args, f)
+seed = args[args.index("-s") + 1]
+with open(f"1234-{seed}.hlt", "w") as f:
+    f.write("{}")
+with open("1234-1.log", "w") as f:
+    f.write("timed out")
+print("30 30")
+print(f"1234-{seed}.hlt {seed}")
+print("1 2 80")
+print("2 1 120")
+print("1")
+print("1234-1.log")
+"""
+
+# stands in for docker, recording the containers removed after the match
+FAKE_DOCKER = """\
+import sys
+
+with open(__file__ + ".log", "a") as f:
+    print(*sys.argv[1:], file=f)
+"""
+
+
+def write_script(path: str, source: str):
+    with open(path, "w") as f:
+        f.write(f"#!{sys.executable}\n{source}")
+    os.chmod(path, stat.S_IRWXU)
+
+
+@override_settings(LOCAL_RUNNER_COMMAND=None, LOCAL_RUNNER_DOCKER_ARGS=["--rm"])
+class LocalBackendTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.halite = os.path.join(directory.name, "halite")
+        write_script(self.halite, FAKE_HALITE)
+        self.docker = os.path.join(directory.name, "docker")
+        write_script(self.docker, FAKE_DOCKER)
+        path = f"{directory.name}{os.pathsep}{os.environ['PATH']}"
+        self.enterContext(mock.patch.dict(os.environ, PATH=path))
+
+        self.backend = runner.LocalBackend(workers=1, halite=self.halite)
+        self.addCleanup(self.backend.pool.shutdown)
+
+    def test_match_is_played_with_the_environment(self):
+        match_id = str(uuid.uuid4())
+        bots = [
+            {"name": "bot0", "docker-image": "halite/bot0:latest"},
+            {"name": "bot1", "docker-image": "halite/bot1:latest"},
+        ]
+        inputs = {"id": match_id, "map-size": "30 30", "bots": json.dumps(bots)}
+
+        with self.backend.run_match(inputs) as archive:
+            with tarfile.open(fileobj=archive) as result:
+                names = result.getnames()
+                args = json.load(result.extractfile("args.json"))
+                match = json.load(result.extractfile(f"{match_id}.json"))
+
+        self.assertIn(match["replay"], names)
+        self.assertIn("1234-1.log", names)
+        self.assertEqual(args[args.index("-d") + 1], "30 30")
+        commands = args[args.index("-s") + 2 :]
+        self.assertEqual(commands[1::2], ["bot0", "bot1"])
+        self.assertEqual(
+            [shlex.split(command)[-1] for command in commands[::2]],
+            ["halite/bot0:latest", "halite/bot1:latest"],
+        )
+        self.assertEqual(match["seed"], int(args[args.index("-s") + 1]))
+        self.assertEqual((match["width"], match["height"]), (30, 30))
+        self.assertEqual(match["workflow_run_id"], runner.local_run_id(match_id))
+        self.assertEqual(
+            [
+                (r["bot_name"], r["rank"], r["last_frame_alive"], r["error_log"])
+                for r in match["match_results"]
+            ],
+            [("bot0", 2, 80, "1234-1.log"), ("bot1", 1, 120, None)],
+        )
+        containers = [shlex.split(command)[5] for command in commands[::2]]
+        with open(f"{self.docker}.log") as f:
+            self.assertEqual(f.read().split(), ["rm", "--force", *containers])
+
+    def test_unexpected_output_is_an_error(self):
+        with self.assertRaises(runner.HaliteError):
+            runner.parse_halite_output("Segmentation fault\n", 2)
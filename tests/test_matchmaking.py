@@ -0,0 +1,78 @@
+import random
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from tournament import matchmaking
+from tournament.matchmaking import MatchmakingIndex
+from tournament.models import Bot, Match, User
+from tournament.runner import rank_limit
+
+from .test_record_matches import extracted_match
+
+
+class MatchmakingIndexTest(SimpleTestCase):
+    def test_nearest_matches_sorting_every_bot(self):
+        rng = random.Random(0)
+        for _ in range(100):
+            # repeated mus, and seeds that aren't in the index
+            bots = [
+                Bot(pk=n, mu=rng.choice([rng.uniform(0, 50), 25.0]))
+                for n in range(rng.randint(1, 30))
+            ]
+            index = MatchmakingIndex(bots)
+            seed = rng.choice([*bots, Bot(pk=-1, mu=rng.uniform(-10, 60))])
+            k = rng.randint(0, len(bots) + 1)
+
+            nearest = index.nearest(seed, k)
+            others = sorted(
+                (abs(b.mu - seed.mu) for b in bots if b.pk != seed.pk),
+            )
+            self.assertNotIn(seed.pk, [b.pk for b in nearest])
+            self.assertEqual(len({b.pk for b in nearest}), len(nearest))
+            # ties in distance may be broken either way
+            self.assertEqual([abs(b.mu - seed.mu) for b in nearest], others[:k])
+
+    def test_opponents_are_among_the_nearest(self):
+        bots = [Bot(pk=n, mu=float(n)) for n in range(20)]
+        index = MatchmakingIndex(bots)
+        for _ in range(50):
+            limit = rank_limit()
+            opponents = index.opponents(bots[10], 3, limit)
+            self.assertEqual(len(opponents), min(3, limit))
+            nearest = {b.pk for b in index.nearest(bots[10], limit)}
+            self.assertLessEqual({b.pk for b in opponents}, nearest)
+
+
+class IndexInvalidationTest(TestCase):
+    def setUp(self):
+        for n in range(2):
+            user = User.objects.create(username=f"bot{n}")
+            Bot.objects.filter(user=user).update(docker_image=f"halite/bot{n}:v1")
+        self.bots = list(Bot.objects.select_related("user").order_by("pk"))
+        matchmaking.invalidate()
+        self.addCleanup(matchmaking.invalidate)
+
+    def mus(self, index: MatchmakingIndex) -> dict[int, float]:
+        return {bot.pk: bot.mu for bot in index.bots}
+
+    def test_recording_matches_reloads_the_index(self):
+        index = matchmaking.get_index()
+        self.assertIs(matchmaking.get_index(), index)
+
+        Match.record_matches([extracted_match(0, self.bots)])
+        reloaded = matchmaking.get_index()
+        self.assertIsNot(reloaded, index)
+        self.assertEqual(self.mus(reloaded), dict(Bot.objects.values_list("pk", "mu")))
+        self.assertNotEqual(self.mus(reloaded), self.mus(index))
+
+    @override_settings(MATCHMAKING_INDEX_TTL=60)
+    def test_index_is_reloaded_after_its_ttl(self):
+        with mock.patch("tournament.matchmaking.time.monotonic", return_value=1000):
+            index = matchmaking.get_index()
+        # ratings updated by another process
+        Bot.objects.filter(pk=self.bots[0].pk).update(mu=40)
+        with mock.patch("tournament.matchmaking.time.monotonic", return_value=1060):
+            self.assertIs(matchmaking.get_index(), index)
+        with mock.patch("tournament.matchmaking.time.monotonic", return_value=1061):
+            self.assertEqual(self.mus(matchmaking.get_index())[self.bots[0].pk], 40)
@@ -0,0 +1,52 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from tournament.metrics import Registry
+
+METRICS_TOKEN = "metrics-token"
+
+
+class MetricsViewTest(TestCase):
+    def get(self, authorization: str):
+        return self.client.get(
+            reverse("tournament:metrics"), headers={"Authorization": authorization}
+        )
+
+    @override_settings(METRICS_TOKEN=METRICS_TOKEN)
+    def test_bearer_token_is_required(self):
+        response = self.get(f"Bearer {METRICS_TOKEN}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain"))
+        for authorization in ["", "Bearer other-token", METRICS_TOKEN]:
+            with self.subTest(authorization):
+                self.assertEqual(self.get(authorization).status_code, 403)
+
+    def test_every_request_is_rejected_without_a_token(self):
+        for token in [None, ""]:
+            with self.subTest(token), self.settings(METRICS_TOKEN=token):
+                for authorization in ["", "Bearer ", f"Bearer {token}"]:
+                    self.assertEqual(self.get(authorization).status_code, 403)
+
+
+@mock.patch("tournament.metrics.atexit.register")
+@mock.patch("tournament.metrics.threading.Thread")
+class RegistryStartTest(SimpleTestCase):
+    @override_settings(METRICS_FLUSH_INTERVAL=60)
+    def test_saving_starts_once(self, thread, register):
+        registry = Registry()
+        registry.start()
+        registry.start()
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once()
+        register.assert_called_once_with(registry.save)
+
+    def test_nothing_starts_without_a_flush_interval(self, thread, register):
+        for interval in [None, 0]:
+            with self.subTest(interval), self.settings(METRICS_FLUSH_INTERVAL=interval):
+                registry = Registry()
+                registry.start()
+                self.assertFalse(registry.started)
+        thread.assert_not_called()
+        register.assert_not_called()
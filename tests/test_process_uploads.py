@@ -0,0 +1,152 @@
+import io
+import json
+import os
+import tarfile
+import tempfile
+import uuid
+from datetime import timedelta
+from typing import Optional
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from tournament.management.commands.processuploads import Command
+from tournament.models import Bot, Match, MatchUpload, User
+
+from .test_extract import add_member, write_replay
+
+
+def result_tarball(
+    bot_names: list[str], match_id: Optional[str] = None
+) -> tuple[str, ContentFile]:
+    """A match id and the result tarball of a short match between bots."""
+    match_id = match_id or str(uuid.uuid4())
+    match = {
+        "id": match_id,
+        "date": "2023-06-01T00:00:00+00:00",
+        "replay": f"{match_id}.hlt",
+        "seed": 1,
+        "width": 10,
+        "height": 10,
+        "match_results": [
+            {
+                "bot_name": name,
+                "docker_image": f"halite/{name}:latest",
+                "rank": rank,
+                "last_frame_alive": 4,
+                "error_log": None,
+            }
+            for rank, name in enumerate(bot_names, start=1)
+        ],
+        "workflow_run_id": 1,
+    }
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+        replay = io.BytesIO()
+        write_replay(replay, 5, size=10, num_players=len(bot_names))
+        add_member(tar, match["replay"], replay)
+        add_member(tar, f"{match_id}.json", io.BytesIO(json.dumps(match).encode()))
+    return match_id, ContentFile(archive.getvalue(), name=f"{match_id}.tar.gz")
+
+
+class ProcessUploadsTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+
+        for n in range(2):
+            user = User.objects.create(username=f"bot{n}")
+            Bot.objects.filter(user=user).update(docker_image=f"halite/bot{n}:latest")
+
+    def stored(self, match_id: str) -> list[str]:
+        return [
+            name
+            for _, _, names in os.walk(self.media_root)
+            for name in names
+            if name.startswith(match_id) and not name.endswith(".tar.gz")
+        ]
+
+    def process(self, *tarballs: tuple[str, ContentFile]):
+        for match_id, archive in tarballs:
+            MatchUpload.enqueue(archive, uuid.UUID(match_id))
+        Command().process(MatchUpload.claim(10, timedelta(minutes=10)))
+
+    def test_failed_uploads_leave_no_files(self):
+        good_id, good = result_tarball(["bot0", "bot1"])
+        # bot5 doesn't exist, failing the batch and then the upload
+        bad_id, bad = result_tarball(["bot0", "bot5"])
+        with self.assertLogs("tournament.management.commands.processuploads") as logs:
+            self.process((good_id, good), (bad_id, bad))
+        self.assertIn("Failed to record batch of 2 uploads", logs.output[0])
+        self.assertIn(f"Failed to record upload {bad_id}", logs.output[1])
+
+        self.assertEqual(
+            MatchUpload.objects.get(uuid=good_id).status, MatchUpload.Status.DONE
+        )
+        self.assertEqual(
+            MatchUpload.objects.get(uuid=bad_id).status, MatchUpload.Status.PENDING
+        )
+        match = Match.objects.get(uuid=good_id)
+        self.assertTrue(match.replay.storage.exists(match.replay.name))
+        self.assertTrue(self.stored(good_id))
+        self.assertEqual(self.stored(bad_id), [])
+
+    def test_uploading_a_recorded_match_again_leaves_no_files(self):
+        match_id, archive = result_tarball(["bot0", "bot1"])
+        self.process((match_id, archive))
+        stored = self.stored(match_id)
+
+        MatchUpload.objects.filter(uuid=match_id).delete()
+        self.process(result_tarball(["bot0", "bot1"], match_id))
+
+        self.assertEqual(
+            MatchUpload.objects.get(uuid=match_id).status, MatchUpload.Status.DONE
+        )
+        self.assertEqual(sorted(self.stored(match_id)), sorted(stored))
+
+    def test_uploads_are_recorded_under_their_uuid_not_their_file_name(self):
+        match_id, archive = result_tarball(["bot0", "bot1"])
+        # as storage names a file whose name is taken
+        archive.name = f"{match_id}_AbC1234.tar.gz"
+        self.process((match_id, archive))
+
+        self.assertEqual(
+            MatchUpload.objects.get(uuid=match_id).status, MatchUpload.Status.DONE
+        )
+        self.assertTrue(Match.objects.filter(uuid=match_id).exists())
+
+
+class MatchResultViewTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=directory.name))
+
+        admin = User.objects.create(username="admin", is_staff=True)
+        self.token = Token.objects.create(user=admin)
+
+    def post(self, archive: ContentFile):
+        return self.client.post(
+            reverse("tournament:match_result"),
+            {"result": archive},
+            headers={"Authorization": f"Token {self.token.key}"},
+        )
+
+    def test_readable_tarballs_are_queued(self):
+        match_id, archive = result_tarball(["bot0", "bot1"])
+        archive.name = f"{match_id}.tar.xz"
+        response = self.post(archive)
+
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(MatchUpload.objects.filter(uuid=match_id).exists())
+
+    def test_unreadable_tarballs_are_rejected(self):
+        match_id = str(uuid.uuid4())
+        response = self.post(ContentFile(b"not a tarball", name=f"{match_id}.tar.xz"))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(MatchUpload.objects.filter(uuid=match_id).exists())
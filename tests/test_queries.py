@@ -0,0 +1,88 @@
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from tournament import views
+from tournament.models import User
+
+from .seed import seed_matches
+
+
+# pages link to static files, which aren't collected for the tests
+@override_settings(
+    STORAGES={
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {
+            "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"
+        },
+    }
+)
+class QueryBudgetTest(TestCase):
+    """
+    The bot and match pages issue a fixed number of queries, however many
+    rows they show and however deep into the history they are.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        bots, cls.matches = seed_matches(num_bots=6, num_matches=60)
+        # the bot with the most matches, to have more than one page of them
+        cls.bot, other = sorted(bots, key=lambda b: -b.matches.count())[:2]
+        cls.owner = User.objects.select_related("bot").get(pk=cls.bot.pk)
+        cls.viewer = User.objects.select_related("bot").get(pk=other.pk)
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self, view, path, user, **kwargs):
+        request = RequestFactory().get(path)
+        request.user = user
+        response = view.as_view()(request, **kwargs)
+        response.render()
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def assertPagesQueries(self, num, view, path, user, **kwargs):
+        """Checks the page at ``path``, and the next one if it has one."""
+        with self.assertNumQueries(num):
+            response = self.render(view, path, user, **kwargs)
+
+        page = response.context_data.get("page_obj")
+        if page is not None and page.has_next():
+            with self.assertNumQueries(num):
+                self.render(view, f"{path}?after={page.next_cursor()}", user, **kwargs)
+        return page
+
+    def test_bot_detail(self):
+        page = self.assertPagesQueries(
+            4,
+            views.BotDetailView,
+            reverse("tournament:bot_detail", kwargs={"name": self.bot.name}),
+            self.viewer,
+            name=self.bot.name,
+        )
+        self.assertTrue(page.has_next())
+
+    def test_profile(self):
+        self.assertPagesQueries(
+            4, views.BotPrivateDetailView, reverse("tournament:profile"), self.owner
+        )
+
+    def test_match_detail(self):
+        uuid = self.matches[0].uuid
+        self.assertPagesQueries(
+            2,
+            views.MatchDetailView,
+            reverse("tournament:match_detail", kwargs={"uuid": uuid}),
+            self.viewer,
+            uuid=uuid,
+        )
+
+    def test_match_list(self):
+        page = self.assertPagesQueries(
+            2,
+            views.MatchListView,
+            reverse("tournament:recent_matches"),
+            self.viewer,
+        )
+        self.assertTrue(page.has_next())
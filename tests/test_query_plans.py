@@ -0,0 +1,144 @@
+import re
+import unittest
+
+from django.db import connection
+from django.db.models import QuerySet, Sum
+from django.test import TestCase
+
+from tournament.matchmaking import index_queryset
+from tournament.models import (
+    Bot,
+    HeadToHead,
+    LeaderboardEntry,
+    Match,
+    MatchResult,
+    MatchStats,
+    RatingPoint,
+)
+from tournament.pagination import CursorPaginator
+from tournament.runner import seed_candidates
+from tournament.views import MatchListView
+from tournament.views.bot import BotDetailView, bot_match_results
+
+from .seed import seed_matches
+
+# tables that grow with the match history and must never be read in full
+LARGE_TABLES = {
+    model._meta.db_table
+    for model in [Match, MatchResult, MatchStats, RatingPoint, HeadToHead]
+}
+PAGE_SIZE = 20
+
+SQLITE_SCAN = re.compile(r"\bSCAN (\w+)\s*$")
+POSTGRES_SCAN = re.compile(r"\bSeq Scan on (\w+)")
+SQL_ALIAS = re.compile(r'"(\w+)" ([A-Z]\d+)\b')
+SQLITE_SORT = re.compile(r"\bUSE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY\b")
+POSTGRES_SORT = re.compile(r"\bSort Key:")
+
+
+def page_querysets(bot: Bot) -> dict[str, QuerySet]:
+    """The querysets of the first and a later page of the paginated lists,
+    which must be read in the order of an index rather than sorted."""
+    pages = {
+        "bot matches": CursorPaginator(
+            bot_match_results(bot), PAGE_SIZE, BotDetailView.paginate_keys
+        ),
+        "recent matches": CursorPaginator(
+            MatchListView().get_queryset(), PAGE_SIZE, MatchListView.paginate_keys
+        ),
+    }
+    querysets = {}
+    for name, paginator in pages.items():
+        first = paginator.queryset.order_by(*paginator._ordering(False))
+        cursor = paginator.cursor(first[PAGE_SIZE - 1])
+        querysets[name] = first[: PAGE_SIZE + 1]
+        querysets[f"{name}, later page"] = first.filter(
+            paginator._beyond(cursor, False)
+        )[: PAGE_SIZE + 1]
+    return querysets
+
+
+def key_querysets(bot: Bot) -> dict[str, QuerySet]:
+    """The querysets of the leaderboard, bot and match pages and of match
+    making, as they are run for ``bot``."""
+    return {
+        "leaderboard": LeaderboardEntry.objects.select_related("bot__user"),
+        "leaderboard totals": LeaderboardEntry.totals(Bot.objects.filter(pk=bot.pk)),
+        "bot summary": Bot.objects.with_summary().filter(pk=bot.pk),
+        "bot match count": MatchResult.objects.filter(
+            bot=bot, docker_image=bot.docker_image
+        ),
+        "bot stats summary": MatchStats.objects.filter(
+            bot=bot, result__docker_image=bot.docker_image
+        ),
+        **page_querysets(bot),
+        "seed by sigma": seed_candidates(1),
+        "seed by last game and match count": seed_candidates(2),
+        "seed by last game": seed_candidates(3),
+        "matchmaking index": index_queryset(),
+        "rating history": RatingPoint.objects.filter(bot__in=[bot.pk])
+        .order_by("bot", "time")
+        .values_list("bot", "time", "mu", "sigma"),
+        "head to head": HeadToHead.objects.filter(
+            bot=bot, docker_image=bot.docker_image
+        )
+        .values("opponent")
+        .annotate(games=Sum("games"), wins=Sum("wins"))
+        .order_by("-games", "opponent"),
+        "head to head pair": HeadToHead.objects.filter(bot=bot, opponent=bot).order_by(
+            "-games"
+        ),
+    }
+
+
+def sequential_scans(queryset: QuerySet) -> tuple[list[str], str]:
+    """The large tables ``queryset`` reads in full, and its plan."""
+    plan = queryset.explain()
+    sql, _ = queryset.query.sql_with_params()
+    tables = {alias: table for table, alias in SQL_ALIAS.findall(sql)}
+    pattern = POSTGRES_SCAN if connection.vendor == "postgresql" else SQLITE_SCAN
+
+    scanned = []
+    for line in plan.splitlines():
+        match = pattern.search(line)
+        if match is not None:
+            table = tables.get(match.group(1), match.group(1))
+            if table in LARGE_TABLES:
+                scanned.append(table)
+    return scanned, plan
+
+
+def sorts(queryset: QuerySet) -> tuple[bool, str]:
+    """Whether ``queryset`` sorts its rows rather than reading them in the
+    order of an index, and its plan."""
+    plan = queryset.explain()
+    pattern = POSTGRES_SORT if connection.vendor == "postgresql" else SQLITE_SORT
+    return pattern.search(plan) is not None, plan
+
+
+@unittest.skipUnless(
+    connection.vendor in ("sqlite", "postgresql"),
+    "query plans are only checked on SQLite and PostgreSQL",
+)
+class QueryPlanTest(TestCase):
+    """The key querysets never read a large table in full, and pages are
+    read in index order."""
+
+    @classmethod
+    def setUpTestData(cls):
+        bots, _ = seed_matches(num_bots=60, num_matches=3000, with_stats=True)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        cls.bot = next(bot for bot in bots if not bot.user.is_npc)
+
+    def test_no_sequential_scans(self):
+        for name, queryset in key_querysets(self.bot).items():
+            with self.subTest(name):
+                scanned, plan = sequential_scans(queryset)
+                self.assertEqual(scanned, [], f"{name} scans {scanned}:\n{plan}")
+
+    def test_pages_are_not_sorted(self):
+        for name, queryset in page_querysets(self.bot).items():
+            with self.subTest(name):
+                sorted_rows, plan = sorts(queryset)
+                self.assertFalse(sorted_rows, f"{name} sorts its rows:\n{plan}")
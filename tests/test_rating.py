@@ -0,0 +1,94 @@
+import random
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+import numpy as np
+import trueskill
+
+from tournament import rating
+
+
+def random_matches(rng: random.Random, count: int, ties: bool = False) -> list:
+    """Free-for-all matches of 2 to 6 players as ``(rating_groups, ranks)``,
+    with some ranks tied if ``ties``."""
+    matches = []
+    for _ in range(count):
+        num_players = rng.randint(2, 6)
+        rating_groups = [
+            {n: trueskill.Rating(rng.uniform(0, 50), rng.uniform(0.5, trueskill.SIGMA))}
+            for n in range(num_players)
+        ]
+        if ties:
+            ranks = [rng.randrange(num_players) for _ in range(num_players)]
+        else:
+            ranks = rng.sample(range(num_players), num_players)
+        matches.append((rating_groups, ranks))
+    return matches
+
+
+class RatingEngineTest(SimpleTestCase):
+    def assertMatchesReference(self, matches: list, env: trueskill.TrueSkill):
+        for (rating_groups, ranks), ours in zip(
+            matches, rating.rate_many(matches, env=env)
+        ):
+            reference = env.rate(rating_groups, ranks)
+            for our_group, reference_group in zip(ours, reference):
+                for player, ours_rating in our_group.items():
+                    expected = reference_group[player]
+                    self.assertLess(
+                        abs(ours_rating.mu - float(expected.mu)),
+                        settings.RATING_ENGINE_TOLERANCE,
+                    )
+                    self.assertLess(
+                        abs(ours_rating.sigma - float(expected.sigma)),
+                        settings.RATING_ENGINE_TOLERANCE,
+                    )
+
+    def test_matches_agree_with_mpmath(self):
+        matches = random_matches(random.Random(1), 100)
+        self.assertMatchesReference(matches, trueskill.global_env())
+
+    def test_tied_matches_agree_with_mpmath(self):
+        # the tournament's environment has no draws, which mpmath can't rate
+        # tied ranks in
+        env = trueskill.TrueSkill(tau=0.0, draw_probability=0.1, backend="mpmath")
+        matches = random_matches(random.Random(2), 100, ties=True)
+        self.assertTrue(any(len(set(ranks)) < len(ranks) for _, ranks in matches))
+        self.assertMatchesReference(matches, env)
+
+    def test_batches_are_rated_as_one_match_at_a_time(self):
+        rng = random.Random(3)
+        players = range(10)
+        matches = []
+        for _ in range(100):
+            match_players = rng.sample(players, rng.randint(2, 6))
+            matches.append(
+                dict(zip(match_players, rng.sample(range(6), len(match_players))))
+            )
+        initial = {
+            player: trueskill.Rating(rng.uniform(0, 50), rng.uniform(1, 8))
+            for player in players
+        }
+
+        batched = dict(initial)
+        results = rating.rate_batch(batched, matches)
+
+        one_at_a_time = dict(initial)
+        for match, result in zip(matches, results):
+            rated = rating.rate(
+                [{player: one_at_a_time[player]} for player in match],
+                list(match.values()),
+            )
+            for group in rated:
+                one_at_a_time.update(group)
+            self.assertEqual(result, {p: one_at_a_time[p] for p in match})
+        self.assertEqual(batched, one_at_a_time)
+
+    def test_non_finite_ratings_raise(self):
+        for mu in [float("nan"), float("inf")]:
+            with self.subTest(mu), np.errstate(all="ignore"):
+                with self.assertRaises(FloatingPointError):
+                    rating.rate(
+                        [{0: trueskill.Rating(mu, 1.0)}, {1: trueskill.Rating()}]
+                    )
@@ -0,0 +1,205 @@
+import sqlite3
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from django.db import connection
+from django.test import TestCase
+
+from tournament.dataclasses import ExtractedMatch, MatchDataClass, MatchResultDataClass
+from tournament.management.commands.importmatches import recorded_match_ids
+from tournament.models import (
+    Bot,
+    BotActivity,
+    LeaderboardEntry,
+    Match,
+    MatchResult,
+    RatingPoint,
+    User,
+)
+
+START = datetime(2023, 6, 1, tzinfo=timezone.utc)
+STATS = dict(
+    peak_territory=100,
+    peak_territory_frame=50,
+    final_territory=50,
+    peak_strength=1000,
+    production_captured=500,
+    cap_losses=10,
+    first_contact_frame=40,
+    damage_dealt=100,
+    damage_taken=100,
+    environment_damage=50,
+    overkill_damage=20,
+    territory_curve=[],
+    strength_curve=[],
+)
+
+
+def extracted_match(
+    minutes: int, bots: list[Bot], shares: Optional[list[float]] = None
+) -> ExtractedMatch:
+    """
+    A match played ``minutes`` after START, ranked in ``bots`` order, with
+    statistics giving the bots ``shares`` of peak territory if any.
+    """
+    match_id = str(uuid.uuid4())
+    stats = {
+        bot.name: dict(STATS, player=player, peak_territory_share=share)
+        for player, (bot, share) in enumerate(zip(bots, shares or []), start=1)
+    }
+    return ExtractedMatch(
+        match=MatchDataClass(
+            id=match_id,
+            date=(START + timedelta(minutes=minutes)).isoformat(),
+            replay=f"{match_id}.hlt",
+            seed=1,
+            width=30,
+            height=30,
+            match_results=[
+                MatchResultDataClass(
+                    bot_name=bot.name,
+                    docker_image=bot.docker_image,
+                    rank=rank,
+                    last_frame_alive=100,
+                    error_log=None,
+                )
+                for rank, bot in enumerate(bots, start=1)
+            ],
+            workflow_run_id=1,
+        ),
+        replay=f"{match_id}/{match_id}.hltb.gz",
+        replay_variants={},
+        error_logs={},
+        stats=stats,
+    )
+
+
+class RecordMatchesTest(TestCase):
+    """What recording matches keeps up to date besides the results."""
+
+    def setUp(self):
+        self.bots = []
+        for n in range(3):
+            user = User.objects.create(username=f"bot{n}")
+            Bot.objects.filter(user=user).update(docker_image=f"halite/bot{n}:v1")
+            self.bots.append(Bot.objects.select_related("user").get(user=user))
+
+    def activity(self) -> dict:
+        return {
+            (row.bot_id, row.docker_image): (row.match_count, row.last_match_date)
+            for row in BotActivity.objects.all()
+        }
+
+    def test_bot_activity_is_added_to(self):
+        bot0, bot1, bot2 = self.bots
+        Match.record_matches(
+            [extracted_match(10, [bot0, bot1]), extracted_match(5, [bot1, bot2])]
+        )
+        # an older match arriving late doesn't move the last match date back
+        Match.record_matches([extracted_match(1, [bot0, bot1])])
+
+        self.assertEqual(
+            self.activity(),
+            {
+                (bot0.pk, "halite/bot0:v1"): (2, START + timedelta(minutes=10)),
+                (bot1.pk, "halite/bot1:v1"): (3, START + timedelta(minutes=10)),
+                (bot2.pk, "halite/bot2:v1"): (1, START + timedelta(minutes=5)),
+            },
+        )
+
+        recorded = self.activity()
+        BotActivity.refresh()
+        self.assertEqual(self.activity(), recorded)
+
+    def test_bot_activity_is_kept_per_image(self):
+        bot0, bot1, _ = self.bots
+        Match.record_matches([extracted_match(1, [bot0, bot1])])
+        Bot.objects.filter(pk=bot0.pk).update(docker_image="halite/bot0:v2")
+        bot0.refresh_from_db()
+        Match.record_matches([extracted_match(2, [bot0, bot1])])
+
+        activity = self.activity()
+        self.assertEqual(activity[(bot0.pk, "halite/bot0:v1")][0], 1)
+        self.assertEqual(activity[(bot0.pk, "halite/bot0:v2")][0], 1)
+        self.assertEqual(activity[(bot1.pk, "halite/bot1:v1")][0], 2)
+
+    def leaderboard(self) -> dict:
+        return {
+            entry.bot_id: (
+                entry.rank,
+                entry.mu,
+                entry.match_count,
+                entry.stats_count,
+                entry.peak_territory_share,
+            )
+            for entry in LeaderboardEntry.objects.all()
+        }
+
+    def test_leaderboard_entries_are_added_to(self):
+        bot0, bot1, bot2 = self.bots
+        LeaderboardEntry.refresh()
+        Match.record_matches(
+            [
+                extracted_match(1, [bot0, bot1], shares=[0.5, 0.25]),
+                extracted_match(2, [bot1, bot2]),
+            ]
+        )
+        Match.record_matches([extracted_match(3, [bot2, bot0], shares=[0.125, 0.25])])
+
+        leaderboard = self.leaderboard()
+        self.assertEqual(leaderboard[bot0.pk][2:], (2, 2, 0.375))
+        self.assertEqual(leaderboard[bot1.pk][2:], (2, 1, 0.25))
+        self.assertEqual(leaderboard[bot2.pk][2:], (2, 1, 0.125))
+
+        LeaderboardEntry.refresh()
+        self.assertEqual(self.leaderboard(), leaderboard)
+
+    def test_missing_leaderboard_entries_are_recounted(self):
+        bot0, bot1, _ = self.bots
+        Match.record_matches([extracted_match(1, [bot0, bot1], shares=[0.5, 0.25])])
+
+        leaderboard = self.leaderboard()
+        self.assertEqual(leaderboard.keys(), {bot0.pk, bot1.pk})
+        self.assertEqual(leaderboard[bot0.pk][2:], (1, 1, 0.5))
+        self.assertEqual(leaderboard[bot1.pk][2:], (1, 1, 0.25))
+
+    def test_older_matches_keep_newer_rating_points(self):
+        bot0, bot1, _ = self.bots
+        Match.record_matches([extracted_match(30, [bot0, bot1])])
+        # recorded late, but played before the match above in the same hour
+        Match.record_matches([extracted_match(10, [bot0, bot1])])
+
+        newest = MatchResult.objects.get(
+            bot=bot0, match__date=START + timedelta(minutes=30)
+        )
+        point = RatingPoint.objects.get(bot=bot0)
+        self.assertEqual(point.date, START + timedelta(minutes=30))
+        self.assertEqual((point.mu, point.sigma), (newest.mu, newest.sigma))
+
+        Match.record_matches([extracted_match(40, [bot0, bot1])])
+        newest = MatchResult.objects.get(
+            bot=bot0, match__date=START + timedelta(minutes=40)
+        )
+        point = RatingPoint.objects.get(bot=bot0)
+        self.assertEqual(point.date, START + timedelta(minutes=40))
+        self.assertEqual((point.mu, point.sigma), (newest.mu, newest.sigma))
+
+    def test_recorded_matches_are_looked_up_in_chunks(self):
+        bot0, bot1, _ = self.bots
+        extracted = extracted_match(10, [bot0, bot1])
+        Match.record_matches([extracted])
+        Match.objects.create(uuid=uuid.uuid4())
+        if connection.vendor == "sqlite":
+            # builds differ in the limit, so use the historical default
+            connection.ensure_connection()
+            sqlite = connection.connection
+            limit = sqlite.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+            sqlite.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+            self.addCleanup(
+                sqlite.setlimit, sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, limit
+            )
+
+        match_ids = [str(uuid.uuid4()) for _ in range(2000)]
+        match_ids += [extracted.match.id, *Match.objects.values_list("uuid", flat=True)]
+        self.assertEqual(recorded_match_ids(match_ids), {extracted.match.id})
@@ -0,0 +1,141 @@
+import io
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from docker_image.reference import Reference
+
+from tournament import registry
+from tournament.exceptions import ImageNotFoundError
+from tournament.forms import BotForm
+from tournament.models import Bot, User
+
+IMAGE = "ghcr.io/someone/bot"
+OLD = "sha256:" + "1" * 64
+NEW = "sha256:" + "2" * 64
+
+
+@override_settings(DOCKER_DIGEST_CACHE_TIMEOUT=600, DOCKER_DIGEST_MISSING_TIMEOUT=60)
+class ResolveDigestTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.fetch = self.enterContext(
+            mock.patch.object(registry, "fetch_digest", return_value=OLD)
+        )
+        self.reference = Reference.parse_normalized_named(f"{IMAGE}:latest")
+
+    def test_digests_are_cached(self):
+        self.assertEqual(registry.resolve_digest(self.reference), OLD)
+        self.fetch.return_value = NEW
+        self.assertEqual(registry.resolve_digest(self.reference), OLD)
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_cached_digests_expire(self):
+        now = time.time()
+        with mock.patch("time.time", return_value=now):
+            registry.resolve_digest(self.reference)
+        self.fetch.return_value = NEW
+        with mock.patch("time.time", return_value=now + 599):
+            self.assertEqual(registry.resolve_digest(self.reference), OLD)
+        with mock.patch("time.time", return_value=now + 601):
+            self.assertEqual(registry.resolve_digest(self.reference), NEW)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_refreshing_replaces_the_cached_digest(self):
+        registry.resolve_digest(self.reference)
+        self.fetch.return_value = NEW
+        self.assertEqual(registry.resolve_digest(self.reference, refresh=True), NEW)
+        self.assertEqual(registry.resolve_digest(self.reference), NEW)
+        self.assertEqual(self.fetch.call_count, 2)
+
+    def test_missing_tags_are_cached(self):
+        self.fetch.side_effect = ImageNotFoundError("Image not found.")
+        for _ in range(2):
+            with self.assertRaises(ImageNotFoundError):
+                registry.resolve_digest(self.reference)
+        self.assertEqual(self.fetch.call_count, 1)
+
+
+class BotDigestTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.fetch = self.enterContext(
+            mock.patch.object(registry, "fetch_digest", return_value=OLD)
+        )
+        user = User.objects.create(username="bot0")
+        self.bot = Bot.objects.get(user=user)
+
+    def save(self, docker_image: str, refresh_digest: bool = False) -> Bot:
+        form = BotForm(
+            {"docker_image": docker_image, "refresh_digest": refresh_digest},
+            instance=Bot.objects.get(pk=self.bot.pk),
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.save()
+
+    def test_saving_the_same_tag_again_uses_the_cache(self):
+        self.assertEqual(
+            self.save(f"{IMAGE}:latest").docker_image, f"{IMAGE}:latest@{OLD}"
+        )
+        self.fetch.return_value = NEW
+        self.assertEqual(
+            self.save(f"{IMAGE}:latest").docker_image, f"{IMAGE}:latest@{OLD}"
+        )
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_asking_to_refresh_looks_the_tag_up_again(self):
+        self.save(f"{IMAGE}:latest")
+        self.fetch.return_value = NEW
+        bot = self.save(f"{IMAGE}:latest", refresh_digest=True)
+        self.assertEqual(bot.docker_image, f"{IMAGE}:latest@{NEW}")
+
+    def test_pinned_digests_are_not_looked_up(self):
+        bot = self.save(f"{IMAGE}@{NEW}")
+        self.assertEqual(bot.docker_image, f"{IMAGE}@{NEW}")
+        self.fetch.assert_not_called()
+
+
+class RefreshDigestsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.fetch = self.enterContext(
+            mock.patch.object(registry, "fetch_digest", return_value=NEW)
+        )
+        for n, image in enumerate(
+            [f"{IMAGE}:latest@{OLD}", f"{IMAGE}:latest@{NEW}", f"{IMAGE}@{OLD}"]
+        ):
+            user = User.objects.create(username=f"bot{n}")
+            Bot.objects.filter(user=user).update(docker_image=image)
+
+    def refresh(self, *args) -> str:
+        stdout = io.StringIO()
+        call_command("refreshdigests", *args, stdout=stdout, stderr=io.StringIO())
+        return stdout.getvalue()
+
+    def test_moved_tags_are_reported(self):
+        output = self.refresh()
+
+        self.assertIn(f"bot0: latest moved to {NEW}", output)
+        self.assertNotIn("bot1", output)
+        self.assertIn("1 bots' tags moved.", output)
+        # every tag is looked up once, bypassing the cache, and cached again
+        self.assertEqual(self.fetch.call_count, 1)
+        reference = Reference.parse_normalized_named(f"{IMAGE}:latest")
+        self.assertEqual(cache.get(registry.cache_key(reference)), NEW)
+        self.assertEqual(
+            Bot.objects.get(user__username="bot0").docker_image, f"{IMAGE}:latest@{OLD}"
+        )
+
+    def test_moved_tags_are_pinned_with_update(self):
+        output = self.refresh("--update")
+
+        self.assertIn("Pinned 1 bots", output)
+        images = dict(Bot.objects.values_list("user__username", "docker_image"))
+        self.assertEqual(images["bot0"], f"{IMAGE}:latest@{NEW}")
+        self.assertEqual(images["bot2"], f"{IMAGE}@{OLD}")
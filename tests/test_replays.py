@@ -0,0 +1,45 @@
+import gzip
+import io
+
+from django.test import SimpleTestCase
+
+import brotli
+import numpy as np
+
+from tournament import replays
+from tournament.management.commands.benchmarkreplays import default_replays
+
+from .test_extract import write_replay
+
+
+class BinaryReplayTest(SimpleTestCase):
+    def test_bundled_replays_are_an_order_of_magnitude_smaller(self):
+        stored = served = 0
+        for path in default_replays():
+            with gzip.open(path) as f:
+                data = f.read()
+            binary = replays.from_json(data)
+            header, arrays = replays.read_arrays(binary)
+            # the game's rules predict every frame
+            self.assertEqual(len(arrays["delta_cells"]), 0)
+            self.assertEqual(replays.to_json(binary), data)
+
+            stored += len(gzip.compress(data, 9))
+            served += len(brotli.compress(binary, quality=9))
+        self.assertGreater(stored / served, 10)
+
+    def test_frames_the_rules_dont_predict_round_trip(self):
+        source = io.BytesIO()
+        write_replay(source, 12, size=7, num_players=3)
+        data = source.getvalue()
+
+        binary = replays.from_json(data)
+        self.assertEqual(replays.to_json(binary), data)
+
+        replay = replays.ReplayArrays.parse(binary)
+        expected = replays.ReplayArrays.parse(data)
+        np.testing.assert_array_equal(replay.frames, expected.frames)
+        np.testing.assert_array_equal(replay.moves, expected.moves)
+        turns = list(replay.iter_turns(5))
+        self.assertEqual([len(moves) for _, moves in turns], [5, 5, 1])
+        np.testing.assert_array_equal(replay.frame_range(3, 9), expected.frames[3:9])
@@ -0,0 +1,137 @@
+import io
+from datetime import timedelta
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from tournament.management.commands.rerate import Command
+from tournament.models import (
+    Bot,
+    Match,
+    MatchResult,
+    RatingCheckpoint,
+    RatingPoint,
+    User,
+)
+
+from .test_record_matches import START, extracted_match
+
+
+class RerateTest(TestCase):
+    def setUp(self):
+        self.bots = []
+        for n in range(4):
+            user = User.objects.create(username=f"bot{n}")
+            Bot.objects.filter(user=user).update(docker_image=f"halite/bot{n}:v1")
+            self.bots.append(Bot.objects.select_related("user").get(user=user))
+
+    def record(self, first: int, count: int):
+        """Records ``count`` matches a minute apart, one at a time, as the
+        worker does."""
+        for minutes in range(first, first + count):
+            players = [self.bots[(minutes + n) % 4] for n in range(2 + minutes % 3)]
+            Match.record_matches([extracted_match(minutes, players)])
+
+    def ratings(self) -> dict:
+        return {
+            kind: {pk: (mu, sigma) for pk, mu, sigma in rows}
+            for kind, rows in [
+                ("bots", Bot._base_manager.values_list("pk", "mu", "sigma")),
+                ("results", MatchResult.objects.values_list("pk", "mu", "sigma")),
+            ]
+        }
+
+    def assertRatingsEqual(self, actual: dict, expected: dict):
+        for kind in ["bots", "results"]:
+            self.assertEqual(actual[kind].keys(), expected[kind].keys())
+            for pk, values in expected[kind].items():
+                for a, b in zip(actual[kind][pk], values):
+                    self.assertAlmostEqual(a, b, places=9)
+
+    def rerate(self, *args) -> str:
+        stdout = io.StringIO()
+        call_command("rerate", *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_rerating_reproduces_the_recorded_ratings(self):
+        self.record(0, 12)
+        expected = self.ratings()
+        Bot._base_manager.update(mu=0.0, sigma=1.0)
+        MatchResult.objects.update(mu=0.0, sigma=1.0)
+
+        output = self.rerate("--batch-size", "5")
+
+        self.assertIn("Replayed 12 matches", output)
+        self.assertRatingsEqual(self.ratings(), expected)
+        checkpoint = RatingCheckpoint.objects.get()
+        self.assertEqual(checkpoint.match_count, 12)
+        self.assertEqual(checkpoint.date, START + timedelta(minutes=11))
+
+    def test_resuming_replays_the_matches_after_the_checkpoint(self):
+        self.record(0, 6)
+        self.rerate("--checkpoint-every", "2", "--batch-size", "2")
+        self.assertEqual(
+            sorted(RatingCheckpoint.objects.values_list("match_count", flat=True)),
+            [2, 4, 6],
+        )
+        self.record(6, 6)
+        expected = self.ratings()
+        MatchResult.objects.filter(
+            match__date__gte=START + timedelta(minutes=6)
+        ).update(mu=0.0, sigma=1.0)
+
+        output = self.rerate("--resume")
+
+        self.assertIn("Starting from checkpoint", output)
+        self.assertIn("Replayed 6 matches", output)
+        self.assertRatingsEqual(self.ratings(), expected)
+        self.assertEqual(
+            sorted(RatingCheckpoint.objects.values_list("match_count", flat=True)),
+            [2, 4, 6, 12],
+        )
+
+    def test_restarting_from_a_checkpoint_of_other_parameters_is_refused(self):
+        self.record(0, 4)
+        self.rerate()
+        checkpoint = RatingCheckpoint.objects.get()
+        checkpoint.parameters = dict(checkpoint.parameters, beta=1.0)
+        checkpoint.save()
+
+        since = (START + timedelta(hours=1)).isoformat()
+        with self.assertRaises(CommandError):
+            self.rerate("--since", since)
+        self.assertTrue(RatingCheckpoint.objects.filter(pk=checkpoint.pk).exists())
+
+    def test_failed_rerates_keep_the_checkpoints(self):
+        self.record(0, 6)
+        self.rerate("--checkpoint-every", "2", "--batch-size", "2")
+        checkpoints = set(RatingCheckpoint.objects.values_list("pk", flat=True))
+
+        with mock.patch.object(RatingPoint, "rebuild", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.rerate("--checkpoint-every", "2", "--batch-size", "2")
+        # the checkpoints taken before the failure are still valid, too
+        self.assertLessEqual(
+            checkpoints, set(RatingCheckpoint.objects.values_list("pk", flat=True))
+        )
+
+    def test_matches_recorded_during_the_replay_are_caught_up_on(self):
+        self.record(0, 6)
+        history = Command.history
+        recorded = {}
+
+        def history_then_record(command, position, chunk_size):
+            yield from history(command, position, chunk_size)
+            if not recorded:
+                # a match arriving after the replay read the history
+                self.record(6, 1)
+                recorded.update(self.ratings())
+
+        with mock.patch.object(Command, "history", history_then_record):
+            output = self.rerate()
+
+        self.assertIn("Replayed 7 matches", output)
+        self.assertRatingsEqual(self.ratings(), recorded)
+        self.assertEqual(RatingCheckpoint.objects.get().match_count, 7)
@@ -0,0 +1,49 @@
+from unittest import mock
+
+from django.db import OperationalError
+from django.test import TestCase
+
+import requests
+
+from tournament.models import Bot, Match, User
+from tournament.runner import RunnerBackend
+from tournament.scheduler import MatchScheduler, SeedPool
+
+
+class UnreachableBackend(RunnerBackend):
+    name = "unreachable"
+
+    def queued(self) -> int:
+        return 0
+
+    def dispatch(self, inputs: list[dict]) -> list[bool]:
+        raise requests.ConnectionError("connection refused")
+
+
+class MatchSchedulerTest(TestCase):
+    def setUp(self):
+        self.bots = []
+        for n in range(2):
+            user = User.objects.create(username=f"bot{n}")
+            Bot.objects.filter(user=user).update(docker_image=f"halite/bot{n}:latest")
+            self.bots.append(Bot.objects.select_related("user").get(user=user))
+        self.scheduler = MatchScheduler(
+            SeedPool(ttl=60), concurrency=2, backend=UnreachableBackend()
+        )
+
+    def test_failed_dispatch_is_logged_and_cleaned_up(self):
+        with mock.patch.object(
+            self.scheduler, "pick_groups", return_value=[self.bots]
+        ), self.assertLogs("tournament.scheduler", "ERROR"):
+            started = self.scheduler.tick()
+
+        self.assertEqual(started, [])
+        self.assertFalse(Match.objects.exists())
+
+    def test_database_errors_are_logged(self):
+        with mock.patch.object(
+            self.scheduler.pool,
+            "refresh",
+            side_effect=OperationalError("database gone"),
+        ), self.assertLogs("tournament.scheduler", "ERROR"):
+            self.assertEqual(self.scheduler.tick(), [])
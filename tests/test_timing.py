@@ -0,0 +1,107 @@
+import io
+import json
+import tempfile
+
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from tournament.models import User
+from tournament.timing import SLOW_REQUEST, RequestTimingMiddleware
+
+
+def view(request):
+    # the same statement twice, and another once
+    User.objects.count()
+    User.objects.count()
+    User.objects.exists()
+    return HttpResponse("ok")
+
+
+class RequestTimingMiddlewareTest(TestCase):
+    def get(self):
+        return RequestTimingMiddleware(view)(RequestFactory().get("/some/path/"))
+
+    def test_server_timing_header(self):
+        response = self.get()
+        parts = {
+            part.split(";")[0]: part for part in response["Server-Timing"].split(", ")
+        }
+        self.assertEqual(list(parts), ["db", "template", "storage", "total"])
+        self.assertIn('desc="3 queries"', parts["db"])
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=1e6)
+    def test_fast_requests_are_not_logged(self):
+        with self.assertNoLogs("tournament.timing"):
+            self.get()
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=0, SLOW_REQUEST_STATEMENTS=5)
+    def test_slow_requests_are_logged_with_their_duplicates(self):
+        with self.assertLogs("tournament.timing", "WARNING") as logs:
+            self.get()
+
+        (message,) = [record.getMessage() for record in logs.records]
+        self.assertTrue(message.startswith(f"{SLOW_REQUEST} {{"))
+        record = json.loads(message[len(SLOW_REQUEST) + 1 :])
+        self.assertEqual(record["method"], "GET")
+        self.assertEqual(record["path"], "/some/path/")
+        self.assertEqual(record["status"], 200)
+        self.assertEqual(record["queries"], 3)
+        (duplicate,) = record["duplicates"]
+        self.assertEqual(duplicate["count"], 2)
+        self.assertIn("COUNT(", duplicate["sql"])
+
+
+def slow_request(view, ms, queries=1, duplicates=()):
+    record = dict(
+        view=view,
+        method="GET",
+        path="/",
+        status=200,
+        ms=ms,
+        queries=queries,
+        db_ms=1.0,
+        template_ms=2.0,
+        storage_ms=0.0,
+        duplicates=[dict(sql=sql, count=count, ms=1.0) for sql, count in duplicates],
+    )
+    return f"WARNING 2024-01-01 tournament.timing {SLOW_REQUEST} {json.dumps(record)}"
+
+
+class ReportSlowRequestsTest(SimpleTestCase):
+    def report(self, lines: list[str], *args) -> list[str]:
+        with tempfile.NamedTemporaryFile("w", suffix=".log") as log:
+            log.write("\n".join(lines) + "\n")
+            log.flush()
+            stdout = io.StringIO()
+            call_command("reportslowrequests", log.name, *args, stdout=stdout)
+        return stdout.getvalue().splitlines()
+
+    def test_percentiles_and_statements_per_view(self):
+        lines = [slow_request("fast", ms) for ms in [10, 20, 30]]
+        lines += [
+            slow_request("slow", ms, queries=ms, duplicates=[("SELECT a", 2)])
+            for ms in range(1, 101)
+        ]
+        lines += [
+            slow_request(None, 5, duplicates=[("SELECT b", 3), ("SELECT c", 1)]),
+            "INFO an unrelated line",
+            f"WARNING {SLOW_REQUEST} {{not json",
+        ]
+
+        header, slow, statement, fast, unresolved, *rest = self.report(
+            lines, "--percentiles", "50", "90", "--statements", "1"
+        )
+        self.assertEqual(header.split()[:4], ["view", "count", "p50", "p90"])
+        # slowest first, by the highest percentile
+        self.assertEqual(slow.split()[:5], ["slow", "100", "50.0", "90.0", "50"])
+        self.assertEqual(statement.split(), ["200x", "SELECT", "a"])
+        self.assertEqual(fast.split()[:4], ["fast", "3", "20.0", "30.0"])
+        self.assertEqual(unresolved.split()[:2], ["(unresolved)", "1"])
+        # only the most repeated statement
+        self.assertEqual(rest[0].split(), ["3x", "SELECT", "b"])
+        self.assertTrue(rest[1].startswith("Durations are in ms"))
+
+    def test_no_slow_requests(self):
+        with self.assertRaisesMessage(CommandError, "No slow requests found."):
+            self.report(["INFO an unrelated line"])